@@ -0,0 +1,414 @@
+import asyncio
+import socket
+import struct
+import time
+
+from models import Server
+
+# A2S (Steam server query) engine that multiplexes every query over one UDP socket.
+# Replies are matched back to their query by source address, so only one query
+# per address is in flight at a time.
+# https://developer.valvesoftware.com/wiki/Server_queries
+
+HEADER_SIMPLE = b"\xff\xff\xff\xff"
+HEADER_SPLIT = b"\xfe\xff\xff\xff"
+A2S_INFO_REQUEST = b"\x54Source Engine Query\x00"
+A2S_INFO_RESPONSE = 0x49
+A2S_PLAYER_REQUEST = b"\x55"
+A2S_PLAYER_RESPONSE = 0x44
+A2S_RULES_REQUEST = b"\x56"
+A2S_RULES_RESPONSE = 0x45
+# Challenge number sent to ask the server for a fresh challenge
+NO_CHALLENGE = b"\xff\xff\xff\xff"
+S2C_CHALLENGE = 0x41
+SPLIT_COMPRESSED_FLAG = 0x80000000
+MAX_CHALLENGE_RETRIES = 5
+DEFAULT_TIMEOUT = 3.0
+# Number of times a request is sent before giving up (datagrams can be dropped)
+DEFAULT_ATTEMPTS = 3
+# How long a challenge number is reused before asking the server for a new one
+CHALLENGE_TTL = 60.0
+# Large receive buffer so a burst of replies from hundreds of servers is not dropped
+RECEIVE_BUFFER_SIZE = 1 << 20
+# Server fields written by an A2S_INFO response
+INFO_FIELDS = (
+    "name", "name_short", "players", "max_players", "slots", "bots", "humans", "map"
+)
+
+# Split packet header after HEADER_SPLIT: id, total, number, size
+SPLIT_HEADER = struct.Struct("<lBBh")
+# A2S_INFO fields after the four strings: app id, players, max players, bots
+INFO_COUNTS = struct.Struct("<hBBB")
+# A2S_PLAYER fields after the name: score, duration
+PLAYER_STATS = struct.Struct("<lf")
+RULE_COUNT = struct.Struct("<h")
+
+type Address = tuple[str, int]
+
+
+class A2SError(Exception):
+    pass
+
+
+def read_cstring(view: memoryview, offset: int) -> tuple[str, int]:
+    """
+    Read a null terminated string starting at offset.
+    Returns the string and the offset just after the terminator.
+    """
+    end = offset
+    length = len(view)
+    while end < length and view[end] != 0:
+        end += 1
+    if end >= length:
+        raise A2SError("Unterminated string in A2S response")
+    return str(view[offset:end], "utf-8", "replace"), end + 1
+
+
+def skip_cstring(view: memoryview, offset: int) -> int:
+    length = len(view)
+    while offset < length and view[offset] != 0:
+        offset += 1
+    if offset >= length:
+        raise A2SError("Unterminated string in A2S response")
+    return offset + 1
+
+
+def parse_info_into(payload: memoryview, server: Server):
+    """
+    Parse an A2S_INFO response (starting at the 0x49 type byte)
+    straight into the dynamic fields of a server.
+    The name is only read for servers that don't have one yet (from the master server).
+    """
+    # Type byte, protocol version byte, then name, map, folder, game
+    if server.get("name"):
+        offset = skip_cstring(payload, 2)
+    else:
+        name, offset = read_cstring(payload, 2)
+        server["name"] = name
+        server["name_short"] = name
+    map_name, offset = read_cstring(payload, offset)
+    offset = skip_cstring(payload, offset)
+    offset = skip_cstring(payload, offset)
+    if offset + INFO_COUNTS.size > len(payload):
+        raise A2SError("Truncated A2S_INFO response")
+    _, players, max_players, bots = INFO_COUNTS.unpack_from(payload, offset)
+    server["players"] = players
+    server["max_players"] = max_players
+    server["slots"] = max_players - players
+    server["bots"] = bots
+    server["humans"] = max(players - bots, 0)
+    server["map"] = map_name
+
+
+def parse_player_names(payload: memoryview) -> list[str]:
+    """
+    Parse the player names out of an A2S_PLAYER response (starting at the 0x44 type byte).
+    """
+    if len(payload) < 2:
+        raise A2SError("Truncated A2S_PLAYER response")
+    names: list[str] = []
+    offset = 2
+    for _ in range(payload[1]):
+        # Index byte, then name, score and duration
+        name, offset = read_cstring(payload, offset + 1)
+        offset += PLAYER_STATS.size
+        if offset > len(payload):
+            # Servers with many players sometimes truncate the list
+            break
+        names.append(name)
+    return names
+
+
+def parse_rules(payload: memoryview) -> dict[str, str]:
+    """
+    Parse an A2S_RULES response (starting at the 0x45 type byte).
+    """
+    if len(payload) < 1 + RULE_COUNT.size:
+        raise A2SError("Truncated A2S_RULES response")
+    (count,) = RULE_COUNT.unpack_from(payload, 1)
+    rules: dict[str, str] = {}
+    offset = 1 + RULE_COUNT.size
+    for _ in range(count):
+        name, offset = read_cstring(payload, offset)
+        value, offset = read_cstring(payload, offset)
+        rules[name] = value
+    return rules
+
+
+class ChallengeCache:
+    """
+    Challenge numbers per server address, reused until they expire or are rejected.
+    Sending a cached challenge turns a two round trip A2S_PLAYER / A2S_RULES query
+    into a single round trip.
+    """
+
+    def __init__(self, ttl: float = CHALLENGE_TTL):
+        self.ttl: float = ttl
+        self.challenges: dict[Address, tuple[bytes, float]] = {}
+        # Counters since the last reset_counters (one refresh)
+        self.hits: int = 0
+        self.misses: int = 0
+        self.rejections: int = 0
+        self.round_trips_saved: int = 0
+
+    def get(self, address: Address) -> bytes | None:
+        entry = self.challenges.get(address)
+        if entry is None:
+            self.misses += 1
+            return None
+        challenge, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self.challenges[address]
+            self.misses += 1
+            return None
+        self.hits += 1
+        return challenge
+
+    def store(self, address: Address, challenge: bytes):
+        self.challenges[address] = (challenge, time.monotonic())
+
+    def invalidate(self, address: Address):
+        self.rejections += 1
+        _ = self.challenges.pop(address, None)
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+        self.rejections = 0
+        self.round_trips_saved = 0
+
+    def counters_to_string(self) -> str:
+        return (
+            f"challenge cache: {self.round_trips_saved} round trips saved, "
+            + f"{self.hits} hits, {self.misses} misses, {self.rejections} rejected"
+        )
+
+
+# Shared between refreshes so challenges survive from one auto_join iteration to the next
+CHALLENGE_CACHE = ChallengeCache()
+
+
+class PendingQuery:
+    def __init__(
+        self, request: bytes, response_type: int | None, cached_challenge: bool
+    ):
+        self.request: bytes = request
+        # None accepts any response, including S2C_CHALLENGE
+        self.response_type: int | None = response_type
+        # The request was sent with a challenge number from the challenge cache
+        self.cached_challenge: bool = cached_challenge
+        self.future: asyncio.Future[tuple[memoryview, float]] = (
+            asyncio.get_running_loop().create_future()
+        )
+        self.sent_at: float = 0.0
+        self.first_rtt: float | None = None
+        self.challenge_retries: int = 0
+        self.fragments: dict[int, bytes] = {}
+
+
+class A2SEngine(asyncio.DatagramProtocol):
+    """
+    Sends A2S requests to any number of servers from one non-blocking UDP socket.
+    """
+
+    def __init__(self, challenge_cache: ChallengeCache | None = None):
+        self.challenge_cache: ChallengeCache = (
+            CHALLENGE_CACHE if challenge_cache is None else challenge_cache
+        )
+        self.transport: asyncio.DatagramTransport | None = None
+        self.pending: dict[Address, PendingQuery] = {}
+        self.address_locks: dict[Address, asyncio.Lock] = {}
+        self.packets_sent: int = 0
+        self.packets_received: int = 0
+
+    @classmethod
+    async def create(cls, challenge_cache: ChallengeCache | None = None) -> "A2SEngine":
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+        except OSError:
+            pass
+        sock.bind(("0.0.0.0", 0))
+        sock.setblocking(False)
+        _, engine = await loop.create_datagram_endpoint(
+            lambda: cls(challenge_cache), sock=sock
+        )
+        return engine
+
+    def connection_made(self, transport: asyncio.BaseTransport):
+        assert isinstance(transport, asyncio.DatagramTransport)
+        self.transport = transport
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    async def __aenter__(self) -> "A2SEngine":
+        return self
+
+    async def __aexit__(self, *_):
+        self.close()
+
+    def send(self, address: Address, payload: bytes):
+        if self.transport is None:
+            raise A2SError("A2S engine is closed")
+        self.transport.sendto(HEADER_SIMPLE + payload, address)
+        self.packets_sent += 1
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]):
+        self.packets_received += 1
+        address: Address = (addr[0], addr[1])
+        query = self.pending.get(address)
+        if query is None or query.future.done():
+            return
+        try:
+            self.handle_packet(address, query, memoryview(data))
+        except Exception as e:
+            query.future.set_exception(e)
+
+    def error_received(self, exc: Exception):
+        # ICMP errors on an unconnected socket can't be tied to a query reliably,
+        # the affected query will time out instead.
+        pass
+
+    def handle_packet(self, address: Address, query: PendingQuery, view: memoryview):
+        header = view[:4]
+        if header == HEADER_SIMPLE:
+            self.handle_message(address, query, view[4:])
+        elif header == HEADER_SPLIT:
+            if len(view) < 4 + SPLIT_HEADER.size:
+                raise A2SError("Truncated split packet")
+            message_id, total, number, _ = SPLIT_HEADER.unpack_from(view, 4)
+            if message_id & SPLIT_COMPRESSED_FLAG:
+                raise A2SError("Compressed split packets are not supported")
+            if number >= total:
+                # Could never be joined, and would count towards the total
+                return
+            query.fragments[number] = bytes(view[4 + SPLIT_HEADER.size:])
+            if len(query.fragments) < total:
+                return
+            message = memoryview(
+                b"".join(query.fragments[i] for i in range(total)))
+            query.fragments = {}
+            if message[:4] == HEADER_SIMPLE:
+                message = message[4:]
+            self.handle_message(address, query, message)
+        else:
+            raise A2SError(f"Invalid packet header: {bytes(header)!r}")
+
+    def handle_message(self, address: Address, query: PendingQuery, message: memoryview):
+        if len(message) == 0:
+            raise A2SError("Empty A2S response")
+        now = time.monotonic()
+        if query.first_rtt is None:
+            query.first_rtt = now - query.sent_at
+        response_type = message[0]
+        if query.response_type is None:
+            query.future.set_result((message, query.first_rtt))
+            return
+        if response_type == S2C_CHALLENGE:
+            if query.challenge_retries >= MAX_CHALLENGE_RETRIES:
+                raise A2SError("Server keeps sending challenge responses")
+            query.challenge_retries += 1
+            challenge = bytes(message[1:5])
+            if query.cached_challenge:
+                # The cached challenge has expired on the server's side
+                self.challenge_cache.invalidate(address)
+                query.cached_challenge = False
+            if query.request != A2S_INFO_REQUEST:
+                self.challenge_cache.store(address, challenge)
+            self.send(address, query.request + challenge)
+            return
+        if response_type != query.response_type:
+            raise A2SError(f"Invalid response type: {hex(response_type)}")
+        if query.cached_challenge:
+            self.challenge_cache.round_trips_saved += 1
+        query.future.set_result((message, query.first_rtt))
+
+    async def request(
+        self,
+        address: Address,
+        request: bytes,
+        response_type: int | None,
+        timeout: float = DEFAULT_TIMEOUT,
+        attempts: int = DEFAULT_ATTEMPTS,
+        challenge: bytes = b"",
+    ) -> tuple[memoryview, float]:
+        """
+        Send a request and wait for its response, answering challenges on the way.
+        The request is sent as `request + challenge`, and re-sent with the
+        server's challenge number if the server answers with S2C_CHALLENGE.
+        A challenge of NO_CHALLENGE is replaced by a cached challenge when there is one.
+        A response_type of None returns the first response of any type.
+        The timeout is split evenly between `attempts` sends of the request.
+        Returns the response (starting at the type byte) and the round trip time in seconds.
+        """
+        lock = self.address_locks.setdefault(address, asyncio.Lock())
+        async with lock:
+            cached_challenge = False
+            if challenge == NO_CHALLENGE:
+                cached = self.challenge_cache.get(address)
+                if cached is not None:
+                    challenge = cached
+                    cached_challenge = True
+            query = PendingQuery(request, response_type, cached_challenge)
+            self.pending[address] = query
+            try:
+                for attempt in range(attempts):
+                    query.sent_at = time.monotonic()
+                    query.first_rtt = None
+                    query.fragments = {}
+                    self.send(address, request + challenge)
+                    try:
+                        return await asyncio.wait_for(
+                            asyncio.shield(query.future), timeout / attempts
+                        )
+                    except TimeoutError:
+                        if attempt == attempts - 1:
+                            raise
+                raise TimeoutError
+            finally:
+                del self.pending[address]
+                if not query.future.done():
+                    query.future.cancel()
+
+    async def query_info_into(
+        self, server: Server, timeout: float = DEFAULT_TIMEOUT
+    ) -> float:
+        """
+        Query A2S_INFO for a server and write the result into its fields.
+        Returns the round trip time in seconds.
+        """
+        address = (server["ip"], server["port"])
+        message, rtt = await self.request(
+            address, A2S_INFO_REQUEST, A2S_INFO_RESPONSE, timeout
+        )
+        parse_info_into(message, server)
+        server["ping"] = rtt * 1000
+        return rtt
+
+    async def query_player_names(
+        self, server: Server, timeout: float = DEFAULT_TIMEOUT
+    ) -> list[str]:
+        """
+        Query A2S_PLAYER for a server and return the names of its players.
+        """
+        address = (server["ip"], server["port"])
+        message, _ = await self.request(
+            address, A2S_PLAYER_REQUEST, A2S_PLAYER_RESPONSE, timeout, challenge=NO_CHALLENGE
+        )
+        return parse_player_names(message)
+
+    async def query_rules(
+        self, server: Server, timeout: float = DEFAULT_TIMEOUT
+    ) -> dict[str, str]:
+        """
+        Query A2S_RULES for a server and return its console variables.
+        """
+        address = (server["ip"], server["port"])
+        message, _ = await self.request(
+            address, A2S_RULES_REQUEST, A2S_RULES_RESPONSE, timeout, challenge=NO_CHALLENGE
+        )
+        return parse_rules(message)
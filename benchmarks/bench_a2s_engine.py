@@ -0,0 +1,54 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from a2s_engine import A2SEngine  # noqa: E402
+from benchmarks.fake_a2s import start_fake_servers  # noqa: E402
+from models import Server  # noqa: E402
+
+# Compare the single-socket engine against one python-a2s socket per server.
+# python-a2s is no longer a dependency, install it to run this comparison.
+# Usage: python benchmarks/bench_a2s_engine.py [server_count]
+
+
+def make_server(port: int) -> Server:
+    server: Server = {}  # type: ignore
+    server["ip"] = "127.0.0.1"
+    server["port"] = port
+    return server
+
+
+async def bench_engine(servers: list[Server]) -> float:
+    start = time.perf_counter()
+    async with await A2SEngine.create() as engine:
+        _ = await asyncio.gather(*(engine.query_info_into(s) for s in servers))
+    return time.perf_counter() - start
+
+
+async def bench_python_a2s(servers: list[Server]) -> float:
+    import a2s
+
+    start = time.perf_counter()
+    _ = await asyncio.gather(
+        *(a2s.ainfo((s["ip"], s["port"])) for s in servers))
+    return time.perf_counter() - start
+
+
+async def main(count: int):
+    fakes = await start_fake_servers(count, challenge=1234, split_size=64)
+    servers = [make_server(port) for _, _, port in fakes]
+    engine_time = await bench_engine(servers)
+    assert all(s["players"] == 12 and s["map"] == "pl_upward" for s in servers)
+    a2s_time = await bench_python_a2s(servers)
+    print(f"{count} servers")
+    print(f"  single socket engine: {engine_time * 1000:.1f} ms")
+    print(f"  python-a2s:           {a2s_time * 1000:.1f} ms")
+    for transport, _, _ in fakes:
+        transport.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
@@ -0,0 +1,62 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_server_table import make_filter, make_servers  # noqa: E402
+from filtered_view import CHANGE_LOG, FilteredView, snapshot_fields  # noqa: E402
+from filters import apply_filters, filters_changed  # noqa: E402
+
+# Re-filter a large server list after each refresh in which a few servers changed,
+# with apply_filters over every server against an incrementally updated FilteredView.
+# Usage: python benchmarks/bench_filtered_view.py [server_count] [changed_per_refresh]
+
+REFRESHES = 50
+
+
+def churn(servers: list, count: int):
+    for server in random.sample(servers, count):
+        before = snapshot_fields(server, ("players", "slots"))
+        server["players"] = random.randint(0, server["max_players"])
+        server["slots"] = server["max_players"] - server["players"]
+        CHANGE_LOG.mark_if_changed(server, before)
+
+
+def main(count: int, changed: int):
+    servers = make_servers(count)
+    server_filter = make_filter()
+    random.seed(2)
+
+    start = time.perf_counter()
+    view = FilteredView(servers, server_filter)
+    build_time = time.perf_counter() - start
+
+    full_time = 0.0
+    view_time = 0.0
+    for refresh in range(REFRESHES):
+        churn(servers, changed)
+        if refresh == REFRESHES // 2:
+            server_filter["players"]["min"] = 4
+            filters_changed()
+        start = time.perf_counter()
+        expected = apply_filters(servers, server_filter)
+        full_time += time.perf_counter() - start
+        start = time.perf_counter()
+        _ = view.refresh()
+        view_time += time.perf_counter() - start
+        assert {id(s) for s in view.filtered_servers()} == {id(s) for s in expected}
+    view.close()
+
+    print(f"{count} servers, {changed} changed per refresh, one filter change")
+    print(f"  apply_filters:        {full_time / REFRESHES * 1000:.2f} ms per refresh")
+    print(f"  FilteredView.refresh: {view_time / REFRESHES * 1000:.2f} ms per refresh")
+    print(f"  FilteredView build (once): {build_time * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 10000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 50,
+    )
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_a2s import start_fake_servers  # noqa: E402
+from filters import apply_filters, get_default_filters  # noqa: E402
+from models import Server  # noqa: E402
+from refresh_pipeline import find_best_server_async, query_servers_async  # noqa: E402
+from server_sort import get_default_sort, sort_servers  # noqa: E402
+
+# Time to find the server auto_join would join: querying every server then sorting,
+# against querying in expected rank order with early exit.
+# A few fake servers answer slowly, like overloaded servers on the other side of the world.
+# Usage: python benchmarks/bench_find_best.py [server_count]
+
+SLOW_DELAY = 1.5
+SLOW_FRACTION = 0.05
+
+
+def make_server(server_id: int, port: int, players: int) -> Server:
+    server: Server = {}  # type: ignore
+    server["server_id"] = server_id
+    server["ip"] = "127.0.0.1"
+    server["port"] = port
+    server["ip_port"] = f"127.0.0.1:{port}"
+    server["region"] = "eu"
+    server["cc"] = "de"
+    server["distance"] = 100.0
+    server["map"] = "pl_upward"
+    # Last known values from the previous refresh
+    server["players"] = players
+    server["max_players"] = 24
+    server["slots"] = 24 - players
+    server["bots"] = 0
+    for key in ("ping", "ping_median", "ping_p90", "ping_jitter", "ping_loss"):
+        server[key] = -1
+    server["last_played"] = -1
+    server["since_played"] = -1
+    return server
+
+
+async def start(count: int) -> tuple[list, list[Server]]:
+    random.seed(1)
+    fakes = []
+    servers: list[Server] = []
+    for server_id in range(count):
+        players = random.randint(0, 24)
+        delay = SLOW_DELAY if random.random() < SLOW_FRACTION else random.uniform(0.005, 0.05)
+        [(transport, _, port)] = await start_fake_servers(1, players=players, delay=delay)
+        fakes.append(transport)
+        servers.append(make_server(server_id, port, players))
+    return fakes, servers
+
+
+async def main(count: int):
+    fakes, servers = await start(count)
+    server_filter = get_default_filters()
+    server_filter["slots"] = {"min": 1, "max": None}
+    sort_object = get_default_sort()
+
+    begin = time.perf_counter()
+    await query_servers_async(servers, None, 64, server_filter)
+    filtered = apply_filters(servers, server_filter)
+    sort_servers(filtered, sort_object)
+    full_time = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    best, queried, _ = await find_best_server_async(
+        servers, server_filter, sort_object, None, 64, 10.0
+    )
+    best_time = time.perf_counter() - begin
+    assert best is not None and best[sort_object["sort_by"]] == filtered[0][sort_object["sort_by"]]
+
+    print(f"{count} servers, best server has {best['players']} players")
+    print(f"  query all then sort: {full_time * 1000:.1f} ms")
+    print(f"  rank order, early exit: {best_time * 1000:.1f} ms ({len(queried)} queried)")
+    for transport in fakes:
+        transport.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
@@ -0,0 +1,60 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_a2s import start_fake_servers  # noqa: E402
+from benchmarks.fake_master import start_fake_master  # noqa: E402
+from refresh_pipeline import query_servers_async  # noqa: E402
+from server_providers import (  # noqa: E402
+    MasterServerProvider,
+    get_servers_async,
+)
+
+# Stream a master server list into the A2S pipeline, against fetching every page
+# first and querying afterwards.
+# The fake master server answers each page 20 ms late, like a real one far away.
+# Usage: python benchmarks/bench_master_server.py [server_count]
+
+PAGE_DELAY = 0.02
+
+
+async def bench_sequential(provider: MasterServerProvider) -> float:
+    start = time.perf_counter()
+    servers = []
+    async for batch in provider.stream():
+        servers.extend(batch)
+    await query_servers_async(servers)
+    assert all(server["players"] == 12 for server in servers)
+    return time.perf_counter() - start
+
+
+async def bench_streaming(provider: MasterServerProvider) -> float:
+    start = time.perf_counter()
+    servers, _, _ = await get_servers_async([provider])
+    assert all(server["players"] == 12 for server in servers)
+    return time.perf_counter() - start
+
+
+async def main(count: int):
+    fakes = await start_fake_servers(count, challenge=1234)
+    addresses = [("127.0.0.1", port) for _, _, port in fakes]
+    # Every server listed twice, as happens across master server pages
+    master, _, master_port = await start_fake_master(
+        addresses + addresses[: count // 10], delay=PAGE_DELAY
+    )
+    provider = MasterServerProvider(f"127.0.0.1:{master_port}")
+    sequential_time = await bench_sequential(provider)
+    streaming_time = await bench_streaming(provider)
+    print(f"{count} servers from the master server")
+    print(f"  fetch all pages, then query: {sequential_time * 1000:.1f} ms")
+    print(f"  query while streaming:       {streaming_time * 1000:.1f} ms")
+    master.close()
+    for transport, _, _ in fakes:
+        transport.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,57 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_server_table import make_servers  # noqa: E402
+from played_journal import (  # noqa: E402
+    EVENT_PLAYED,
+    GENERATION_SIZE,
+    append_entry,
+    read_entries,
+)
+from server_main import OUTDATED_VALUES  # noqa: E402
+from server_snapshot import write_snapshot  # noqa: E402
+
+# Cost of saving one last_played change on exit: rewriting the whole
+# snapshot, as every exit used to, against appending one journal entry.
+# Usage: python benchmarks/bench_played_journal.py [server_count]
+
+REPEATS = 20
+
+
+def main(count: int):
+    servers = make_servers(count)
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_path = os.path.join(directory, "servers.bin")
+        journal_path = os.path.join(directory, "played.journal")
+
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            write_snapshot(snapshot_path, servers, OUTDATED_VALUES)
+        rewrite_time = (time.perf_counter() - start) / REPEATS
+
+        start = time.perf_counter()
+        for server in servers[:REPEATS]:
+            append_entry(EVENT_PLAYED, server["ip_port"], time.time(), journal_path)
+        append_time = (time.perf_counter() - start) / REPEATS
+
+        with open(journal_path, "rb") as file:
+            _ = file.seek(GENERATION_SIZE)
+            data = file.read()
+        start = time.perf_counter()
+        entries, _ = read_entries(data)
+        replay_time = time.perf_counter() - start
+        assert [entry[1] for entry in entries] == [s["ip_port"] for s in servers[:REPEATS]]
+        entry_size = len(data) / len(entries)
+
+    print(f"{count} servers")
+    print(f"  rewrite the snapshot: {rewrite_time * 1000:.2f} ms")
+    print(f"  append one journal entry: {append_time * 1e6:.0f} us ({entry_size:.0f} bytes)")
+    print(f"  decode {len(entries)} journal entries: {replay_time * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
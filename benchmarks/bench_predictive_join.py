@@ -0,0 +1,150 @@
+import os
+import statistics
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_server_table import make_servers  # noqa: E402
+from filters import apply_filters, apply_static_filters, get_default_filters  # noqa: E402
+from models import Server, ServerFilter  # noqa: E402
+from poll_scheduler import PollScheduler  # noqa: E402
+
+# Simulated time-to-join of auto_join on servers whose players come and go
+# (Poisson arrivals while not full, each player leaving at a constant rate).
+# The wanted server has at least MIN_PLAYERS players and a free slot, and the
+# join only succeeds if the slot is still free JOIN_DELAY seconds later.
+# fixed:      query every server every REFRESH_INTERVAL seconds (the old loop)
+# predictive: PollScheduler with its slot forecast and query budget
+# Usage: python benchmarks/bench_predictive_join.py [server_count] [trials]
+
+STEP = 0.1
+WARMUP = 600.0
+TIMEOUT = 900.0
+REFRESH_INTERVAL = 5.0
+# Seconds an A2S query round takes, and between seeing a slot and taking it
+QUERY_TIME = 0.3
+JOIN_DELAY = 1.5
+MIN_PLAYERS = 20
+QUERY_BUDGET = 20.0
+
+
+class Simulation:
+    def __init__(self, servers: list[Server], seed: int):
+        self.rng = np.random.default_rng(seed)
+        count = len(servers)
+        self.max_players = np.array([server["max_players"] for server in servers])
+        # Popular servers sit full with a queue of joiners, others are half empty or dead
+        kind = self.rng.choice(3, count, p=[0.3, 0.4, 0.3])
+        occupancy = np.choose(kind, [4.0, 0.5, 0.1]) * self.max_players
+        self.leave_rate = self.rng.uniform(1 / 900, 1 / 300, count)
+        self.arrival_rate = occupancy * self.leave_rate
+        self.players = np.minimum(self.max_players, occupancy.astype(int))
+        self.time = 0.0
+        self.advance(WARMUP)
+        self.time = 0.0
+
+    def advance(self, seconds: float):
+        for _ in range(int(round(seconds / STEP))):
+            arrivals = (self.rng.random(len(self.players)) < self.arrival_rate * STEP) & (
+                self.players < self.max_players
+            )
+            departures = self.rng.binomial(self.players, self.leave_rate * STEP)
+            self.players += arrivals.astype(int) - departures
+        self.time += seconds
+
+    def query(self, servers: list[Server], indexes: dict[str, int]):
+        for server in servers:
+            players = int(self.players[indexes[server["ip_port"]]])
+            server["players"] = players
+            server["humans"] = players
+            server["slots"] = server["max_players"] - players
+
+    def try_join(self, server: Server, indexes: dict[str, int]) -> bool:
+        self.advance(JOIN_DELAY)
+        index = indexes[server["ip_port"]]
+        if self.players[index] >= self.max_players[index]:
+            return False
+        self.players[index] += 1
+        return True
+
+
+def make_filter() -> ServerFilter:
+    server_filter = get_default_filters()
+    server_filter["players"] = {"min": MIN_PLAYERS, "max": None}
+    server_filter["slots"] = {"min": 1, "max": None}
+    return server_filter
+
+
+def best(servers: list[Server], server_filter: ServerFilter) -> Server | None:
+    passing = apply_filters(servers, server_filter)
+    return max(passing, key=lambda server: server["players"]) if passing else None
+
+
+def fixed_interval(sim: Simulation, servers: list[Server], server_filter: ServerFilter):
+    indexes = {server["ip_port"]: i for i, server in enumerate(servers)}
+    candidates = apply_static_filters(servers, server_filter)
+    queries = 0
+    while sim.time < TIMEOUT:
+        sim.query(candidates, indexes)
+        queries += len(candidates)
+        sim.advance(QUERY_TIME)
+        server = best(candidates, server_filter)
+        if server is not None and sim.try_join(server, indexes):
+            return sim.time, queries
+        sim.advance(REFRESH_INTERVAL)
+    return None, queries
+
+
+def predictive(sim: Simulation, servers: list[Server], server_filter: ServerFilter):
+    indexes = {server["ip_port"]: i for i, server in enumerate(servers)}
+    scheduler = PollScheduler(QUERY_BUDGET)
+    scheduler.tokens_updated = 0.0
+    queries = 0
+    while sim.time < TIMEOUT:
+        batch = scheduler.due_servers(servers, server_filter, sim.time)
+        if batch:
+            sim.query(batch, indexes)
+            queries += len(batch)
+            sim.advance(QUERY_TIME)
+            scheduler.record_polled(batch, server_filter, sim.time)
+            server = best(batch, server_filter)
+            if server is not None and sim.try_join(server, indexes):
+                return sim.time, queries
+        wait = min(REFRESH_INTERVAL, max(STEP, scheduler.next_due_time() - sim.time))
+        sim.advance(round(wait / STEP) * STEP)
+    return None, queries
+
+
+def main(count: int, trials: int):
+    server_filter = make_filter()
+    results: dict[str, tuple[list[float], list[float]]] = {}
+    for name, policy in (("fixed", fixed_interval), ("predictive", predictive)):
+        times: list[float] = []
+        rates: list[float] = []
+        for seed in range(trials):
+            servers = make_servers(count)
+            for server in servers:
+                server["bots"] = 0
+                server["max_players"] = 24
+            sim = Simulation(servers, seed)
+            join_time, queries = policy(sim, servers, server_filter)
+            times.append(TIMEOUT if join_time is None else join_time)
+            rates.append(queries / sim.time)
+        results[name] = (times, rates)
+
+    print(f"{count} servers, {trials} simulated searches")
+    for name, (times, rates) in results.items():
+        print(
+            f"  {name:<10} time to join: median {statistics.median(times):6.1f} s, "
+            + f"p90 {np.percentile(times, 90):6.1f} s, "
+            + f"{statistics.mean(rates):5.1f} queries/s"
+        )
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 50,
+    )
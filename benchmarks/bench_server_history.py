@@ -0,0 +1,94 @@
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_server_table import make_servers  # noqa: E402
+from history_store import DAY, HistoryStore  # noqa: E402
+from server_history import (  # noqa: E402
+    busiest_servers,
+    load_history,
+    population_between,
+)
+
+# Record `days` days of population samples for `server_count` servers, then answer
+# "median humans on a server between 18:00 and 22:00" from the mapped history,
+# against the same samples kept as JSON lines and aggregated in Python.
+# Usage: python benchmarks/bench_server_history.py [server_count] [days]
+
+INTERVAL = 300
+
+
+def main(count: int, days: int):
+    random.seed(4)
+    servers = make_servers(count)
+    end = time.time()
+    start = end - days * DAY
+    samples: list[dict] = []
+    with tempfile.TemporaryDirectory() as directory:
+        store = HistoryStore(directory, INTERVAL, days + 1)
+        record_time = 0.0
+        now = start
+        while now < end:
+            for server in servers:
+                server["humans"] = max(0, min(server["max_players"], server["humans"] + random.randint(-2, 2)))
+            record_start = time.perf_counter()
+            store.record(servers, now)
+            record_time += time.perf_counter() - record_start
+            samples.extend(
+                {"time": now, "ip_port": server["ip_port"], "humans": server["humans"]}
+                for server in servers
+            )
+            now += INTERVAL
+        size = sum(
+            os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+        )
+        json_path = os.path.join(directory, "history.jsonl")
+        with open(json_path, "w") as file:
+            file.writelines(json.dumps(sample) + "\n" for sample in samples)
+        json_size = os.path.getsize(json_path)
+        target = servers[0]["ip_port"]
+
+        query_start = time.perf_counter()
+        with open(json_path, "r") as file:
+            rows = [json.loads(line) for line in file]
+        humans = []
+        for row in rows:
+            hour = time.localtime(row["time"])
+            if row["ip_port"] == target and 18 <= hour.tm_hour < 22:
+                humans.append(row["humans"])
+        expected = statistics.median(humans)
+        json_time = time.perf_counter() - query_start
+
+        query_start = time.perf_counter()
+        history = load_history(days + 1, end, directory)
+        load_time = time.perf_counter() - query_start
+        query_start = time.perf_counter()
+        stats = population_between(history, history.find_servers(target), 18, 22)
+        query_time = time.perf_counter() - query_start
+        query_start = time.perf_counter()
+        busiest = busiest_servers(history, end, recent=INTERVAL * 2)
+        busiest_time = time.perf_counter() - query_start
+        assert len(history) == len(samples)
+        assert stats["median"] == expected, (stats, expected)
+        assert len(busiest) == count
+
+    print(f"{count} servers, {days} days, {len(samples)} samples")
+    print(f"  record: {record_time / (days * DAY / INTERVAL) * 1000:.2f} ms per refresh")
+    print(f"  size: {size / 1024:.0f} KiB, as JSON lines {json_size / 1024:.0f} KiB")
+    print(f"  median humans 18-22h, JSON lines: {json_time * 1000:.0f} ms")
+    print(f"  median humans 18-22h, mapped:     {(load_time + query_time) * 1000:.1f} ms "
+          + f"(load {load_time * 1000:.1f} ms, query {query_time * 1000:.1f} ms)")
+    print(f"  busiest vs typical, mapped:       {busiest_time * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 14,
+    )
@@ -0,0 +1,87 @@
+import copy
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_server_table import MAPS, make_filter, make_servers  # noqa: E402
+from filtered_view import CHANGE_LOG, snapshot_fields  # noqa: E402
+from filters import apply_filters  # noqa: E402
+from refresh_scheduler import merge_uncle_servers  # noqa: E402
+from server_index import ServerIndex  # noqa: E402
+
+# Answer an include list filter and ip_port lookups from secondary indexes
+# instead of scanning every server, and measure what keeping the indexes current costs.
+# Usage: python benchmarks/bench_server_index.py [server_count]
+
+REPEATS = 20
+CHANGES_PER_REFRESH = 50
+
+
+def change_maps(servers: list, count: int):
+    for server in random.sample(servers, count):
+        before = snapshot_fields(server, ("map",))
+        server["map"] = random.choice(MAPS)
+        CHANGE_LOG.mark_if_changed(server, before)
+
+
+def main(count: int):
+    random.seed(3)
+    servers = make_servers(count)
+    server_filter = make_filter()
+    server_filter["map"] = {"values": ["map_150", "map_151"], "exclude": False}
+    fresh = [copy.deepcopy(servers) for _ in range(2)]
+
+    start = time.perf_counter()
+    merge_uncle_servers(servers, fresh[0])
+    merge_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = ServerIndex(servers)
+    build_time = time.perf_counter() - start
+
+    scan_time = 0.0
+    index_time = 0.0
+    maintain_time = 0.0
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        change_maps(servers, CHANGES_PER_REFRESH)
+        maintain_time += time.perf_counter() - start
+        start = time.perf_counter()
+        expected = apply_filters(servers, server_filter)
+        scan_time += time.perf_counter() - start
+        start = time.perf_counter()
+        result = index.apply_filters(server_filter)
+        index_time += time.perf_counter() - start
+        assert result == expected
+
+    targets = [server["ip_port"] for server in random.sample(servers, 100)]
+    start = time.perf_counter()
+    for ip_port in targets:
+        _ = next(server for server in servers if server["ip_port"] == ip_port)
+    lookup_scan_time = (time.perf_counter() - start) / len(targets)
+    start = time.perf_counter()
+    for ip_port in targets:
+        assert index.get("ip_port", ip_port) is not None
+    lookup_index_time = (time.perf_counter() - start) / len(targets)
+
+    start = time.perf_counter()
+    merge_uncle_servers(servers, fresh[1])
+    indexed_merge_time = time.perf_counter() - start
+    assert index.apply_filters(server_filter) == apply_filters(servers, server_filter)
+    index.close()
+
+    print(f"{count} servers, include list of 2 maps, {len(expected)} pass")
+    print(f"  apply_filters scan:  {scan_time / REPEATS * 1000:.2f} ms")
+    print(f"  from the map index:  {index_time / REPEATS * 1000:.2f} ms")
+    print(f"  ip_port lookup scan: {lookup_scan_time * 1e6:.1f} us, index: {lookup_index_time * 1e6:.2f} us")
+    print("Maintenance")
+    print(f"  index build (once): {build_time * 1000:.2f} ms")
+    print(f"  {CHANGES_PER_REFRESH} map changes: {maintain_time / REPEATS * 1000:.3f} ms per refresh")
+    print(f"  full state merge: {merge_time * 1000:.2f} ms without index, {indexed_merge_time * 1000:.2f} ms with")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
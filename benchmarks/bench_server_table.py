@@ -0,0 +1,104 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from filters import apply_filters, get_default_filters  # noqa: E402
+from models import Server, ServerFilter  # noqa: E402
+from server_sort import sort_servers  # noqa: E402
+from server_table import ServerTable  # noqa: E402
+
+# Filter and sort a master-server-sized server list as a list of dicts
+# and as a columnar ServerTable.
+# Usage: python benchmarks/bench_server_table.py [server_count]
+
+REGIONS = ["eu", "na", "sa", "as", "oc", "af"]
+COUNTRIES = ["de", "fr", "gb", "us", "ca", "br", "jp", "au", "za", "pl", "nl", "se"]
+MAPS = [f"map_{i}" for i in range(200)]
+REPEATS = 20
+
+
+def make_servers(count: int) -> list[Server]:
+    random.seed(1)
+    servers: list[Server] = []
+    for server_id in range(count):
+        max_players = random.choice([24, 24, 32, 100])
+        players = random.randint(0, max_players)
+        ip = f"10.{server_id >> 16 & 255}.{server_id >> 8 & 255}.{server_id & 255}"
+        last_played = random.choice([-1, -1, -1, time.time() - random.uniform(0, 86400)])
+        server: Server = {
+            "server_id": server_id,
+            "host": ip,
+            "port": 27015,
+            "ip": ip,
+            "name": f"Server {server_id}",
+            "name_short": f"S{server_id}",
+            "region": random.choice(REGIONS),
+            "cc": random.choice(COUNTRIES),
+            "players": players,
+            "max_players": max_players,
+            "bots": random.randint(0, 4),
+            "map": random.choice(MAPS),
+            "game_types": [],
+            "latitude": random.uniform(-90, 90),
+            "longitude": random.uniform(-180, 180),
+            "distance": random.uniform(0, 20000),
+            "humans": players,
+            "ping": random.uniform(5, 300),
+            "ping_median": -1,
+            "ping_p90": -1,
+            "ping_jitter": -1,
+            "ping_loss": -1,
+            "slots": max_players - players,
+            "ip_port": f"{ip}:27015",
+            "last_played": last_played,
+            "since_played": -1 if last_played == -1 else time.time() - last_played,
+        }
+        servers.append(server)
+    return servers
+
+
+def make_filter() -> ServerFilter:
+    server_filter = get_default_filters()
+    server_filter["region"] = {"values": ["eu", "na"], "exclude": False}
+    server_filter["map"] = {"values": MAPS[:20], "exclude": True}
+    server_filter["players"] = {"min": 8, "max": None}
+    server_filter["slots"] = {"min": 1, "max": None}
+    server_filter["since_played"] = {"min": 3600, "max": None}
+    return server_filter
+
+
+def main(count: int):
+    servers = make_servers(count)
+    server_filter = make_filter()
+    sort_object = {"sort_by": "players", "reverse": True}
+
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        expected = apply_filters(servers, server_filter)
+        sort_servers(expected, sort_object)  # type: ignore
+    list_time = (time.perf_counter() - start) / REPEATS
+
+    start = time.perf_counter()
+    table = ServerTable.from_servers(servers)
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        indices = table.sort_indices(table.apply_filters(server_filter), sort_object)  # type: ignore
+    table_time = (time.perf_counter() - start) / REPEATS
+    assert [table.get(int(i), "ip_port") for i in indices] == [s["ip_port"] for s in expected]
+
+    print(f"{count} servers, {len(expected)} pass the filters")
+    print(f"  list of dicts filter + sort: {list_time * 1000:.2f} ms")
+    print(f"  server table filter + sort:  {table_time * 1000:.2f} ms")
+    print(f"  server table build (once per refresh): {build_time * 1000:.2f} ms")
+    # Queries between two refreshes for the table to beat the list of dicts
+    saved = list_time - table_time
+    if saved > 0:
+        print(f"  table pays off from {build_time / saved:.1f} queries per refresh")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
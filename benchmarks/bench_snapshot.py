@@ -0,0 +1,73 @@
+import copy
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_server_table import make_servers  # noqa: E402
+from server_main import OUTDATED_VALUES  # noqa: E402
+from server_snapshot import ServerSnapshot, read_snapshot, write_snapshot  # noqa: E402
+
+# Write and read the server cache as indented JSON (with the deep copy the clean
+# write used to make) and as a binary snapshot.
+# Usage: python benchmarks/bench_snapshot.py [server_count]
+
+REPEATS = 5
+
+
+def json_clean_write(path: str, servers: list):
+    servers_copy = copy.deepcopy(servers)
+    for server in servers_copy:
+        server.update(OUTDATED_VALUES)
+    with open(path, "w") as file:
+        json.dump(servers_copy, file, indent=4)
+
+
+def json_read(path: str) -> list:
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        function(*args)
+    return (time.perf_counter() - start) / REPEATS
+
+
+def main(count: int):
+    servers = make_servers(count)
+    servers[0]["game_types"] = ["payload", "alltalk"]
+    with tempfile.TemporaryDirectory() as directory:
+        json_path = os.path.join(directory, "servers.json")
+        snapshot_path = os.path.join(directory, "servers.bin")
+
+        json_write_time = timed(json_clean_write, json_path, servers)
+        snapshot_write_time = timed(write_snapshot, snapshot_path, servers, OUTDATED_VALUES)
+        json_read_time = timed(json_read, json_path)
+        snapshot_read_time = timed(read_snapshot, snapshot_path)
+
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            with ServerSnapshot(snapshot_path) as snapshot:
+                _ = snapshot[len(snapshot) // 2]
+        lazy_time = (time.perf_counter() - start) / REPEATS
+
+        assert read_snapshot(snapshot_path) == json_read(json_path)
+        write_snapshot(snapshot_path, servers)
+        assert read_snapshot(snapshot_path) == servers
+        json_size = os.path.getsize(json_path)
+        snapshot_size = os.path.getsize(snapshot_path)
+
+    print(f"{count} servers")
+    print(f"  clean write: JSON {json_write_time * 1000:.1f} ms, snapshot {snapshot_write_time * 1000:.1f} ms")
+    print(f"  full read:   JSON {json_read_time * 1000:.1f} ms, snapshot {snapshot_read_time * 1000:.1f} ms")
+    print(f"  open snapshot and decode one record: {lazy_time * 1e6:.0f} us")
+    print(f"  size: JSON {json_size / 1024:.0f} KiB, snapshot {snapshot_size / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
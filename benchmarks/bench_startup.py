@@ -0,0 +1,158 @@
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_server_table import make_servers  # noqa: E402
+from options import get_default_options  # noqa: E402
+from server_main import OUTDATED_VALUES  # noqa: E402
+from server_snapshot import write_snapshot  # noqa: E402
+
+# Cold start of main.py: wall-clock time until the first line of output and
+# the modules imported before it (python -X importtime), on paths that need
+# no network:
+#   quick:  -q answered by a scout daemon (a fake one, serving a fixed list)
+#   auto:   -a -J, the daemon's best server is printed instead of joined
+#   menu:   no arguments, until the main menu is printed from the cache
+# Exits with status 1 when a path imports one of its forbidden modules or
+# takes more than MAX_STARTUP_RATIO times a bare interpreter start.
+# Usage: python benchmarks/bench_startup.py [server_count] [repeats]
+
+PATHS: dict[str, list[str]] = {
+    "quick": ["-q", "-l", "10"],
+    "auto": ["-a", "-J"],
+    "menu": [],
+}
+# Modules only the network refresh, the daemon itself or history queries need
+FORBIDDEN_IMPORTS = (
+    "requests",
+    "asyncio",
+    "concurrent.futures",
+    "numpy",
+    "subprocess",
+    "webbrowser",
+)
+MAX_STARTUP_RATIO = 8.0
+DAEMON_SERVERS = 20
+# Width of the terminal the grid is laid out for, stdout is a pipe here
+TERMINAL_COLUMNS = "160"
+
+
+def serve_daemon(listener: socket.socket, servers: list[dict]):
+    response = json.dumps({"ok": True, "servers": servers, "age": 0.0}).encode() + b"\n"
+    while True:
+        try:
+            connection, _ = listener.accept()
+        except OSError:
+            return
+        with connection:
+            with connection.makefile("rb") as reader:
+                _ = reader.readline()
+            connection.sendall(response)
+
+
+def first_output(command: list[str], directory: str) -> tuple[float, str]:
+    """
+    Seconds until the command prints its first line, and its stderr.
+    Its input is closed after that line, which ends the menu.
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        command,
+        cwd=directory,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env={**os.environ, "COLUMNS": TERMINAL_COLUMNS},
+    )
+    assert process.stdout is not None
+    line = process.stdout.readline()
+    elapsed = time.perf_counter() - start
+    _, errors = process.communicate()
+    if not line:
+        raise RuntimeError(f"No output from {command}: {errors.decode()[-2000:]}")
+    return elapsed, errors.decode()
+
+
+def imported_modules(importtime: str) -> tuple[list[str], float]:
+    """
+    Modules imported and the sum of their own import times in seconds.
+    """
+    modules: list[str] = []
+    total = 0
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        modules.append(name.strip())
+        total += int(own)
+    return modules, total / 1e6
+
+
+def median_time(command: list[str], directory: str, repeats: int) -> float:
+    return statistics.median(first_output(command, directory)[0] for _ in range(repeats))
+
+
+def main(count: int, repeats: int) -> bool:
+    servers = make_servers(count)
+    ok = True
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, "cache"))
+        write_snapshot(os.path.join(directory, "cache", "servers.bin"), servers, OUTDATED_VALUES)
+        options = get_default_options()
+        with open(os.path.join(directory, "options.json"), "w") as file:
+            json.dump(options, file)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(os.path.join(directory, "cache", "scout.sock"))
+        listener.listen()
+        thread = threading.Thread(
+            target=serve_daemon, args=(listener, servers[:DAEMON_SERVERS]), daemon=True
+        )
+        thread.start()
+
+        baseline = median_time([sys.executable, "-c", "print()"], directory, repeats)
+        print(f"{count} cached servers, median of {repeats} runs")
+        print(f"  bare interpreter: {baseline * 1000:6.1f} ms to first output")
+        main_path = os.path.join(ROOT, "main.py")
+        for name, arguments in PATHS.items():
+            command = [sys.executable, main_path, *arguments]
+            # The first run writes the caches later runs start from
+            _ = first_output(command, directory)
+            elapsed = median_time(command, directory, repeats)
+            _, importtime = first_output(
+                [sys.executable, "-X", "importtime", main_path, *arguments], directory
+            )
+            modules, import_time = imported_modules(importtime)
+            forbidden = [
+                module
+                for module in FORBIDDEN_IMPORTS
+                if module in modules
+            ]
+            print(
+                f"  {name:<6} {elapsed * 1000:6.1f} ms to first output, "
+                + f"{len(modules)} modules imported in {import_time * 1000:.1f} ms"
+            )
+            if forbidden:
+                print(f"    REGRESSION: imports {', '.join(forbidden)}")
+                ok = False
+            if elapsed > baseline * MAX_STARTUP_RATIO:
+                print(f"    REGRESSION: over {MAX_STARTUP_RATIO:.0f}x the bare interpreter")
+                ok = False
+        listener.close()
+    return ok
+
+
+if __name__ == "__main__":
+    passed = main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 9,
+    )
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+from benchmarks.fake_uncle_http import FakeUncleServer  # noqa: E402
+from uncle_client import UncleClient  # noqa: E402
+
+# Compare plain requests.get against the pooled conditional client
+# on a local stand-in for the UncleTopia state endpoint.
+# Usage: python benchmarks/bench_uncle_http.py [refreshes] [server_count]
+
+
+def main(refreshes: int, server_count: int):
+    fake = FakeUncleServer(server_count)
+    fake.start()
+
+    start = time.perf_counter()
+    plain_bytes = 0
+    for _ in range(refreshes):
+        response = requests.get(fake.url, headers={"Accept-Encoding": "identity"})
+        plain_bytes += len(response.content)
+        _ = response.json()["servers"]
+    plain_time = time.perf_counter() - start
+
+    client = UncleClient(fake.url)
+    start = time.perf_counter()
+    client_bytes = 0
+    for _ in range(refreshes):
+        _ = client.fetch_servers()
+        client_bytes += client.last_fetch.bytes_received
+    client_time = time.perf_counter() - start
+    client.close()
+    fake.stop()
+
+    print(f"{refreshes} refreshes of {server_count} servers")
+    print(
+        f"  requests.get:  {plain_time / refreshes * 1000:.2f} ms/refresh, "
+        + f"{plain_bytes / refreshes:.0f} bytes/refresh"
+    )
+    print(
+        f"  pooled client: {client_time / refreshes * 1000:.2f} ms/refresh, "
+        + f"{client_bytes / refreshes:.0f} bytes/refresh"
+    )
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 50,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 100,
+    )
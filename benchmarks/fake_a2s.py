@@ -0,0 +1,135 @@
+import asyncio
+import struct
+
+# Local stand-in for TF2 servers answering A2S queries.
+# Used by the benchmarks to exercise the query engine without touching the network.
+
+HEADER_SIMPLE = b"\xff\xff\xff\xff"
+HEADER_SPLIT = b"\xfe\xff\xff\xff"
+
+
+class FakeA2SServer(asyncio.DatagramProtocol):
+    """
+    Answers A2S_INFO, A2S_PLAYER and A2S_RULES for one fake server.
+    With `challenge` set, every request must carry the challenge number first.
+    With `split_size` set, responses larger than it are sent as split packets.
+    With `delay` set, every response is sent that many seconds late.
+    """
+
+    def __init__(
+        self,
+        name: str = "Fake Server",
+        map_name: str = "pl_upward",
+        players: int = 12,
+        max_players: int = 24,
+        bots: int = 0,
+        player_names: list[str] | None = None,
+        challenge: int | None = None,
+        split_size: int | None = None,
+        delay: float = 0.0,
+    ):
+        self.name: str = name
+        self.map_name: str = map_name
+        self.players: int = players
+        self.max_players: int = max_players
+        self.bots: int = bots
+        self.player_names: list[str] = player_names or [
+            f"player{i}" for i in range(players)
+        ]
+        self.challenge: int | None = challenge
+        self.split_size: int | None = split_size
+        self.delay: float = delay
+        self.requests_received: int = 0
+        self.transport: asyncio.DatagramTransport | None = None
+
+    def connection_made(self, transport: asyncio.BaseTransport):
+        assert isinstance(transport, asyncio.DatagramTransport)
+        self.transport = transport
+
+    def info_response(self) -> bytes:
+        return (
+            b"\x49\x11"
+            + self.name.encode() + b"\x00"
+            + self.map_name.encode() + b"\x00"
+            + b"tf\x00Team Fortress\x00"
+            + struct.pack("<hBBB", 440, self.players, self.max_players, self.bots)
+            + b"dl\x00\x01"
+            + b"1.0\x00"
+        )
+
+    def players_response(self) -> bytes:
+        body = bytearray(b"\x44")
+        body.append(len(self.player_names))
+        for index, player in enumerate(self.player_names):
+            body.append(index)
+            body += player.encode() + b"\x00"
+            body += struct.pack("<lf", index, 60.0 * index)
+        return bytes(body)
+
+    def rules_response(self) -> bytes:
+        return b"\x45" + struct.pack("<h", 1) + b"sv_gravity\x00800\x00"
+
+    def check_challenge(self, data: bytes, offset: int) -> bool:
+        if self.challenge is None:
+            return True
+        if len(data) < offset + 4:
+            return False
+        return struct.unpack_from("<l", data, offset)[0] == self.challenge
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]):
+        self.requests_received += 1
+        if not data.startswith(HEADER_SIMPLE) or len(data) < 5:
+            return
+        kind = data[4]
+        if kind == 0x54:
+            offset = data.index(b"\x00", 5) + 1
+            response = self.info_response()
+        elif kind == 0x55:
+            offset = 5
+            response = self.players_response()
+        elif kind == 0x56:
+            offset = 5
+            response = self.rules_response()
+        else:
+            return
+        if not self.check_challenge(data, offset):
+            assert self.challenge is not None
+            response = b"\x41" + struct.pack("<l", self.challenge)
+        if self.delay:
+            asyncio.get_running_loop().call_later(self.delay, self.send, response, addr)
+        else:
+            self.send(response, addr)
+
+    def send(self, response: bytes, addr: tuple[str, int]):
+        if self.transport is None or self.transport.is_closing():
+            return
+        packet = HEADER_SIMPLE + response
+        if self.split_size is None or len(packet) <= self.split_size:
+            self.transport.sendto(packet, addr)
+            return
+        chunks = [
+            packet[i: i + self.split_size]
+            for i in range(0, len(packet), self.split_size)
+        ]
+        for number, chunk in enumerate(chunks):
+            header = struct.pack("<lBBh", 1, len(chunks), number, self.split_size)
+            self.transport.sendto(HEADER_SPLIT + header + chunk, addr)
+
+
+async def start_fake_servers(
+    count: int, **kwargs
+) -> list[tuple[asyncio.DatagramTransport, FakeA2SServer, int]]:
+    """
+    Start `count` fake servers on localhost, each on its own ephemeral port.
+    Returns (transport, server, port) for each.
+    """
+    loop = asyncio.get_running_loop()
+    servers: list[tuple[asyncio.DatagramTransport, FakeA2SServer, int]] = []
+    for i in range(count):
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: FakeA2SServer(name=f"Fake Server {i}", **kwargs),
+            local_addr=("127.0.0.1", 0),
+        )
+        port: int = transport.get_extra_info("sockname")[1]
+        servers.append((transport, protocol, port))
+    return servers
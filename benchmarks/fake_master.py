@@ -0,0 +1,75 @@
+import asyncio
+import ipaddress
+import struct
+
+from master_server import END_ADDRESS, MASTER_QUERY, MASTER_RESPONSE_HEADER
+
+# Fake Valve master server for benchmarks, serving a fixed address list in pages.
+
+
+class FakeMasterServer(asyncio.DatagramProtocol):
+    """
+    Answers master server queries with `page_size` addresses per page.
+    The filter string is ignored.
+    With `delay` set, every page is sent that many seconds late.
+    """
+
+    def __init__(
+        self,
+        addresses: list[tuple[str, int]],
+        page_size: int = 231,
+        delay: float = 0.0,
+    ):
+        self.addresses: list[tuple[str, int]] = addresses
+        self.page_size: int = page_size
+        self.delay: float = delay
+        self.requests_received: int = 0
+        self.transport: asyncio.DatagramTransport | None = None
+
+    def connection_made(self, transport: asyncio.BaseTransport):
+        assert isinstance(transport, asyncio.DatagramTransport)
+        self.transport = transport
+
+    def page(self, seed: tuple[str, int]) -> bytes:
+        start = 0
+        if seed != END_ADDRESS:
+            start = self.addresses.index(seed) + 1
+        addresses = self.addresses[start: start + self.page_size]
+        if start + self.page_size >= len(self.addresses):
+            addresses = addresses + [END_ADDRESS]
+        return MASTER_RESPONSE_HEADER + b"".join(
+            ipaddress.IPv4Address(ip).packed + struct.pack("!H", port)
+            for ip, port in addresses
+        )
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]):
+        self.requests_received += 1
+        if len(data) < 3 or data[0] != MASTER_QUERY:
+            return
+        ip, _, port = data[2: data.index(b"\x00", 2)].decode().rpartition(":")
+        response = self.page((ip, int(port)))
+        if self.delay:
+            asyncio.get_running_loop().call_later(self.delay, self.send, response, addr)
+        else:
+            self.send(response, addr)
+
+    def send(self, response: bytes, addr: tuple[str, int]):
+        if self.transport is None or self.transport.is_closing():
+            return
+        self.transport.sendto(response, addr)
+
+
+async def start_fake_master(
+    addresses: list[tuple[str, int]], **kwargs
+) -> tuple[asyncio.DatagramTransport, FakeMasterServer, int]:
+    """
+    Start a fake master server on localhost on an ephemeral port.
+    Returns (transport, server, port).
+    """
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: FakeMasterServer(addresses, **kwargs),
+        local_addr=("127.0.0.1", 0),
+    )
+    port: int = transport.get_extra_info("sockname")[1]
+    return transport, protocol, port
@@ -0,0 +1,86 @@
+import gzip
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the UncleTopia state endpoint.
+# Supports keep-alive, gzip and conditional requests like the real API behind its CDN.
+
+
+def make_state(server_count: int) -> dict:
+    return {
+        "servers": [
+            {
+                "server_id": i,
+                "host": f"host{i}.example",
+                "port": 27015,
+                "ip": f"10.0.{i // 256}.{i % 256}",
+                "name": f"Uncletopia | Fake {i}",
+                "name_short": f"fake-{i}",
+                "region": ["na", "eu", "au"][i % 3],
+                "cc": ["us", "de", "au"][i % 3],
+                "players": i % 25,
+                "max_players": 24,
+                "bots": 0,
+                "map": "pl_upward",
+                "game_types": ["payload"],
+                "latitude": 40.0,
+                "longitude": -70.0,
+                "distance": 100.0 * i,
+                "humans": i % 25,
+            }
+            for i in range(server_count)
+        ],
+        "lat_long": {"latitude": 40.0, "longitude": -70.0},
+    }
+
+
+class FakeUncleServer:
+    def __init__(self, server_count: int = 100):
+        self.requests: int = 0
+        self.connections: set[int] = set()
+        self.set_state(make_state(server_count))
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                fake.requests += 1
+                fake.connections.add(id(self.connection))
+                if self.headers.get("If-None-Match") == fake.etag:
+                    self.send_response(304)
+                    self.send_header("ETag", fake.etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = fake.body
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("ETag", fake.etag)
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = fake.body_gzip
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                _ = self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/api/servers/state"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def set_state(self, state: dict):
+        self.body = json.dumps(state).encode()
+        self.body_gzip = gzip.compress(self.body)
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
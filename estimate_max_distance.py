@@ -1,5 +1,6 @@
 import numpy as np
 
+from latency_cache import get_cached_latency
 from models import Server
 
 UNCLETOPIA_AUTO_KICK_LATENCY = 150  # Threshold latency in ms
@@ -20,11 +21,17 @@ def estimate_max_distance(servers: list[Server]) -> float | None:
     Estimates the max distance at which latency exceeds the auto-kick threshold (150ms).
     Uses linear regression on (distance, ping) pairs.
     """
-    # If any server has a negative ping, return None
-    if any(server["ping"] < 0 for server in servers):
-        return None
     # Extract valid (distance, ping) pairs
-    data = [(server["distance"], server["ping"]) for server in servers]
+    # Servers that were not pinged this time use the latency cache instead
+    data: list[tuple[float, float]] = []
+    for server in servers:
+        ping = server["ping"]
+        if ping < 0:
+            cached = get_cached_latency(server["ip"])
+            if cached is None:
+                continue
+            ping = cached["median"]
+        data.append((server["distance"], ping))
 
     if len(data) < 2:  # Not enough data to train a model
         return None
@@ -0,0 +1,187 @@
+from typing import Any, Protocol
+
+from filters import FILTER_PLANS, MISSING, FilterPlan
+from models import Server, ServerFilter
+
+# Incrementally maintained filtered view of the server table.
+# Code that changes servers reports which fields changed to CHANGE_LOG,
+# which forwards them to every listener (open views and server indexes). On refresh, a view re-runs only the
+# filter checks reading a changed field, and only for the servers that changed,
+# so the cost of a refresh follows the churn instead of the number of servers.
+# The view keeps the failing checks of every server to know when it starts or
+# stops passing, and reports those as added / removed events.
+# A filter change (filters_changed()) re-tests every server.
+
+
+class ChangeListener(Protocol):
+    def watched_fields(self) -> set[str]: ...
+
+    def mark(self, server: Server, fields: set[str] | tuple[str, ...]): ...
+
+    def mark_removed(self, server: Server): ...
+
+    def mark_reordered(self): ...
+
+
+class ChangeLog:
+    def __init__(self):
+        self.listeners: list[ChangeListener] = []
+
+    def watched_fields(self) -> set[str]:
+        """
+        Fields some listener needs to hear about, so bulk updates only compare those.
+        Changes to other fields may still be reported.
+        """
+        fields: set[str] = set()
+        for listener in self.listeners:
+            fields.update(listener.watched_fields())
+        return fields
+
+    def mark(self, server: Server, fields: set[str] | tuple[str, ...]):
+        """
+        Report changed fields of a server, or a new server with no fields.
+        """
+        for listener in self.listeners:
+            listener.mark(server, fields)
+
+    def mark_if_changed(self, server: Server, before: dict[str, Any]):
+        """
+        Mark the fields of `server` that differ from `before`.
+        """
+        if not self.listeners:
+            return
+        fields = {key for key, value in before.items() if server.get(key) != value}
+        if fields:
+            self.mark(server, fields)
+
+    def mark_removed(self, server: Server):
+        for listener in self.listeners:
+            listener.mark_removed(server)
+
+    def mark_reordered(self):
+        """
+        Report that the server table was rebuilt in a new order.
+        """
+        for listener in self.listeners:
+            listener.mark_reordered()
+
+
+CHANGE_LOG = ChangeLog()
+
+
+def snapshot_fields(server: Server, fields: tuple[str, ...]) -> dict[str, Any]:
+    """
+    Values of some fields of a server, to pass to CHANGE_LOG.mark_if_changed later.
+    Empty when nothing listens, so callers pay nothing.
+    """
+    if not CHANGE_LOG.listeners:
+        return {}
+    return {key: server.get(key) for key in fields}
+
+
+class FilteredView:
+    def __init__(self, servers: list[Server], server_filter: ServerFilter):
+        self.server_filter: ServerFilter = server_filter
+        # Every server known to the view and the keys of the checks it fails
+        self.servers: dict[int, Server] = {}
+        self.failing: dict[int, set[str]] = {}
+        # Servers passing the filter, in the order they started passing
+        self.passing: dict[int, Server] = {}
+        self.dirty: dict[int, tuple[Server, set[str]]] = {}
+        self.removed: dict[int, Server] = {}
+        self.plan: FilterPlan = FILTER_PLANS.get(server_filter)
+        self.plan_version: int = FILTER_PLANS.version
+        self.tests: dict[str, Any] = {}
+        self.compile()
+        for server in servers:
+            self.servers[id(server)] = server
+            if self.test(server, None):
+                self.passing[id(server)] = server
+        CHANGE_LOG.listeners.append(self)
+
+    def close(self):
+        if self in CHANGE_LOG.listeners:
+            CHANGE_LOG.listeners.remove(self)
+
+    def compile(self):
+        self.tests = {check.key: check.test for check in self.plan.checks}
+
+    def watched_fields(self) -> set[str]:
+        # A filter change re-tests every server anyway
+        return set(self.tests.keys())
+
+    def mark(self, server: Server, fields: set[str] | tuple[str, ...]):
+        entry = self.dirty.get(id(server))
+        if entry is None:
+            self.dirty[id(server)] = (server, set(fields))
+        else:
+            entry[1].update(fields)
+
+    def mark_removed(self, server: Server):
+        self.removed[id(server)] = server
+        self.dirty.pop(id(server), None)
+
+    def mark_reordered(self):
+        pass
+
+    def test(self, server: Server, fields: set[str] | None) -> bool:
+        """
+        Re-run the checks reading `fields` (every check if None) and return
+        whether the server passes now.
+        """
+        key = id(server)
+        failing = self.failing.setdefault(key, set())
+        keys = self.tests.keys() if fields is None else fields & self.tests.keys()
+        for field in keys:
+            item = server.get(field, MISSING)
+            if item is MISSING or self.tests[field](item):
+                failing.discard(field)
+            else:
+                failing.add(field)
+        return not failing
+
+    def refresh(self) -> tuple[list[Server], list[Server]]:
+        """
+        Apply the pending changes.
+        Returns the servers that started passing the filter and the ones that stopped.
+        """
+        added: list[Server] = []
+        removed: list[Server] = []
+        if FILTER_PLANS.version != self.plan_version:
+            # The filter changed, every server has to be tested again
+            self.plan = FILTER_PLANS.get(self.server_filter)
+            self.plan_version = FILTER_PLANS.version
+            self.compile()
+            self.failing.clear()
+            dirty = [(server, None) for server in self.servers.values()]
+            dirty += [
+                (server, None)
+                for key, (server, _) in self.dirty.items()
+                if key not in self.servers
+            ]
+        else:
+            dirty = list(self.dirty.values())
+        self.dirty = {}
+        for server, fields in dirty:
+            key = id(server)
+            if key not in self.servers:
+                # New server
+                self.servers[key] = server
+                fields = None
+            passes = self.test(server, fields)
+            if passes and key not in self.passing:
+                self.passing[key] = server
+                added.append(server)
+            elif not passes and key in self.passing:
+                del self.passing[key]
+                removed.append(server)
+        for key, server in self.removed.items():
+            self.servers.pop(key, None)
+            self.failing.pop(key, None)
+            if self.passing.pop(key, None) is not None:
+                removed.append(server)
+        self.removed = {}
+        return added, removed
+
+    def filtered_servers(self) -> list[Server]:
+        return list(self.passing.values())
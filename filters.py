@@ -1,5 +1,7 @@
 import json
+from collections.abc import Callable
 from copy import deepcopy
+from typing import Any
 
 from models import ListFilter, RangeFilter, Server, ServerFilter
 
@@ -13,6 +15,10 @@ DEFAULT_FILTERS: ServerFilter = {
     "map": {"values": [], "exclude": True},
     "distance": {"min": None, "max": None},
     "ping": {"min": None, "max": 150.0},
+    "ping_median": {"min": None, "max": None},
+    "ping_p90": {"min": None, "max": None},
+    "ping_jitter": {"min": None, "max": None},
+    "ping_loss": {"min": None, "max": None},
     "slots": {"min": None, "max": None},
     "ip_port": {"values": [], "exclude": True},
     "since_played": {"min": None, "max": None},
@@ -42,52 +48,158 @@ def read_filters() -> ServerFilter:
         return get_default_filters()
 
 
-def apply_filters(servers: list[Server], server_filter: ServerFilter) -> list[Server]:
-    filtered_servers: list[Server] = []
-    for server in servers:
-        failed = False
-        for key, item in server.items():
-            if key not in server_filter:
+# Filters are compiled into a filter plan: one check per filter that can reject
+# anything, with list filters turned into frozenset lookups and no-op filters dropped.
+# Checks run in order of their measured rejection rate, so the filters that reject
+# the most servers run first.
+# Plans are cached per filter dict and rebuilt only after filters_changed().
+
+# Filters that change between refreshes, skipped by the pre filters
+VOLATILE_FILTER_FIELDS = ("players", "map", "slots", "since_played")
+# Fields whose values come from the server list itself and not from probing the server
+STATIC_FILTER_FIELDS = ("server_id", "region", "cc", "ip_port", "distance")
+MAX_CACHED_PLANS = 16
+MISSING = object()
+
+
+class FilterCheck:
+    __slots__ = ("key", "test", "tested", "rejected")
+
+    def __init__(self, key: str, test: Callable[[Any], bool]):
+        self.key: str = key
+        self.test: Callable[[Any], bool] = test
+        self.tested: int = 0
+        self.rejected: int = 0
+
+    def rejection_rate(self) -> float:
+        return self.rejected / self.tested if self.tested else 0.0
+
+
+def compile_list_filter(list_filter: ListFilter) -> Callable[[Any], bool] | None:
+    values = frozenset(list_filter["values"])
+    if list_filter["exclude"]:
+        if not values:
+            return None
+        return lambda item: item not in values
+    return values.__contains__
+
+
+def compile_range_filter(key: str, range_filter: RangeFilter) -> Callable[[Any], bool] | None:
+    low = range_filter["min"]
+    high = range_filter["max"]
+    if key == "since_played":
+        # Server has never been played, skip this filter
+        if low is not None and high is not None:
+            return lambda item: item == -1 or low <= item <= high
+        if low is not None:
+            return lambda item: item == -1 or item >= low
+        if high is not None:
+            return lambda item: item == -1 or item <= high
+        return None
+    if low is not None and high is not None:
+        return lambda item: low <= item <= high
+    if low is not None:
+        return lambda item: item >= low
+    if high is not None:
+        return lambda item: item <= high
+    return None
+
+
+class FilterPlan:
+    def __init__(self, server_filter: ServerFilter, fields: tuple[str, ...] | None = None):
+        self.checks: list[FilterCheck] = []
+        for key, item in server_filter.items():
+            if fields is not None and key not in fields:
                 continue
-            if "values" in server_filter[key]:
-                list_filter: ListFilter = server_filter[key]
-                in_list = item in list_filter["values"]
-                if in_list and list_filter["exclude"]:
-                    failed = True
-                    break
-                if not in_list and not list_filter["exclude"]:
-                    failed = True
-                    break
-            elif "min" in server_filter[key]:
-                range_filter: RangeFilter = server_filter[key]
-                if key == "since_played" and item == -1:
-                    # Sever has never been played, skip this filter
-                    continue
-                if range_filter["min"] is not None and item < range_filter["min"]:
-                    failed = True
-                    break
-                if range_filter["max"] is not None and item > range_filter["max"]:
-                    failed = True
-                    break
+            if "values" in item:
+                test = compile_list_filter(item)
+            elif "min" in item:
+                test = compile_range_filter(key, item)
             else:
                 raise ValueError(f"Invalid filter key: {key}")
+            if test is not None:
+                self.checks.append(FilterCheck(key, test))
+
+    def passes(self, server: Server) -> bool:
+        for check in self.checks:
+            item = server.get(check.key, MISSING)
+            if item is MISSING:
+                continue
+            check.tested += 1
+            if not check.test(item):
+                check.rejected += 1
+                return False
+        return True
+
+    def apply(self, servers: list[Server]) -> list[Server]:
+        filtered_servers = [server for server in servers if self.passes(server)]
+        self.checks.sort(key=FilterCheck.rejection_rate, reverse=True)
+        return filtered_servers
+
+
+class FilterPlanCache:
+    def __init__(self):
+        self.version: int = 0
+        # (id of the filter dict, fields) -> (filter dict, version, plan)
+        self.plans: dict[
+            tuple[int, tuple[str, ...] | None], tuple[ServerFilter, int, FilterPlan]
+        ] = {}
 
-        if not failed:
-            filtered_servers.append(server)
+    def invalidate(self):
+        self.version += 1
 
-    return filtered_servers
+    def get(
+        self, server_filter: ServerFilter, fields: tuple[str, ...] | None = None
+    ) -> FilterPlan:
+        key = (id(server_filter), fields)
+        cached = self.plans.get(key)
+        if cached is not None and cached[0] is server_filter and cached[1] == self.version:
+            return cached[2]
+        plan = FilterPlan(server_filter, fields)
+        if cached is not None:
+            # Keep the order measured with the previous plan
+            rates = {check.key: check.rejection_rate() for check in cached[2].checks}
+            plan.checks.sort(key=lambda check: rates.get(check.key, 0.0), reverse=True)
+        self.plans.pop(key, None)
+        self.plans[key] = (server_filter, self.version, plan)
+        while len(self.plans) > MAX_CACHED_PLANS:
+            del self.plans[next(iter(self.plans))]
+        return plan
+
+
+FILTER_PLANS = FilterPlanCache()
+
+
+def filters_changed():
+    """
+    Call after changing a filter in place so its plan is rebuilt.
+    """
+    FILTER_PLANS.invalidate()
+
+
+def apply_filters(servers: list[Server], server_filter: ServerFilter) -> list[Server]:
+    return FILTER_PLANS.get(server_filter).apply(servers)
+
+
+def pre_filter_fields(server_filter: ServerFilter) -> tuple[str, ...]:
+    return tuple(key for key in server_filter if key not in VOLATILE_FILTER_FIELDS)
 
 
 def apply_pre_filters(
     servers: list[Server], server_filter: ServerFilter
 ) -> list[Server]:
     """
-    Make new filters such that the filter criteria is only ones that don't vary often
-    (e.g cc, region, map, ip_port)
+    Apply only the filter criteria that don't vary often
+    (e.g cc, region, ip_port)
+    """
+    return FILTER_PLANS.get(server_filter, pre_filter_fields(server_filter)).apply(servers)
+
+
+def apply_static_filters(
+    servers: list[Server], server_filter: ServerFilter
+) -> list[Server]:
+    """
+    Apply only the filters that can be checked before any server is pinged or queried
+    (server_id, region, cc, ip_port and distance).
     """
-    pre_filters = deepcopy(server_filter)
-    pre_filters["players"] = {"min": None, "max": None}
-    pre_filters["map"] = {"values": [], "exclude": True}
-    pre_filters["slots"] = {"min": None, "max": None}
-    pre_filters["since_played"] = {"min": None, "max": None}
-    return apply_filters(servers, pre_filters)
+    return FILTER_PLANS.get(server_filter, STATIC_FILTER_FIELDS).apply(servers)
@@ -0,0 +1,121 @@
+import os
+import time
+from typing import TYPE_CHECKING
+
+from models import Server
+
+if TYPE_CHECKING:
+    from server_history import HistoryPartition
+
+# Recording side of the server population history (see server_history).
+# The partitions need numpy, which is only imported with the first partition
+# opened, when refreshed servers are recorded: configuring the store at start
+# costs nothing.
+
+HISTORY_DIRECTORY = "cache/history"
+DAY = 24 * 60 * 60
+DEFAULT_INTERVAL = 60.0
+DEFAULT_RETENTION_DAYS = 30
+INT16_MAX = 2**15 - 1
+
+
+def partition_name(day_start: int) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(day_start))
+
+
+class HistoryStore:
+    def __init__(
+        self,
+        directory: str = HISTORY_DIRECTORY,
+        interval: float = DEFAULT_INTERVAL,
+        retention_days: int = DEFAULT_RETENTION_DAYS,
+    ):
+        self.directory: str = directory
+        self.enabled: bool = True
+        self.interval: float = interval
+        self.retention_days: int = retention_days
+        self.partition: "HistoryPartition | None" = None
+
+    def configure(self, enabled: bool, interval: float, retention_days: int):
+        self.enabled = enabled
+        self.interval = interval
+        self.retention_days = retention_days
+
+    def open_partition(self, now: float) -> "HistoryPartition":
+        from server_history import HistoryPartition
+
+        day_start = int(now // DAY) * DAY
+        if (
+            self.partition is None
+            or self.partition.day_start != day_start
+            or self.partition.stale()
+        ):
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+            self.partition = HistoryPartition(self.directory, day_start)
+            self.expire(day_start)
+        return self.partition
+
+    def expire(self, day_start: int):
+        """
+        Delete the partitions older than the retention.
+        """
+        oldest = partition_name(day_start - self.retention_days * DAY)
+        for file_name in os.listdir(self.directory):
+            name, extension = os.path.splitext(file_name)
+            if extension in (".bin", ".json") and name < oldest:
+                try:
+                    os.remove(os.path.join(self.directory, file_name))
+                except OSError as e:
+                    print(f"Error deleting history partition in HistoryStore.expire: {e}")
+
+    def record(self, servers: list[Server], now: float | None = None):
+        """
+        Append the current population of the servers that answered
+        and were not recorded in the last interval.
+        """
+        if not self.enabled or not servers:
+            return
+        if now is None:
+            now = time.time()
+        try:
+            partition = self.open_partition(now)
+            rows: list[tuple[int, int, int, int, int, int]] = []
+            offset = int(now - partition.day_start)
+            for server in servers:
+                # Never answered, or values masked in the cache
+                if server["max_players"] <= 0:
+                    continue
+                last_time = partition.last_time.get(server["ip_port"], -self.interval)
+                if now - last_time < self.interval:
+                    continue
+                # Only recorded servers get an index, so the index is always
+                # written along with records, which other writers notice
+                index = partition.server_index(server)
+                values = (
+                    min(max(server["humans"], 0), INT16_MAX),
+                    min(max(server["bots"], 0), INT16_MAX),
+                    min(server["max_players"], INT16_MAX),
+                )
+                previous = partition.last.get(index, (0, 0, 0))
+                rows.append(
+                    (
+                        offset,
+                        index,
+                        values[0] - previous[0],
+                        values[1] - previous[1],
+                        values[2] - previous[2],
+                        partition.map_index(server["map"]),
+                    )
+                )
+                partition.last[index] = values
+                partition.last_time[server["ip_port"]] = now
+            if partition.index_changed:
+                partition.write_index()
+            if rows:
+                partition.append(rows)
+        except OSError as e:
+            print(f"Error writing server history in HistoryStore.record: {e}")
+
+
+HISTORY = HistoryStore()
@@ -0,0 +1,99 @@
+import json
+import os
+import time
+
+from models import LatencyCacheEntry, LatencyStats
+
+# Latency per ip, kept in memory and in ./cache/latency.json.
+# Latency to a datacenter barely changes over minutes, so a refresh only probes
+# ips whose entry is missing, expired or not trustworthy enough.
+
+LATENCY_FILE = "cache/latency.json"
+DEFAULT_TTL = 15 * 60.0
+# Samples needed for full confidence in an entry. Confidence starts at the floor,
+# so a single good sample stays trusted for most of the TTL.
+FULL_CONFIDENCE_SAMPLES = 3
+SAMPLE_CONFIDENCE_FLOOR = 0.5
+# Entries below this confidence are probed again
+MIN_CONFIDENCE = 0.3
+
+LATENCY_CACHE: dict[str, LatencyCacheEntry] = {}
+_latency_loaded = False
+# Entries stored since the cache was last written
+_latency_changed = False
+
+
+def load_latency_cache():
+    """
+    Load the latency cache from ./cache/latency.json once per process.
+    """
+    global _latency_loaded
+    if _latency_loaded:
+        return
+    _latency_loaded = True
+    try:
+        with open(LATENCY_FILE, "r") as file:
+            LATENCY_CACHE.update(json.load(file))
+    except FileNotFoundError:
+        pass
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"Error reading latency cache in load_latency_cache: {e}")
+
+
+def write_latency_cache_to_file():
+    """
+    Save the latency cache to ./cache/latency.json, if it changed.
+    Create cache directory if it doesn't exist.
+    """
+    global _latency_changed
+    if not _latency_changed:
+        return
+    _latency_changed = False
+    try:
+        if not os.path.exists("cache"):
+            os.makedirs("cache")
+        with open(LATENCY_FILE, "w") as file:
+            json.dump(LATENCY_CACHE, file)
+    except OSError as e:
+        print(f"Error writing latency cache in write_latency_cache_to_file: {e}")
+
+
+def latency_confidence(
+    entry: LatencyCacheEntry, ttl: float = DEFAULT_TTL, now: float | None = None
+) -> float:
+    """
+    Confidence in a cache entry from 0 to 1.
+    Grows with the number of samples, shrinks with packet loss and decays linearly to 0 at the TTL.
+    """
+    if now is None:
+        now = time.time()
+    age = now - entry["measured_at"]
+    if age >= ttl or entry["stats"]["median"] < 0:
+        return 0.0
+    sample_confidence = SAMPLE_CONFIDENCE_FLOOR + (1 - SAMPLE_CONFIDENCE_FLOOR) * min(
+        1.0, entry["samples"] / FULL_CONFIDENCE_SAMPLES
+    )
+    loss_confidence = 1 - max(0.0, entry["stats"]["loss"]) / 100
+    return sample_confidence * loss_confidence * (1 - age / ttl)
+
+
+def get_cached_latency(
+    ip: str, ttl: float = DEFAULT_TTL, now: float | None = None
+) -> LatencyStats | None:
+    """
+    Cached latency for an ip, or None if it is missing, expired or not confident enough.
+    """
+    load_latency_cache()
+    entry = LATENCY_CACHE.get(ip)
+    if entry is None or latency_confidence(entry, ttl, now) < MIN_CONFIDENCE:
+        return None
+    return entry["stats"]
+
+
+def store_latency(ip: str, stats: LatencyStats, samples: int, now: float | None = None):
+    global _latency_changed
+    load_latency_cache()
+    _latency_changed = True
+    if now is None:
+        now = time.time()
+    LATENCY_CACHE[ip] = {"stats": stats, "samples": samples, "measured_at": now}
@@ -0,0 +1,198 @@
+import asyncio
+import itertools
+import socket
+import struct
+import time
+
+from a2s_engine import A2S_INFO_REQUEST, A2SEngine
+from filtered_view import CHANGE_LOG, snapshot_fields
+from models import LatencyStats, Server
+
+# In-process latency prober.
+# Uses an unprivileged ICMP datagram socket ("ping socket") where the kernel allows it
+# (Linux with net.ipv4.ping_group_range covering our group, macOS),
+# and falls back to timing an A2S_INFO round trip over UDP otherwise.
+# Every probe of a refresh goes through a single socket.
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMP_HEADER = struct.Struct("!BBHHH")
+ICMP_PAYLOAD = b"tf2-server-scout"
+# Port used for the A2S fallback when only an ip is known
+DEFAULT_GAME_PORT = 27015
+LATENCY_FIELDS = ("ping", "ping_median", "ping_p90", "ping_jitter", "ping_loss")
+
+
+def latency_stats(samples: list[float]) -> LatencyStats:
+    """
+    Summarize latency samples in ms, in the order they were taken (-1 for a lost sample).
+    """
+    if not samples:
+        return {"median": -1, "p90": -1, "jitter": -1, "loss": -1}
+    received = [sample for sample in samples if sample >= 0]
+    loss = 100 * (len(samples) - len(received)) / len(samples)
+    if not received:
+        return {"median": -1, "p90": -1, "jitter": -1, "loss": loss}
+    ordered = sorted(received)
+    count = len(ordered)
+    median = ordered[count // 2]
+    if count % 2 == 0:
+        median = (ordered[count // 2 - 1] + median) / 2
+    p90 = ordered[min(count - 1, int(count * 0.9))]
+    jitter = 0.0
+    if count > 1:
+        jitter = sum(
+            abs(received[i] - received[i - 1]) for i in range(1, count)
+        ) / (count - 1)
+    return {"median": median, "p90": p90, "jitter": jitter, "loss": loss}
+
+
+def apply_latency_stats(server: Server, stats: LatencyStats):
+    """
+    Write latency statistics into a server.
+    ping is set to the median so a single spike does not push a server over the ping filter.
+    """
+    before = snapshot_fields(server, LATENCY_FIELDS)
+    server["ping"] = stats["median"]
+    server["ping_median"] = stats["median"]
+    server["ping_p90"] = stats["p90"]
+    server["ping_jitter"] = stats["jitter"]
+    server["ping_loss"] = stats["loss"]
+    CHANGE_LOG.mark_if_changed(server, before)
+
+
+def icmp_checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def build_echo_request(sequence: int) -> bytes:
+    header = ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, 0, sequence)
+    checksum = icmp_checksum(header + ICMP_PAYLOAD)
+    return ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, checksum, 0, sequence) + ICMP_PAYLOAD
+
+
+def open_icmp_socket() -> socket.socket | None:
+    """
+    Open an unprivileged ICMP datagram socket, or return None if the kernel does not allow it.
+    """
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+    except (OSError, AttributeError):
+        return None
+    sock.setblocking(False)
+    return sock
+
+
+class IcmpProber(asyncio.DatagramProtocol):
+    """
+    Sends ICMP echo requests to any number of hosts from one ping socket.
+    The kernel rewrites the echo identifier, so replies are matched by source ip and sequence.
+    """
+
+    def __init__(self):
+        self.transport: asyncio.DatagramTransport | None = None
+        self.pending: dict[tuple[str, int], tuple[asyncio.Future[float], float]] = {}
+        self.sequences = itertools.count(1)
+
+    @classmethod
+    async def create(cls) -> "IcmpProber | None":
+        sock = open_icmp_socket()
+        if sock is None:
+            return None
+        loop = asyncio.get_running_loop()
+        _, prober = await loop.create_datagram_endpoint(cls, sock=sock)
+        return prober
+
+    def connection_made(self, transport: asyncio.BaseTransport):
+        assert isinstance(transport, asyncio.DatagramTransport)
+        self.transport = transport
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]):
+        now = time.monotonic()
+        # macOS includes the IP header on ping sockets, Linux does not
+        if len(data) >= 20 and data[0] >> 4 == 4:
+            data = data[(data[0] & 0x0F) * 4:]
+        if len(data) < ICMP_HEADER.size:
+            return
+        kind, _, _, _, sequence = ICMP_HEADER.unpack_from(data)
+        if kind != ICMP_ECHO_REPLY:
+            return
+        entry = self.pending.get((addr[0], sequence))
+        if entry is None:
+            return
+        future, sent_at = entry
+        if not future.done():
+            future.set_result((now - sent_at) * 1000)
+
+    def error_received(self, exc: Exception):
+        pass
+
+    async def probe(self, ip: str, timeout: float) -> float:
+        """
+        Send one echo request and return the round trip time in ms.
+        Raises TimeoutError if no reply arrives in time.
+        """
+        if self.transport is None:
+            raise OSError("ICMP prober is closed")
+        sequence = next(self.sequences) & 0xFFFF
+        key = (ip, sequence)
+        future: asyncio.Future[float] = asyncio.get_running_loop().create_future()
+        self.pending[key] = (future, time.monotonic())
+        try:
+            self.transport.sendto(build_echo_request(sequence), (ip, 0))
+            async with asyncio.timeout(timeout):
+                return await future
+        finally:
+            del self.pending[key]
+
+
+class LatencyProber:
+    """
+    Measures latency with ICMP when available, else with an A2S_INFO round trip.
+    """
+
+    def __init__(self, icmp: IcmpProber | None, engine: A2SEngine):
+        self.icmp: IcmpProber | None = icmp
+        self.engine: A2SEngine = engine
+
+    @classmethod
+    async def create(cls) -> "LatencyProber":
+        return cls(await IcmpProber.create(), await A2SEngine.create())
+
+    async def __aenter__(self) -> "LatencyProber":
+        return self
+
+    async def __aexit__(self, *_):
+        self.close()
+
+    def close(self):
+        if self.icmp is not None:
+            self.icmp.close()
+        self.engine.close()
+
+    @property
+    def method(self) -> str:
+        return "icmp" if self.icmp is not None else "a2s"
+
+    async def probe(self, ip: str, port: int, timeout: float) -> float:
+        """
+        Measure the round trip time to a server in ms.
+        Raises TimeoutError if the server does not answer in time.
+        """
+        if self.icmp is not None:
+            return await self.icmp.probe(ip, timeout)
+        # Any reply (info or challenge) is enough to time the round trip
+        _, rtt = await self.engine.request(
+            (ip, port), A2S_INFO_REQUEST, None, timeout, attempts=1
+        )
+        return rtt * 1000
@@ -1,14 +1,23 @@
 import argparse
 
+from filters import filters_changed
+from history_store import HISTORY
 from options import read_options, write_options
 from server_main import (
+    CachedServers,
     clean_write_servers_to_file,
+    export_servers_to_json,
+    import_servers_from_json,
     read_servers_from_file,
+    servers_need_writing,
     update_cache_uncle,
 )
-from ui_main import auto_join, quick_print
+from ui_main import auto_join, print_history, quick_print, quick_print_from_daemon
 from ui_menus import main_menu
 
+# Modules needing asyncio, requests or numpy are imported where they are used,
+# see benchmarks/bench_startup.py for the paths that must start without them.
+
 # Parse arguments
 parser = argparse.ArgumentParser(
     prog="uncletopia",
@@ -50,25 +59,120 @@ _ = parser.add_argument(
     action="store_true",
 )
 
+_ = parser.add_argument(
+    "-l",
+    "--limit",
+    help="Only print the first N servers with quick print",
+    type=int,
+)
+
+_ = parser.add_argument(
+    "-D",
+    "--daemon",
+    help="Run the scout daemon, keeping servers refreshed for other invocations",
+    action="store_true",
+)
+
+_ = parser.add_argument(
+    "-N",
+    "--no-daemon",
+    help="Do not use a running scout daemon",
+    action="store_true",
+)
+
+_ = parser.add_argument(
+    "-v",
+    "--verbose",
+    help="Print the challenge cache and player query savings after each refresh",
+    action="store_true",
+)
+
+_ = parser.add_argument(
+    "--export-servers",
+    help="Export the cached servers to a JSON file and exit",
+    metavar="PATH",
+)
+
+_ = parser.add_argument(
+    "--import-servers",
+    help="Replace the cached servers with the ones of a JSON file and exit",
+    metavar="PATH",
+)
+
+subparsers = parser.add_subparsers(dest="command")
+history_parser = subparsers.add_parser(
+    "history",
+    help="Query the recorded server population history",
+    description="humans: statistics of humans on a server between two hours of the day\n"
+    + "busiest: busiest servers per region right now, against their typical population",
+)
+_ = history_parser.add_argument("query", choices=["humans", "busiest"])
+_ = history_parser.add_argument(
+    "-s", "--server", help="ip:port, server id or part of the name of the server"
+)
+_ = history_parser.add_argument(
+    "-H", "--hours", help="Local time range, like 18-22", default="0-24"
+)
+_ = history_parser.add_argument(
+    "-d", "--days", help="Number of days to look back", type=int, default=14
+)
+_ = history_parser.add_argument("-r", "--region", help="Only show this region")
+_ = history_parser.add_argument(
+    "-t", "--top", help="Servers shown per region", type=int, default=5
+)
+
 if __name__ == "__main__":
     args = parser.parse_args()
     options = read_options()
+    HISTORY.configure(
+        options["misc"]["record_history"],
+        options["misc"]["history_interval"],
+        options["misc"]["history_retention_days"],
+    )
+    if args.command == "history":
+        print_history(args)
+        exit(0)
+    if args.export_servers:
+        export_servers_to_json(read_servers_from_file(), args.export_servers)
+        exit(0)
+    if args.import_servers:
+        imported = import_servers_from_json(args.import_servers)
+        if not imported:
+            print(f"No servers found in {args.import_servers}")
+            exit(1)
+        clean_write_servers_to_file(imported)
+        exit(0)
+    if args.daemon:
+        from scout_daemon import run_daemon
+
+        run_daemon(args, options)
+        exit(0)
+    if args.quick_print and quick_print_from_daemon(args, options):
+        exit(0)
     server_list = []
+    cached: CachedServers | None = None
     if options["misc"]["cache_uncletopia_state"]:
-        server_list = read_servers_from_file()
-        if not server_list:
+        if args.auto_join and not args.no_daemon:
+            # Decoded as far as needed, the daemon usually answers with a few servers
+            cached = CachedServers()
+            if len(cached) == 0:
+                cached = None
+        if cached is None:
+            server_list = read_servers_from_file()
+        if cached is None and not server_list:
             print("No servers found in cache, updating cache")
             server_list, new_max_distance = update_cache_uncle(
                 options["misc"]["auto_distance_calculation"]
             )
             if new_max_distance is not None:
                 options["filters"]["distance"]["max"] = new_max_distance
-        if not server_list:
+                filters_changed()
+        if cached is None and not server_list:
             print("Could not get server list from cache or API")
             exit(1)
 
     if args.auto_join:
-        auto_join(args, server_list, options)
+        auto_join(args, server_list if cached is None else cached, options)
 
     elif args.quick_print:
         quick_print(args, server_list, options)
@@ -77,7 +181,7 @@ if __name__ == "__main__":
         main_menu(args, server_list, options)
 
     write_options(options)
-    # Used to only write to file if the cache was dirty
-    # Now, always write to file to keep each server's last_played time up to date
-    if options["misc"]["cache_uncletopia_state"]:
-        clean_write_servers_to_file(server_list)
+    # last_played changes are already in the played journal,
+    # the snapshot is only rewritten if something else changed
+    if options["misc"]["cache_uncletopia_state"] and servers_need_writing():
+        clean_write_servers_to_file(server_list if cached is None else cached.servers())
@@ -0,0 +1,148 @@
+import asyncio
+import ipaddress
+import socket
+import struct
+from collections.abc import AsyncIterator
+
+from a2s_engine import HEADER_SIMPLE, Address
+from options import DEFAULT_MASTER_FILTER
+
+# Client for the Valve master server query protocol.
+# The master server answers with pages of server addresses, each page is requested
+# by sending the last address of the previous page as the seed.
+# The last page ends with 0.0.0.0:0.
+# https://developer.valvesoftware.com/wiki/Master_Server_Query_Protocol
+
+MASTER_QUERY = 0x31
+MASTER_RESPONSE_HEADER = HEADER_SIMPLE + b"\x66\x0a"
+MASTER_ADDRESS = struct.Struct("!4sH")
+REGION_ALL = 0xFF
+# Seed of the first page and terminator of the last one
+END_ADDRESS: Address = ("0.0.0.0", 0)
+DEFAULT_PAGE_TIMEOUT = 2.0
+DEFAULT_PAGE_ATTEMPTS = 3
+
+
+def parse_master_address(address: str) -> Address:
+    """
+    Parse "host:port" into a (host, port) tuple.
+    """
+    host, _, port = address.rpartition(":")
+    return host, int(port)
+
+
+def build_master_request(seed: Address, filter_string: str, region: int = REGION_ALL) -> bytes:
+    return (
+        bytes((MASTER_QUERY, region))
+        + f"{seed[0]}:{seed[1]}".encode() + b"\x00"
+        + filter_string.encode() + b"\x00"
+    )
+
+
+def parse_master_response(data: bytes) -> list[Address]:
+    """
+    Parse one page of a master server response into server addresses.
+    Returns an empty list if the packet is not a master server response.
+    """
+    if not data.startswith(MASTER_RESPONSE_HEADER):
+        return []
+    offset = len(MASTER_RESPONSE_HEADER)
+    count = (len(data) - offset) // MASTER_ADDRESS.size
+    return [
+        (str(ipaddress.IPv4Address(packed_ip)), port)
+        for packed_ip, port in MASTER_ADDRESS.iter_unpack(
+            data[offset: offset + count * MASTER_ADDRESS.size]
+        )
+    ]
+
+
+class MasterServerClient(asyncio.DatagramProtocol):
+    """
+    Streams the server list of one master server, page by page.
+    """
+
+    def __init__(self):
+        self.transport: asyncio.DatagramTransport | None = None
+        self.pages: asyncio.Queue[bytes] = asyncio.Queue()
+
+    @classmethod
+    async def create(cls, address: Address) -> "MasterServerClient":
+        loop = asyncio.get_running_loop()
+        _, client = await loop.create_datagram_endpoint(
+            cls, remote_addr=address, family=socket.AF_INET
+        )
+        return client
+
+    async def __aenter__(self) -> "MasterServerClient":
+        return self
+
+    async def __aexit__(self, *_):
+        self.close()
+
+    def connection_made(self, transport: asyncio.BaseTransport):
+        assert isinstance(transport, asyncio.DatagramTransport)
+        self.transport = transport
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]):
+        self.pages.put_nowait(data)
+
+    def error_received(self, exc: Exception):
+        pass
+
+    async def request_page(
+        self, seed: Address, filter_string: str, region: int, timeout: float, attempts: int
+    ) -> list[Address]:
+        """
+        Request the page following `seed`, resending it if no answer arrives in time.
+        Raises TimeoutError after `attempts` unanswered requests.
+        """
+        if self.transport is None:
+            raise OSError("Master server client is closed")
+        request = build_master_request(seed, filter_string, region)
+        for attempt in range(attempts):
+            # Drop late answers to an earlier attempt
+            while not self.pages.empty():
+                self.pages.get_nowait()
+            self.transport.sendto(request)
+            try:
+                async with asyncio.timeout(timeout):
+                    while True:
+                        addresses = parse_master_response(await self.pages.get())
+                        if addresses:
+                            return addresses
+            except TimeoutError:
+                if attempt == attempts - 1:
+                    raise
+        raise TimeoutError
+
+    async def stream(
+        self,
+        filter_string: str = DEFAULT_MASTER_FILTER,
+        region: int = REGION_ALL,
+        timeout: float = DEFAULT_PAGE_TIMEOUT,
+        attempts: int = DEFAULT_PAGE_ATTEMPTS,
+    ) -> AsyncIterator[list[Address]]:
+        """
+        Yield the server addresses of every page as soon as the page arrives,
+        without duplicates.
+        """
+        seen: set[Address] = set()
+        seed = END_ADDRESS
+        while True:
+            addresses = await self.request_page(seed, filter_string, region, timeout, attempts)
+            new_addresses = [
+                address
+                for address in addresses
+                if address != END_ADDRESS and address not in seen
+            ]
+            seen.update(new_addresses)
+            if new_addresses:
+                yield new_addresses
+            if addresses[-1] == END_ADDRESS or not new_addresses:
+                return
+            seed = addresses[-1]
@@ -23,15 +23,56 @@ class Server(TypedDict):
     humans: int
     # Fields not given by the Uncletopia API
     ping: float
+    ping_median: float
+    ping_p90: float
+    ping_jitter: float
+    ping_loss: float
     slots: int
     ip_port: str
     last_played: float
     since_played: float
 
 
+class LatencyStats(TypedDict):
+    # All latencies in ms, -1 when no sample was received
+    median: float
+    p90: float
+    # Mean absolute difference between consecutive samples
+    jitter: float
+    # Percentage of samples lost, -1 when no sample was sent
+    loss: float
+
+
+class LatencyCacheEntry(TypedDict):
+    stats: LatencyStats
+    # Number of samples the stats were computed from
+    samples: int
+    # time.time() of the measurement
+    measured_at: float
+
+
+class ServerHealth(TypedDict):
+    # Recent round trip times in ms, oldest first, -1 for a lost sample
+    rtts: list[float]
+    # Consecutive failed queries
+    failures: int
+    # "closed" (healthy), "open" (skipped until open_until) or "half_open" (one trial query)
+    state: str
+    open_until: float
+    # When the trial query of a half open circuit was allowed
+    half_open_at: float
+
+
+class SortKey(TypedDict):
+    sort_by: str
+    reverse: bool
+
+
 class SortServerOptions(TypedDict):
     sort_by: str
     reverse: bool
+    # Tie-breakers, in order
+    then_by: list[SortKey]
 
 
 class ListFilter(TypedDict):
@@ -54,6 +95,10 @@ class ServerFilter(TypedDict):
     map: ListFilter
     distance: RangeFilter
     ping: RangeFilter
+    ping_median: RangeFilter
+    ping_p90: RangeFilter
+    ping_jitter: RangeFilter
+    ping_loss: RangeFilter
     slots: RangeFilter
     ip_port: ListFilter
     since_played: RangeFilter
@@ -88,10 +133,27 @@ class MiscOptions(TypedDict):
     disable_colors: bool
     compact_output: bool
     fast_grid_calculation: bool
+    history_interval: float
+    history_retention_days: int
+    latency_cache_ttl: float
+    master_server: str
+    master_server_filter: str
+    max_concurrent_queries: int
+    max_poll_interval: float
+    min_poll_interval: float
+    ping_sample_spread: float
+    ping_samples: int
     play_sound_on_join: bool
+    player_snapshot_ttl: float
+    query_budget: float
     query_steam: bool
+    record_history: bool
+    server_providers: list[str]
+    refresh_deadline: float
     refresh_interval: float
     steam_username: str
+    tracked_usernames: list[str]
+    uncle_refresh_interval: float
     update_last_played_on_join_new_server: bool
     use_emojis: bool
     use_icons: bool
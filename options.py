@@ -1,11 +1,36 @@
 import json
+import marshal
+import os
 from copy import deepcopy
+from typing import Any
 
 from filters import get_default_filters
-from models import DisplayLine, Options
+from models import DisplayLine, DisplayLineCompiled, Options
 from object_grid.grid_layout import GridLayout
 from server_sort import get_default_sort
-from user_template import compile_template
+from user_template import TemplateFunction, TemplateParts, build_template, parse_template
+
+# Options are read from ./options.json.
+# A start with an unchanged options file reads ./cache/options.cache instead:
+# the options with missing ones already filled in, and every display template
+# already parsed, in marshal format.
+# Display templates are only compiled when a display is first used.
+
+OPTIONS_FILE = "options.json"
+OPTIONS_CACHE_FILE = "cache/options.cache"
+OPTIONS_CACHE_VERSION = 1
+
+# Defaults of options that are also used by code called without options.
+# Kept here so reading the options doesn't import the network code.
+DEFAULT_MASTER_SERVER = "hl2master.steampowered.com:27011"
+DEFAULT_MASTER_FILTER = "\\gamedir\\tf"
+# Maximum time a whole refresh (HTTP fetch + pings + A2S queries) may take
+DEFAULT_DEADLINE = 10.0
+# Maximum number of pings / A2S queries in flight at the same time
+DEFAULT_CONCURRENCY = 64
+
+# Parsed display templates, by template
+TEMPLATE_PARTS: dict[str, TemplateParts] = {}
 
 DEFAULT_OPTIONS: Options = {
     "filters": get_default_filters(),
@@ -69,10 +94,27 @@ DEFAULT_OPTIONS: Options = {
         "disable_colors": False,
         "compact_output": False,
         "fast_grid_calculation": False,
+        "history_interval": 60,
+        "history_retention_days": 30,
+        "latency_cache_ttl": 900,
+        "master_server": DEFAULT_MASTER_SERVER,
+        "master_server_filter": DEFAULT_MASTER_FILTER,
+        "max_concurrent_queries": DEFAULT_CONCURRENCY,
+        "max_poll_interval": 30,
+        "min_poll_interval": 1,
+        "ping_sample_spread": 1.0,
+        "ping_samples": 3,
         "play_sound_on_join": True,
+        "player_snapshot_ttl": 60,
+        "query_budget": 20,
         "query_steam": True,
+        "record_history": True,
+        "server_providers": ["uncletopia"],
+        "refresh_deadline": DEFAULT_DEADLINE,
         "refresh_interval": 5,
         "steam_username": "",
+        "tracked_usernames": [],
+        "uncle_refresh_interval": 300,
         "update_last_played_on_join_new_server": False,
         "use_emojis": False,
         "use_icons": False,
@@ -89,45 +131,147 @@ def write_options(options: Options):
     options_copy["display"]["grid_display_compiled"] = None
     options_copy["display"]["join_display_compiled"] = None
     try:
-        with open("options.json", "w") as f:
+        # Written aside and renamed, an interrupted write would lose every option
+        temp_path = f"{OPTIONS_FILE}.tmp"
+        with open(temp_path, "w") as f:
             json.dump(options_copy, f, indent=4)
+        os.replace(temp_path, OPTIONS_FILE)
     except Exception as e:
         print(f"Error writing options file: {e}")
 
 
-def compile_display_options(options: Options):
-    options["display"]["grid_display_compiled"] = [
-        {
-            "left": compile_template(line["left"]),
-            "middle": compile_template(line["middle"]),
-            "right": compile_template(line["right"]),
-            "empty": line["empty"],
-        }
-        for line in options["display"]["grid_display"]
-    ]
-    options["display"]["join_display_compiled"] = [
+def template_function(template: str) -> TemplateFunction:
+    parts = TEMPLATE_PARTS.get(template)
+    if parts is None:
+        parts = parse_template(template)
+        TEMPLATE_PARTS[template] = parts
+    return build_template(parts)
+
+
+def compile_display_lines(lines: list[DisplayLine]) -> list[DisplayLineCompiled]:
+    return [
         {
-            "left": compile_template(line["left"]),
-            "middle": compile_template(line["middle"]),
-            "right": compile_template(line["right"]),
+            "left": template_function(line["left"]),
+            "middle": template_function(line["middle"]),
+            "right": template_function(line["right"]),
             "empty": line["empty"],
         }
-        for line in options["display"]["join_display"]
+        for line in lines
     ]
 
 
+def compile_display_options(options: Options):
+    options["display"]["grid_display_compiled"] = compile_display_lines(
+        options["display"]["grid_display"]
+    )
+    options["display"]["join_display_compiled"] = compile_display_lines(
+        options["display"]["join_display"]
+    )
+
+
+def get_grid_display(options: Options) -> list[DisplayLineCompiled]:
+    """
+    The compiled grid display, compiled on first use.
+    """
+    display = options["display"]
+    if display["grid_display_compiled"] is None:
+        display["grid_display_compiled"] = compile_display_lines(display["grid_display"])
+    return display["grid_display_compiled"]
+
+
+def get_join_display(options: Options) -> list[DisplayLineCompiled]:
+    """
+    The compiled join display, compiled on first use.
+    """
+    display = options["display"]
+    if display["join_display_compiled"] is None:
+        display["join_display_compiled"] = compile_display_lines(display["join_display"])
+    return display["join_display_compiled"]
+
+
+def parse_display_templates(options: Options):
+    for key in ("grid_display", "join_display"):
+        for line in options["display"][key]:
+            for part in ("left", "middle", "right"):
+                if line[part] not in TEMPLATE_PARTS:
+                    TEMPLATE_PARTS[line[part]] = parse_template(line[part])
+
+
+def fill_missing_options(options: Options):
+    """
+    Add options that were introduced after the options file was written.
+    """
+    for section, defaults in DEFAULT_OPTIONS.items():
+        if section not in options:
+            options[section] = deepcopy(defaults)
+            continue
+        if section == "filters" or section == "misc" or section == "server_sort":
+            for key, value in defaults.items():
+                if key not in options[section]:
+                    options[section][key] = deepcopy(value)
+
+
+def options_cache_key(text: bytes) -> tuple[Any, ...]:
+    """
+    What a cached copy of the options depends on: the options file, and the
+    options this version knows about, which fill_missing_options added.
+    """
+    known = tuple(
+        (section, tuple(values) if isinstance(values, dict) else ())
+        for section, values in DEFAULT_OPTIONS.items()
+    )
+    return OPTIONS_CACHE_VERSION, known, text
+
+
+def read_options_cache(key: tuple[Any, ...]) -> Options | None:
+    try:
+        with open(OPTIONS_CACHE_FILE, "rb") as f:
+            cached_key, options, template_parts = marshal.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError, TypeError) as e:
+        print(f"Error reading options cache in read_options_cache: {e}")
+        return None
+    if cached_key != key:
+        return None
+    TEMPLATE_PARTS.update(template_parts)
+    return options
+
+
+def write_options_cache(key: tuple[Any, ...], options: Options):
+    parse_display_templates(options)
+    try:
+        if not os.path.exists("cache"):
+            os.makedirs("cache")
+        temp_path = f"{OPTIONS_CACHE_FILE}.tmp"
+        with open(temp_path, "wb") as f:
+            _ = f.write(marshal.dumps((key, options, TEMPLATE_PARTS)))
+        os.replace(temp_path, OPTIONS_CACHE_FILE)
+    except (OSError, ValueError) as e:
+        print(f"Error writing options cache in write_options_cache: {e}")
+
+
 def read_options() -> Options:
+    """
+    Read the options, from the options cache if the options file didn't change.
+    Display templates are compiled on first use, see get_grid_display.
+    """
     try:
-        with open("options.json", "r") as f:
-            options: Options = json.load(f)
-        compile_display_options(options)
-        return options
+        with open(OPTIONS_FILE, "rb") as f:
+            text = f.read()
     except FileNotFoundError:
         print("No options file found, creating a new one.")
         write_options(DEFAULT_OPTIONS)
-        options = get_default_options()
-        compile_display_options(options)
-        return options
+        return get_default_options()
+    key = options_cache_key(text)
+    options = read_options_cache(key)
+    if options is None:
+        options = json.loads(text)
+        fill_missing_options(options)
+        options["display"]["grid_display_compiled"] = None
+        options["display"]["join_display_compiled"] = None
+        write_options_cache(key, options)
+    return options
 
 
 def display_lines_to_string(options: list[DisplayLine]):
@@ -0,0 +1,210 @@
+import os
+import struct
+import time
+import zlib
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from filtered_view import CHANGE_LOG
+from models import Server
+
+try:
+    import fcntl
+except ImportError:
+    # Not on Windows, appends and compaction are not locked there
+    fcntl = None
+
+# Append-only journal of last_played changes, in ./cache/played.journal.
+# Joining a server (or undoing the join) appends one small entry instead of
+# rewriting the server snapshot. The journal is replayed on top of the snapshot
+# when it is read, and compacted into the snapshot whenever the full snapshot
+# is written anyway, or once it grows past COMPACT_SIZE.
+# The journal starts with a random generation, then the entries.
+# Entry: crc32 of the rest, event, last_played, ip_port length, ip_port (utf-8).
+# A torn or corrupt entry ends the replay, entries before it are kept.
+# Other processes (the scout daemon, a second menu) share the journal, so appends
+# and compaction hold an exclusive lock on <journal>.lock. A compaction replaces
+# the journal with a new generation, which tells the other processes that their
+# offset in it is no longer valid.
+
+JOURNAL_FILE = "cache/played.journal"
+PLAYED_FIELDS = ("last_played", "since_played")
+GENERATION_SIZE = 8
+ENTRY = struct.Struct("<IBdH")
+EVENT_PLAYED = 0
+EVENT_UNDO = 1
+# Journal size above which it is compacted into the snapshot
+COMPACT_SIZE = 64 * 1024
+
+# Bytes of entries already applied to the servers of this process,
+# and the generation of the journal they were read from
+_journal_offset = 0
+_journal_generation: bytes | None = None
+
+
+@contextmanager
+def journal_lock(path: str) -> Iterator[None]:
+    """
+    Hold the exclusive lock of a journal, shared with the other processes.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", "ab") as file:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+def read_unapplied(path: str) -> tuple[bytes | None, int, bytes]:
+    """
+    Read the journal from the first entry not applied by this process.
+    Returns its generation (None if it has none yet), the offset read from and the data.
+    """
+    with open(path, "rb") as file:
+        generation = file.read(GENERATION_SIZE)
+        if len(generation) < GENERATION_SIZE:
+            return None, 0, b""
+        offset = _journal_offset if generation == _journal_generation else 0
+        _ = file.seek(GENERATION_SIZE + offset)
+        return generation, offset, file.read()
+
+
+def encode_entry(event: int, ip_port: str, last_played: float) -> bytes:
+    encoded = ip_port.encode()
+    body = ENTRY.pack(0, event, last_played, len(encoded))[4:] + encoded
+    return struct.pack("<I", zlib.crc32(body)) + body
+
+
+def read_entries(data: bytes) -> tuple[list[tuple[int, str, float]], int]:
+    """
+    Decode journal entries.
+    Returns the entries and the length of the valid part of the data.
+    """
+    entries: list[tuple[int, str, float]] = []
+    offset = 0
+    while offset + ENTRY.size <= len(data):
+        crc, event, last_played, length = ENTRY.unpack_from(data, offset)
+        end = offset + ENTRY.size + length
+        if end > len(data) or zlib.crc32(data[offset + 4: end]) != crc:
+            break
+        ip_port = data[offset + ENTRY.size: end].decode(errors="replace")
+        entries.append((event, ip_port, last_played))
+        offset = end
+    return entries, offset
+
+
+def append_entry(event: int, ip_port: str, last_played: float, path: str = JOURNAL_FILE):
+    try:
+        if not os.path.exists("cache"):
+            os.makedirs("cache")
+        # Not appended to a journal that a compaction is replacing
+        with journal_lock(path), open(path, "ab") as file:
+            entry = encode_entry(event, ip_port, last_played)
+            if file.tell() == 0:
+                entry = os.urandom(GENERATION_SIZE) + entry
+            _ = file.write(entry)
+    except OSError as e:
+        print(f"Error writing the played journal in append_entry: {e}")
+
+
+def journal_played(server: Server, event: int = EVENT_PLAYED):
+    """
+    Record the current last_played of a server.
+    """
+    append_entry(event, server["ip_port"], server["last_played"])
+
+
+def replay_journal(servers: list[Server], path: str = JOURNAL_FILE) -> int:
+    """
+    Apply the journal entries not applied yet to the servers.
+    Returns the number of entries applied.
+    """
+    global _journal_offset, _journal_generation
+    try:
+        generation, offset, data = read_unapplied(path)
+    except FileNotFoundError:
+        # Compacted away by another process
+        generation, offset, data = None, 0, b""
+    except OSError as e:
+        print(f"Error reading the played journal in replay_journal: {e}")
+        return 0
+    entries, length = read_entries(data)
+    _journal_offset = offset + length
+    _journal_generation = generation
+    if not entries:
+        return 0
+    by_ip_port = {server["ip_port"]: server for server in servers}
+    now = time.time()
+    for _, ip_port, last_played in entries:
+        server = by_ip_port.get(ip_port)
+        if server is None:
+            continue
+        server["last_played"] = last_played
+        server["since_played"] = -1 if last_played == -1 else now - last_played
+        CHANGE_LOG.mark(server, PLAYED_FIELDS)
+    return len(entries)
+
+
+def journal_last_played(path: str = JOURNAL_FILE) -> dict[str, float]:
+    """
+    Last journaled last_played of each ip_port, without marking anything applied.
+    For servers decoded one at a time, replay_journal still applies the journal
+    to the whole list later.
+    """
+    try:
+        with open(path, "rb") as file:
+            _ = file.seek(GENERATION_SIZE)
+            data = file.read()
+    except FileNotFoundError:
+        return {}
+    except OSError as e:
+        print(f"Error reading the played journal in journal_last_played: {e}")
+        return {}
+    entries, _ = read_entries(data)
+    return {ip_port: last_played for _, ip_port, last_played in entries}
+
+
+def journal_needs_compaction(path: str = JOURNAL_FILE) -> bool:
+    try:
+        return os.path.getsize(path) > COMPACT_SIZE
+    except OSError:
+        return False
+
+
+def compact_journal(path: str = JOURNAL_FILE):
+    """
+    Drop the entries applied so far, once the servers holding them are in the snapshot.
+    Entries appended since by another process are kept, as is the whole journal
+    if another process replaced it since it was replayed.
+    Call with journal_lock held, across the replay and the snapshot write.
+    """
+    global _journal_offset, _journal_generation
+    if not os.path.exists(path):
+        _journal_offset = 0
+        _journal_generation = None
+        return
+    try:
+        _, _, rest = read_unapplied(path)
+        # A torn entry left by a crash would stop every later replay
+        _, length = read_entries(rest)
+        rest = rest[:length]
+        if rest:
+            generation = os.urandom(GENERATION_SIZE)
+            temp_path = f"{path}.tmp"
+            with open(temp_path, "wb") as file:
+                _ = file.write(generation + rest)
+            os.replace(temp_path, path)
+        else:
+            generation = None
+            os.remove(path)
+        # Nothing of the new journal is applied yet
+        _journal_offset = 0
+        _journal_generation = generation
+    except FileNotFoundError:
+        _journal_offset = 0
+        _journal_generation = None
+    except OSError as e:
+        print(f"Error compacting the played journal in compact_journal: {e}")
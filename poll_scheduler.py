@@ -0,0 +1,301 @@
+import math
+import time
+from collections import deque
+
+from filters import apply_static_filters
+from models import Server, ServerFilter
+
+# Adaptive per-server polling for auto_join.
+# Each server keeps a short rolling window of its observed player counts, from
+# which player arrival and departure rates are estimated. From those, the chance
+# that a server passes the player and slot filters some seconds after it was
+# last seen is forecast: a full server as a two-state process (a slot opens
+# when a player leaves, closes when a joiner takes it), other player deficits
+# as Poisson counts of joins and leaves.
+# Due servers are polled likeliest to pass first, within a global budget of
+# A2S queries per second (a token bucket), and each server is due again once
+# its chance reaches POLL_CHANCE: a busy full server after a few seconds,
+# a server with no chance (wrong map, too far, dead) every max_interval.
+
+DEFAULT_QUERY_BUDGET = 20.0
+DEFAULT_MIN_INTERVAL = 1.0
+DEFAULT_MAX_INTERVAL = 30.0
+# Seconds of budget that can be saved up (lets the first pass query every server)
+BURST_SECONDS = 5.0
+# Deficit given to a server on an excluded map, maps only change between rounds
+MAP_DEFICIT = 8.0
+# Latency deficit is counted per this many ms over the filter
+PING_DEFICIT_STEP = 10.0
+# Chance of passing the filters at which a server is polled again
+POLL_CHANCE = 0.03
+# Player count samples kept per server, and how old they can be
+WINDOW_SAMPLES = 20
+WINDOW_SECONDS = 300.0
+# Prior rates, weighted as PRIOR_SECONDS of observation: one player joining per
+# PRIOR_SECONDS, and each player leaving after MEAN_SESSION seconds on average.
+# Departures refilled between two polls are never observed on a full server,
+# so the session prior is what gives it a chance of opening a slot.
+PRIOR_SECONDS = 120.0
+MEAN_SESSION = 900.0
+# Shortest wait tried by time_to_chance, min_poll_interval may be 0
+MIN_WAIT = 0.1
+
+
+def range_deficit(value: float, minimum: float | None, maximum: float | None) -> float:
+    if minimum is not None and value < minimum:
+        return minimum - value
+    if maximum is not None and value > maximum:
+        return value - maximum
+    return 0.0
+
+
+def static_deficit(server: Server, server_filter: ServerFilter) -> float:
+    """
+    How far a server is from passing the filters that player arrivals and
+    departures don't change. 0 means it passes them now.
+    """
+    deficit = 0.0
+    bots_filter = server_filter.get("bots")
+    if bots_filter is not None and "bots" in server:
+        deficit += range_deficit(server["bots"], bots_filter["min"], bots_filter["max"])
+    map_filter = server_filter.get("map")
+    if map_filter is not None and map_filter["values"]:
+        in_list = server["map"] in map_filter["values"]
+        if in_list == map_filter["exclude"]:
+            deficit += MAP_DEFICIT
+    ping_filter = server_filter.get("ping")
+    if ping_filter is not None and server["ping"] >= 0:
+        deficit += (
+            range_deficit(server["ping"], ping_filter["min"], ping_filter["max"])
+            / PING_DEFICIT_STEP
+        )
+    return deficit
+
+
+def poisson_at_least(count: float, mean: float) -> float:
+    """
+    Chance of at least `count` events of a Poisson process with the given mean.
+    """
+    needed = math.ceil(count)
+    if needed <= 0:
+        return 1.0
+    term = math.exp(-mean)
+    below = term
+    for i in range(1, needed):
+        term *= mean / i
+        below += term
+    return max(0.0, 1.0 - below)
+
+
+class ChurnWindow:
+    """
+    Recent player counts of one server.
+    """
+
+    def __init__(self):
+        self.samples: deque[tuple[float, int]] = deque(maxlen=WINDOW_SAMPLES)
+
+    def add(self, now: float, players: int):
+        self.samples.append((now, players))
+        while len(self.samples) > 2 and now - self.samples[0][0] > WINDOW_SECONDS:
+            self.samples.popleft()
+
+    def last_seen(self) -> float:
+        return self.samples[-1][0]
+
+    def rates(self, players: int) -> tuple[float, float]:
+        """
+        Player arrivals and departures per second, with the priors mixed in.
+        """
+        arrivals = 1.0
+        departures = players * PRIOR_SECONDS / MEAN_SESSION
+        duration = PRIOR_SECONDS
+        previous: tuple[float, int] | None = None
+        for sample in self.samples:
+            if previous is not None:
+                change = sample[1] - previous[1]
+                if change > 0:
+                    arrivals += change
+                else:
+                    departures -= change
+                duration += sample[0] - previous[0]
+            previous = sample
+        return arrivals / duration, departures / duration
+
+
+class SlotForecast:
+    """
+    Chance of each server passing the player and slot filters.
+    """
+
+    def __init__(self):
+        # Per server (ip:port)
+        self.windows: dict[str, ChurnWindow] = {}
+
+    def observe(self, server: Server, now: float):
+        window = self.windows.get(server["ip_port"])
+        if window is None:
+            window = ChurnWindow()
+            self.windows[server["ip_port"]] = window
+        window.add(now, server["players"])
+
+    def last_seen(self, server: Server) -> float | None:
+        window = self.windows.get(server["ip_port"])
+        return None if window is None else window.last_seen()
+
+    def chance(self, server: Server, server_filter: ServerFilter, elapsed: float) -> float:
+        """
+        Chance that the server passes the filters `elapsed` seconds after it was last seen.
+        1 for a server never seen, so every server is polled at least once.
+        """
+        window = self.windows.get(server["ip_port"])
+        if window is None:
+            return 1.0
+        if static_deficit(server, server_filter) > 0:
+            return 0.0
+        # Joins needed (players under the minimum, too many free slots)
+        # and leaves needed (players over the maximum, not enough free slots)
+        joins = leaves = 0.0
+        players_filter = server_filter.get("players")
+        if players_filter is not None:
+            joins = max(joins, (players_filter["min"] or 0) - server["players"])
+            if players_filter["max"] is not None:
+                leaves = max(leaves, server["players"] - players_filter["max"])
+        slots_filter = server_filter.get("slots")
+        if slots_filter is not None:
+            leaves = max(leaves, (slots_filter["min"] or 0) - server["slots"])
+            if slots_filter["max"] is not None:
+                joins = max(joins, server["slots"] - slots_filter["max"])
+        if joins <= 0 and leaves <= 0:
+            return 1.0
+        arrivals, departures = window.rates(server["players"])
+        if joins <= 0 and leaves <= 1 and server["slots"] <= 0:
+            # Full server: free a fraction departures / (arrivals + departures)
+            # of the time, reached at rate arrivals + departures
+            total = arrivals + departures
+            return departures / total * (1 - math.exp(-total * elapsed))
+        return poisson_at_least(joins, arrivals * elapsed) * poisson_at_least(
+            leaves, departures * elapsed
+        )
+
+    def time_to_chance(
+        self,
+        server: Server,
+        server_filter: ServerFilter,
+        target: float,
+        shortest: float,
+        longest: float,
+    ) -> float:
+        """
+        Seconds until the chance of the server passing the filters reaches `target`,
+        searched by doubling from `shortest` and capped at `longest`.
+        """
+        wait = max(shortest, MIN_WAIT)
+        while wait < longest:
+            if self.chance(server, server_filter, wait) >= target:
+                return wait
+            wait *= 2
+        return longest
+
+
+class PollScheduler:
+    def __init__(
+        self,
+        budget: float = DEFAULT_QUERY_BUDGET,
+        min_interval: float = DEFAULT_MIN_INTERVAL,
+        max_interval: float = DEFAULT_MAX_INTERVAL,
+    ):
+        self.budget: float = budget
+        self.min_interval: float = min_interval
+        self.max_interval: float = max_interval
+        self.tokens: float = budget * BURST_SECONDS
+        self.tokens_updated: float = time.monotonic()
+        # Per server (ip:port)
+        self.next_poll: dict[str, float] = {}
+        self.forecast: SlotForecast = SlotForecast()
+
+    def configure(self, budget: float, min_interval: float, max_interval: float):
+        self.budget = budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+    def refill(self, now: float):
+        self.tokens = min(
+            self.budget * BURST_SECONDS,
+            self.tokens + max(0.0, now - self.tokens_updated) * self.budget,
+        )
+        self.tokens_updated = now
+
+    def due_servers(
+        self, servers: list[Server], server_filter: ServerFilter, now: float | None = None
+    ) -> list[Server]:
+        """
+        Servers to poll now: those due, likeliest to pass the filters first
+        (then most overdue), limited by the query budget.
+        Servers that can't pass the static filters are never polled.
+        """
+        if now is None:
+            now = time.monotonic()
+        self.refill(now)
+        due = [
+            (-self.chance_now(server, server_filter, now), next_poll, server)
+            for server in apply_static_filters(servers, server_filter)
+            if (next_poll := self.next_poll.get(server["ip_port"], 0.0)) <= now
+        ]
+        due.sort(key=lambda entry: entry[:2])
+        batch = [server for _, _, server in due[: int(self.tokens)]]
+        self.tokens -= len(batch)
+        return batch
+
+    def refund(self, count: int):
+        """
+        Give back budget for servers that were handed out but not queried.
+        """
+        self.tokens = min(self.budget * BURST_SECONDS, self.tokens + count)
+
+    def record_polled(
+        self,
+        servers: list[Server],
+        server_filter: ServerFilter,
+        now: float | None = None,
+        answered: list[Server] | None = None,
+    ):
+        """
+        Add the player counts of servers that were just polled to their churn windows,
+        and schedule their next poll from their chance of passing the filters.
+        `answered` are the servers among them that answered (all of them if None),
+        the others keep the counts of their last answer, so they are scheduled
+        from their window without adding to it.
+        """
+        if now is None:
+            now = time.monotonic()
+        answered_ids = None if answered is None else {id(server) for server in answered}
+        for server in servers:
+            if answered_ids is None or id(server) in answered_ids:
+                self.forecast.observe(server, now)
+            self.next_poll[server["ip_port"]] = now + self.forecast.time_to_chance(
+                server, server_filter, POLL_CHANCE, self.min_interval, self.max_interval
+            )
+
+    def chance_now(self, server: Server, server_filter: ServerFilter, now: float) -> float:
+        last_seen = self.forecast.last_seen(server)
+        if last_seen is None:
+            return 1.0
+        return self.forecast.chance(server, server_filter, now - last_seen)
+
+    def next_due_time(self) -> float:
+        """
+        time.monotonic() at which the next server is due, or now if none was scheduled.
+        """
+        if not self.next_poll:
+            return time.monotonic()
+        next_poll = min(self.next_poll.values())
+        if self.tokens < 1:
+            if self.budget <= 0:
+                # No queries allowed, nothing is due before the budget is changed
+                return max(next_poll, time.monotonic() + self.max_interval)
+            next_poll = max(next_poll, self.tokens_updated + (1 - self.tokens) / self.budget)
+        return next_poll
+
+
+POLL_SCHEDULER = PollScheduler()
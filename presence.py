@@ -0,0 +1,138 @@
+import time
+
+from filtered_view import CHANGE_LOG
+from models import MiscOptions, Server
+from played_journal import PLAYED_FIELDS, journal_played
+
+# Tracks where a set of usernames (friends, alts) are playing.
+# A2S_PLAYER is only queried on servers whose A2S_INFO player count or map changed
+# since the last player snapshot, or whose snapshot is older than the snapshot TTL.
+# Between snapshots, a server keeps the tracked names found in its last snapshot.
+
+DEFAULT_SNAPSHOT_TTL = 60.0
+
+
+class PresenceTracker:
+    def __init__(self, usernames: list[str], snapshot_ttl: float = DEFAULT_SNAPSHOT_TTL):
+        self.usernames: frozenset[str] = frozenset(usernames)
+        self.snapshot_ttl: float = snapshot_ttl
+        # Per server (ip:port): (players, map) seen by A2S_INFO when the snapshot was taken
+        self.snapshot_info: dict[str, tuple[int, str]] = {}
+        self.snapshot_time: dict[str, float] = {}
+        # Per server: tracked names present in the last snapshot
+        self.present: dict[str, frozenset[str]] = {}
+        # Per tracked name: server name and time it was last seen
+        self.last_seen: dict[str, tuple[str, float]] = {}
+        # Counters since the last reset_counters (one refresh)
+        self.queries: int = 0
+        self.skipped: int = 0
+
+    def set_usernames(self, usernames: list[str], snapshot_ttl: float):
+        new_usernames = frozenset(usernames)
+        if new_usernames != self.usernames:
+            # Snapshots only recorded the old names, take new ones
+            self.snapshot_time.clear()
+            self.present.clear()
+        self.usernames = new_usernames
+        self.snapshot_ttl = snapshot_ttl
+
+    def reset_counters(self):
+        self.queries = 0
+        self.skipped = 0
+
+    def counters_to_string(self, now: float | None = None) -> str:
+        """
+        Player queries since reset_counters and where each tracked name was last seen.
+        """
+        if now is None:
+            now = time.time()
+        status = f"{self.queries} player queries, {self.skipped} skipped"
+        for name, (server_name, seen_at) in sorted(self.last_seen.items()):
+            status += f", {name} seen {now - seen_at:.0f}s ago on {server_name}"
+        return status
+
+    def needs_player_query(self, server: Server, now: float | None = None) -> bool:
+        """
+        Whether the player list of a server has to be queried again.
+        Call after A2S_INFO has updated the server.
+        """
+        key = server["ip_port"]
+        taken_at = self.snapshot_time.get(key)
+        if taken_at is None:
+            return True
+        if now is None:
+            now = time.time()
+        if now - taken_at > self.snapshot_ttl:
+            return True
+        return self.snapshot_info.get(key) != (server["players"], server["map"])
+
+    def record_players(self, server: Server, player_names: list[str], now: float | None = None):
+        """
+        Record a fresh player snapshot for a server.
+        """
+        if now is None:
+            now = time.time()
+        key = server["ip_port"]
+        self.queries += 1
+        self.snapshot_info[key] = (server["players"], server["map"])
+        self.snapshot_time[key] = now
+        found = self.usernames.intersection(player_names)
+        previous = self.present.get(key, frozenset())
+        arrived = found.difference(previous)
+        for name in arrived:
+            print(f"Found {name} in {server['name']}")
+        self.present[key] = found
+        if previous and not found:
+            # Everyone left: journal the last time they were seen, kept in last_played
+            journal_played(server)
+        self.mark_present(server, now, bool(arrived))
+
+    def skip_players(self, server: Server, now: float | None = None):
+        """
+        Reuse the last player snapshot for a server that did not change.
+        """
+        self.skipped += 1
+        self.mark_present(server, time.time() if now is None else now)
+
+    def mark_present(self, server: Server, now: float, arrived: bool = False):
+        """
+        Update last_played of a server with tracked names present.
+        Only an arrival is journaled, not every round they stay.
+        """
+        found = self.present.get(server["ip_port"])
+        if not found:
+            return
+        server["last_played"] = now
+        server["since_played"] = 0
+        CHANGE_LOG.mark(server, PLAYED_FIELDS)
+        if arrived:
+            journal_played(server)
+        for name in found:
+            self.last_seen[name] = (server["name"], now)
+
+
+PRESENCE_TRACKER: PresenceTracker | None = None
+
+
+def get_tracked_usernames(misc: MiscOptions) -> list[str]:
+    usernames = [name for name in misc["tracked_usernames"] if name]
+    if misc["steam_username"] and misc["steam_username"] not in usernames:
+        usernames.append(misc["steam_username"])
+    return usernames
+
+
+def get_presence_tracker(misc: MiscOptions) -> PresenceTracker | None:
+    """
+    Get the presence tracker for the tracked usernames in the options.
+    The same tracker is reused for the whole process so snapshots carry over between refreshes.
+    Returns None if no usernames are tracked.
+    """
+    global PRESENCE_TRACKER
+    usernames = get_tracked_usernames(misc)
+    if not usernames:
+        return None
+    if PRESENCE_TRACKER is None:
+        PRESENCE_TRACKER = PresenceTracker(usernames, misc["player_snapshot_ttl"])
+    else:
+        PRESENCE_TRACKER.set_usernames(usernames, misc["player_snapshot_ttl"])
+    return PRESENCE_TRACKER
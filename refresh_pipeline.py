@@ -0,0 +1,428 @@
+import asyncio
+from collections.abc import Coroutine
+from typing import Any
+
+from a2s_engine import CHALLENGE_CACHE, INFO_FIELDS, A2SEngine
+from latency_cache import DEFAULT_TTL as DEFAULT_LATENCY_TTL
+from latency_cache import get_cached_latency, store_latency
+from latency_probe import (
+    DEFAULT_GAME_PORT,
+    LatencyProber,
+    apply_latency_stats,
+    latency_stats,
+)
+from filtered_view import CHANGE_LOG, snapshot_fields
+from filters import apply_filters, apply_static_filters
+from models import LatencyStats, Server, ServerFilter, SortServerOptions
+from options import DEFAULT_CONCURRENCY, DEFAULT_DEADLINE
+from presence import PresenceTracker
+from server_health import (
+    get_health,
+    query_timeout,
+    record_failure,
+    record_success,
+    release_trial,
+    should_query,
+)
+from server_sort import ranks_before, sort_key_bound, sort_key_function, sort_keys
+from uncle_client import get_uncle_client
+
+# Servers outside the filters still pinged to calibrate the max distance estimate
+CALIBRATION_SAMPLE_SIZE = 8
+
+# The refresh pipeline runs every network step of a refresh in a single event loop.
+# Every step is bounded by a semaphore (so a 100+ server refresh does not open
+# 100+ sockets at once) and the whole refresh is bounded by a deadline.
+# Cancelling the pipeline (deadline or Ctrl-C) cancels every outstanding probe
+# immediately instead of waiting for them to time out.
+# Per-server timeouts and skipping of dead servers come from server_health.
+
+
+def run_pipeline[T](
+    coro: Coroutine[Any, Any, T], deadline: float | None = DEFAULT_DEADLINE
+) -> T:
+    """
+    Run a refresh coroutine to completion from synchronous code.
+    Raises TimeoutError if the deadline passes and KeyboardInterrupt on Ctrl-C,
+    in both cases after every outstanding probe has been cancelled.
+    """
+
+    async def runner() -> T:
+        if deadline is None:
+            return await coro
+        async with asyncio.timeout(deadline):
+            return await coro
+
+    return asyncio.run(runner())
+
+
+def reset_refresh_counters(tracker: PresenceTracker | None = None):
+    """
+    Start counting challenge cache and player query savings for a new refresh.
+    """
+    CHALLENGE_CACHE.reset_counters()
+    if tracker is not None:
+        tracker.reset_counters()
+
+
+def refresh_counters_to_string(tracker: PresenceTracker | None = None) -> str:
+    """
+    Status line of the savings counted since reset_refresh_counters.
+    """
+    status = CHALLENGE_CACHE.counters_to_string()
+    if tracker is not None:
+        status += f", {tracker.counters_to_string()}"
+    return status
+
+
+async def fetch_uncle_state_async() -> list[Server]:
+    """
+    Fetch the raw server list from the UncleTopia state API.
+    requests is blocking, so the request runs in the default executor.
+    """
+    return await asyncio.to_thread(get_uncle_client().fetch_servers)
+
+
+async def ping_async(
+    ip: str,
+    port: int = DEFAULT_GAME_PORT,
+    semaphore: asyncio.Semaphore | None = None,
+    prober: LatencyProber | None = None,
+    samples: int = 1,
+    spread: float = 0.0,
+) -> LatencyStats:
+    """
+    Measure the latency to an ip with `samples` probes spread evenly over `spread` seconds.
+    Ips with an open circuit are not probed.
+    """
+    if prober is None:
+        async with await LatencyProber.create() as prober:
+            return await ping_async(ip, port, semaphore, prober, samples, spread)
+    key = f"{ip}:{port}"
+    if not should_query(key):
+        return latency_stats([])
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(1)
+
+    async def sample(delay: float) -> float:
+        await asyncio.sleep(delay)
+        async with semaphore:
+            try:
+                return await prober.probe(ip, port, query_timeout(key))
+            except TimeoutError:
+                return -1
+
+    try:
+        results = await asyncio.gather(
+            *(sample(i * spread / samples) for i in range(samples))
+        )
+    except asyncio.CancelledError:
+        release_trial(key)
+        raise
+    except OSError as e:
+        release_trial(key)
+        print(f"Error pinging server {ip} in ping_async: {e}")
+        return latency_stats([])
+    stats = latency_stats(list(results))
+    # One outcome per ping, a lost sample alone doesn't count as a failure
+    if stats["median"] >= 0:
+        record_success(key, stats["median"])
+    else:
+        record_failure(key)
+    return stats
+
+
+async def ping_servers_async(
+    servers: list[Server],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    samples: int = 1,
+    spread: float = 0.0,
+    cache_ttl: float | None = DEFAULT_LATENCY_TTL,
+) -> dict[str, LatencyStats]:
+    """
+    Measure the latency to every unique server ip, at most `concurrency` probes at a time.
+    All probes share one socket.
+    Ips with a fresh entry in the latency cache are not probed (cache_ttl None disables the cache).
+    """
+    # The port is only used when falling back to A2S
+    targets = {server["ip"]: server["port"] for server in servers}
+    results: dict[str, LatencyStats] = {}
+    if cache_ttl is not None:
+        for ip in targets:
+            cached = get_cached_latency(ip, cache_ttl)
+            if cached is not None:
+                results[ip] = cached
+        for ip in results:
+            del targets[ip]
+    if not targets:
+        return results
+    semaphore = asyncio.Semaphore(concurrency)
+    async with await LatencyProber.create() as prober:
+        probed = await asyncio.gather(
+            *(
+                ping_async(ip, port, semaphore, prober, samples, spread)
+                for ip, port in targets.items()
+            )
+        )
+    for ip, stats in zip(targets.keys(), probed):
+        results[ip] = stats
+        store_latency(ip, stats, samples)
+    return results
+
+
+async def query_server_async(
+    server: Server,
+    tracker: PresenceTracker | None = None,
+    semaphore: asyncio.Semaphore | None = None,
+    engine: A2SEngine | None = None,
+) -> bool:
+    """
+    Update a server in place with its A2S info (player count, map, and ping).
+    If a presence tracker is given, also look for the tracked usernames in the
+    player list when the tracker says the player list may have changed.
+    Returns True if the server answered.
+    """
+    if engine is None:
+        async with await A2SEngine.create() as engine:
+            return await query_server_async(server, tracker, semaphore, engine)
+    key = f"{server['ip']}:{server['port']}"
+    if not should_query(key):
+        return False
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(1)
+    try:
+        async with semaphore:
+            return await query_server_locked(server, tracker, engine, key)
+    except asyncio.CancelledError:
+        release_trial(key)
+        raise
+
+
+async def query_server_locked(
+    server: Server, tracker: PresenceTracker | None, engine: A2SEngine, key: str
+) -> bool:
+    """
+    query_server_async once a slot of the semaphore is held.
+    """
+    try:
+        before = snapshot_fields(server, INFO_FIELDS)
+        rtt = await engine.query_info_into(server, query_timeout(key))
+        CHANGE_LOG.mark_if_changed(server, before)
+        record_success(key, rtt * 1000)
+        # One sample per refresh, summarized over the recent refreshes
+        rtts = get_health(key)["rtts"]
+        stats = latency_stats(rtts)
+        apply_latency_stats(server, stats)
+        # So pings of the same ip can be skipped
+        store_latency(server["ip"], stats, len(rtts))
+        if tracker is not None:
+            if tracker.needs_player_query(server):
+                players = await engine.query_player_names(server, query_timeout(key))
+                tracker.record_players(server, players)
+            else:
+                tracker.skip_players(server)
+        return True
+    except TimeoutError:
+        record_failure(key)
+        apply_latency_stats(server, latency_stats(get_health(key)["rtts"]))
+    except Exception as e:
+        print(
+            f"Error updating server {server['ip']} with steam info in query_server_async: {e}"
+        )
+    return False
+
+
+async def query_servers_async(
+    servers: list[Server],
+    tracker: PresenceTracker | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    server_filter: ServerFilter | None = None,
+    deadline: float | None = None,
+) -> list[Server]:
+    """
+    Query every server over A2S concurrently, at most `concurrency` at a time.
+    All queries share a single UDP socket.
+    If a filter is given, servers failing its static part are not queried.
+    Returns the servers that answered, when the deadline passes those that answered so far.
+    """
+    if server_filter is not None:
+        servers = apply_static_filters(servers, server_filter)
+    semaphore = asyncio.Semaphore(concurrency)
+    answered: list[Server] = []
+
+    async def query(server: Server, engine: A2SEngine):
+        if await query_server_async(server, tracker, semaphore, engine):
+            answered.append(server)
+
+    async with await A2SEngine.create() as engine:
+        try:
+            async with asyncio.timeout(deadline):
+                async with asyncio.TaskGroup() as group:
+                    for server in servers:
+                        _ = group.create_task(query(server, engine))
+        except TimeoutError:
+            print("Deadline passed in query_servers_async, using the servers answered so far")
+    return answered
+
+
+async def find_best_server_async(
+    servers: list[Server],
+    server_filter: ServerFilter,
+    sort_object: SortServerOptions,
+    tracker: PresenceTracker | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    deadline: float | None = DEFAULT_DEADLINE,
+) -> tuple[Server | None, list[Server], list[Server]]:
+    """
+    Find the best server passing the filters without waiting for every server to answer.
+    Servers are queried in the order they are expected to rank in, from their last known values.
+    Querying stops as soon as the best server that answered can't be outranked
+    by any server that hasn't, or when the deadline passes.
+    Only servers that answered during this call can be returned.
+    Returns the best server (or None), the servers whose query finished
+    and those of them that answered.
+    """
+    candidates = apply_static_filters(servers, server_filter)
+    if not candidates:
+        return None, [], []
+    rank_key = sort_key_function(sort_object, candidates[0])
+    # Bounds are only known for the primary key, tie-breakers can reorder equal bounds
+    primary = sort_keys(sort_object)[0]
+    sort_by = primary["sort_by"]
+    has_tie_breakers = len(sort_keys(sort_object)) > 1
+    # Expected rank: servers passing on their last known values first, each part in sort order
+    passing = {id(server) for server in apply_filters(candidates, server_filter)}
+    candidates.sort(key=rank_key)
+    candidates.sort(key=lambda server: id(server) not in passing)
+
+    # Servers that haven't answered yet, by the best rank they could reach
+    bounds = {
+        id(server): sort_key_bound(server, primary, server_filter)
+        for server in candidates
+    }
+    unbounded = sum(1 for bound in bounds.values() if bound is None)
+    by_bound = sorted(
+        (server for server in candidates if bounds[id(server)] is not None),
+        key=lambda server: bounds[id(server)],  # type: ignore
+        reverse=primary["reverse"],
+    )
+    next_bound = 0
+    finished: list[Server] = []
+    finished_ids: set[int] = set()
+    answered_servers: list[Server] = []
+    best: Server | None = None
+
+    def can_be_outranked(best: Server) -> bool:
+        nonlocal next_bound
+        if unbounded:
+            return True
+        while next_bound < len(by_bound) and id(by_bound[next_bound]) in finished_ids:
+            next_bound += 1
+        if next_bound == len(by_bound):
+            return False
+        bound = bounds[id(by_bound[next_bound])]
+        if has_tie_breakers and bound == best[sort_by]:
+            return True
+        return ranks_before(bound, best[sort_by], primary)  # type: ignore
+
+    semaphore = asyncio.Semaphore(concurrency)
+    results: asyncio.Queue[tuple[Server, bool]] = asyncio.Queue()
+
+    async def query(server: Server):
+        answered = await query_server_async(server, tracker, semaphore, engine)
+        results.put_nowait((server, answered))
+
+    async with await A2SEngine.create() as engine:
+        # The semaphore wakes waiters in order, so queries go out in expected rank order
+        tasks = [asyncio.create_task(query(server)) for server in candidates]
+        try:
+            async with asyncio.timeout(deadline):
+                for _ in candidates:
+                    server, answered = await results.get()
+                    finished.append(server)
+                    finished_ids.add(id(server))
+                    if bounds[id(server)] is None:
+                        unbounded -= 1
+                    if answered:
+                        answered_servers.append(server)
+                    if answered and apply_filters([server], server_filter):
+                        if best is None or rank_key(server) < rank_key(best):
+                            best = server
+                    if best is not None and not can_be_outranked(best):
+                        break
+        except TimeoutError:
+            print("Deadline passed in find_best_server_async, using the best server so far")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    return best, finished, answered_servers
+
+
+def prepare_uncle_servers(servers: list[Server]):
+    """
+    Fill in the fields that are not given by the UncleTopia API.
+    """
+    for server in servers:
+        server["slots"] = server["max_players"] - server["players"]
+        server["ip_port"] = f"{server['ip']}:{server['port']}"
+        server["last_played"] = -1
+        server["since_played"] = -1
+
+
+async def get_uncle_async(
+    ping: bool,
+    calculate_max_distance: bool,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    samples: int = 1,
+    spread: float = 0.0,
+    cache_ttl: float | None = DEFAULT_LATENCY_TTL,
+    server_filter: ServerFilter | None = None,
+) -> tuple[list[Server], float | None]:
+    """
+    Fetch the UncleTopia state and optionally ping every server, in one pipeline.
+    If a filter is given, only servers passing its static part are pinged,
+    plus a small calibration sample for estimating the max distance.
+    All servers are returned.
+    """
+    servers = await fetch_uncle_state_async()
+    prepare_uncle_servers(servers)
+    max_distance_filter = None
+    for server in servers:
+        apply_latency_stats(server, latency_stats([]))
+    if ping or calculate_max_distance:
+        to_ping = servers
+        if server_filter is not None:
+            to_ping = apply_static_filters(servers, server_filter)
+            if calculate_max_distance:
+                to_ping = to_ping + calibration_sample(servers, to_ping)
+        ping_results = await ping_servers_async(
+            to_ping, concurrency, samples, spread, cache_ttl
+        )
+        for server in servers:
+            if server["ip"] in ping_results:
+                apply_latency_stats(server, ping_results[server["ip"]])
+    if calculate_max_distance:
+        from estimate_max_distance import estimate_max_distance
+
+        max_distance_filter = estimate_max_distance(servers)
+
+    return servers, max_distance_filter
+
+
+def calibration_sample(
+    servers: list[Server], candidates: list[Server], size: int = CALIBRATION_SAMPLE_SIZE
+) -> list[Server]:
+    """
+    Pick servers outside the candidates, spread evenly over distance,
+    so the max distance estimate still sees a range of distances.
+    """
+    candidate_ids = {id(server) for server in candidates}
+    others = sorted(
+        (server for server in servers if id(server) not in candidate_ids),
+        key=lambda server: server["distance"],
+    )
+    if len(others) <= size:
+        return others
+    step = (len(others) - 1) / (size - 1)
+    return [others[round(i * step)] for i in range(size)]
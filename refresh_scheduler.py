@@ -0,0 +1,159 @@
+import time
+from operator import itemgetter
+
+from a2s_engine import INFO_FIELDS
+from filtered_view import CHANGE_LOG
+from latency_probe import LATENCY_FIELDS
+from models import Options, Server
+from presence import PresenceTracker
+from refresh_pipeline import reset_refresh_counters
+from server_main import SNAPSHOT_CHANGES, get_servers, update_servers_with_steam_info
+from server_providers import UncletopiaProvider, make_providers
+
+# Hybrid refresh: the server list from the providers (UncleTopia state API and/or
+# the Valve master server) is fetched on a slow cadence, while the dynamic fields
+# (players, map, bots, ping) are refreshed through A2S on every refresh.
+# Both are merged into one server table keyed by server_id.
+# Without query_steam, the providers are fetched every refresh.
+# With query_steam, a server table loaded from the cache stands in for the first
+# fetch, so starting without the network still works.
+
+# Fields that only this program knows about and must survive a state refresh
+PRESERVED_FIELDS = ("last_played", "since_played")
+
+
+def merge_uncle_servers(servers: list[Server], fresh: list[Server], remove: bool = True):
+    """
+    Merge a fresh state API server list into the server table in place, by server_id.
+    Existing server dicts are updated rather than replaced, so references to them stay valid.
+    Servers missing from the fresh list are removed, unless remove is False
+    (a partial list), new ones are added.
+    Changed fields are reported to the filtered views.
+    """
+    by_id = {server["server_id"]: server for server in servers}
+    merged: list[Server] = []
+    # Only the fields the filtered views and indexes read are compared,
+    # all at once first since most servers don't change
+    watched = tuple(CHANGE_LOG.watched_fields())
+    watched_values = itemgetter(*watched) if watched else None
+    for new_server in fresh:
+        old_server = by_id.pop(new_server["server_id"], None)
+        if old_server is None:
+            CHANGE_LOG.mark(new_server, ())
+            merged.append(new_server)
+            continue
+        for key in PRESERVED_FIELDS:
+            new_server[key] = old_server[key]
+        if new_server["ping"] < 0 and old_server.get("ip") == new_server["ip"]:
+            # Not pinged this time, keep the last known latency
+            for key in LATENCY_FIELDS:
+                if key in old_server:
+                    new_server[key] = old_server[key]
+        if new_server["max_players"] == 0:
+            # Master server entry that was not queried this time
+            for key in INFO_FIELDS:
+                new_server[key] = old_server[key]
+        changed: set[str] = set()
+        if watched_values is not None:
+            try:
+                same = watched_values(old_server) == watched_values(new_server)
+            except KeyError:
+                same = False
+            if not same:
+                changed = {
+                    key for key in watched if old_server.get(key) != new_server.get(key)
+                }
+        old_server.clear()
+        old_server.update(new_server)
+        if changed:
+            CHANGE_LOG.mark(old_server, changed)
+        merged.append(old_server)
+    if remove:
+        for old_server in by_id.values():
+            CHANGE_LOG.mark_removed(old_server)
+    else:
+        merged.extend(by_id.values())
+    servers[:] = merged
+    CHANGE_LOG.mark_reordered()
+    SNAPSHOT_CHANGES.changed = True
+
+
+class RefreshScheduler:
+    def __init__(self):
+        # time.monotonic() of the last state API refresh, None if never refreshed
+        self.last_uncle_refresh: float | None = None
+
+    def uncle_refresh_due(
+        self, options: Options, now: float | None = None, cached: bool = False
+    ) -> bool:
+        """
+        Whether the providers should be fetched, cached is True when the
+        server table already has servers from the cache.
+        """
+        misc = options["misc"]
+        if not misc["query_steam"]:
+            return True
+        if now is None:
+            now = time.monotonic()
+        if self.last_uncle_refresh is None:
+            if not cached:
+                return True
+            # The cached table is used until the next regular fetch
+            self.last_uncle_refresh = now
+        return now - self.last_uncle_refresh >= misc["uncle_refresh_interval"]
+
+    def refresh(
+        self,
+        servers: list[Server],
+        options: Options,
+        ping: bool,
+        calculate_max_distance: bool,
+        tracker: PresenceTracker | None = None,
+        query_servers: list[Server] | None = None,
+    ) -> float | None:
+        """
+        Refresh the server table in place.
+        Only the servers in query_servers are queried over A2S, if given.
+        Returns the new max distance filter if it was calculated, else None.
+        """
+        misc = options["misc"]
+        filters = options["filters"]
+        new_max_distance = None
+        reset_refresh_counters(tracker)
+        if self.uncle_refresh_due(options, cached=bool(servers)):
+            # A2S measures ping itself, no need to ping on top of it
+            providers = make_providers(
+                options, ping and not misc["query_steam"], calculate_max_distance
+            )
+            fresh, complete = get_servers(
+                providers,
+                misc["refresh_deadline"],
+                misc["max_concurrent_queries"],
+                filters,
+                tracker,
+            )
+            for provider in providers:
+                if isinstance(provider, UncletopiaProvider):
+                    new_max_distance = provider.max_distance
+            if fresh or servers:
+                # An empty table is fetched again on the next refresh
+                self.last_uncle_refresh = time.monotonic()
+            if fresh:
+                # A failed or partial fetch never removes servers
+                merge_uncle_servers(servers, fresh, complete)
+            else:
+                print("No servers received, keeping the server table in refresh")
+        if query_servers is None:
+            query_servers = servers
+        if misc["query_steam"] and query_servers:
+            update_servers_with_steam_info(
+                query_servers,
+                tracker,
+                misc["refresh_deadline"],
+                misc["max_concurrent_queries"],
+                filters,
+            )
+        return new_max_distance
+
+
+REFRESH_SCHEDULER = RefreshScheduler()
@@ -0,0 +1,79 @@
+import json
+import os
+import socket
+from typing import Any
+
+from models import Options, Server
+
+# Client side of the scout daemon protocol (see scout_daemon).
+# Only the standard library, so asking the daemon doesn't import the refresh code.
+
+SOCKET_PATH = "cache/scout.sock"
+# Clients give up on the daemon quickly and fall back to refreshing themselves
+CLIENT_TIMEOUT = 0.5
+# Answers older than this many refresh intervals are from a stuck daemon
+STALE_REFRESHES = 3
+
+
+def daemon_supported() -> bool:
+    return hasattr(socket, "AF_UNIX")
+
+
+def encode_message(message: dict[str, Any]) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+def daemon_request(request: dict[str, Any]) -> dict[str, Any] | None:
+    """
+    Send a request to the scout daemon.
+    Returns None if the daemon is not running or does not answer in time.
+    """
+    if not daemon_supported() or not os.path.exists(SOCKET_PATH):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CLIENT_TIMEOUT)
+            sock.connect(SOCKET_PATH)
+            sock.sendall(encode_message(request))
+            chunks: list[bytes] = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        response: dict[str, Any] = json.loads(b"".join(chunks))
+    except (OSError, json.JSONDecodeError):
+        return None
+    if not response.get("ok"):
+        print(f"Scout daemon error: {response.get('error')}")
+        return None
+    return response
+
+
+def query_daemon(options: Options) -> list[Server] | None:
+    """
+    Get the servers passing the filters, sorted, from the scout daemon.
+    Returns None if the daemon is not reachable or its servers are stale.
+    """
+    response = daemon_request(
+        {"cmd": "query", "filters": options["filters"], "sort": options["server_sort"]}
+    )
+    if response is None:
+        return None
+    age = response.get("age")
+    max_age = STALE_REFRESHES * options["misc"]["refresh_interval"]
+    if not isinstance(age, (int, float)) or age > max_age:
+        print("Scout daemon servers are outdated, refreshing locally")
+        return None
+    servers: list[Server] = response["servers"]
+    return servers
+
+
+def notify_daemon_played(server: Server):
+    _ = daemon_request(
+        {
+            "cmd": "played",
+            "ip_port": server["ip_port"],
+            "last_played": server["last_played"],
+        }
+    )
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any
+
+from filters import filters_changed
+from models import Options, Server, ServerFilter, SortServerOptions
+from played_journal import journal_needs_compaction, replay_journal
+from presence import get_presence_tracker
+from refresh_pipeline import refresh_counters_to_string
+from refresh_scheduler import REFRESH_SCHEDULER
+from scout_client import SOCKET_PATH, daemon_supported, encode_message
+from server_main import clean_write_servers_to_file, read_servers_from_file
+from server_table import ServerTable
+
+# Background scout daemon.
+# Keeps the server table refreshed in memory and answers filtered, sorted queries
+# over a Unix domain socket, so `main.py -q` does not have to cold start a refresh.
+# Protocol: one request per connection, a single line of JSON each way.
+#   {"cmd": "query", "filters": ServerFilter, "sort": SortServerOptions}
+#     -> {"ok": true, "servers": [Server], "age": seconds since the last refresh}
+#   {"cmd": "played", "ip_port": str, "last_played": float}
+#     -> {"ok": true}
+#   {"cmd": "ping"} -> {"ok": true}
+# The client side is in scout_client.
+# A client records a played server with journal_played before sending "played".
+# The socket handlers only update the published snapshot. The refresh thread
+# picks the change up from the played journal, so the table it owns is never
+# written from the event loop.
+
+MAX_REQUEST_SIZE = 1 << 20
+
+
+class ScoutDaemon:
+    def __init__(self, options: Options, ping: bool, verbose: bool = False):
+        self.options: Options = options
+        self.ping: bool = ping
+        # Print the refresh savings after each refresh
+        self.verbose: bool = verbose
+        # Server table owned by the refresh thread
+        self.servers: list[Server] = read_servers_from_file()
+        # Columnar copy published after each refresh, read by the socket handlers
+        self.snapshot: ServerTable = ServerTable.from_servers(self.servers)
+        self.refreshed_at: float = 0.0
+        # "played" requests received while a refresh runs, applied again to
+        # its snapshot in case the journal was replayed before they were recorded
+        self.played_during_refresh: list[tuple[str, float]] = []
+
+    def refresh(self) -> ServerTable:
+        """
+        Refresh the server table, runs in a worker thread.
+        Returns the snapshot to publish.
+        """
+        misc = self.options["misc"]
+        filters = self.options["filters"]
+        calculate_max_distance = (
+            misc["auto_distance_calculation"] and filters["distance"]["max"] is None
+        )
+        # Played servers recorded by the clients since the last refresh
+        _ = replay_journal(self.servers)
+        if self.options["misc"]["cache_uncletopia_state"] and journal_needs_compaction():
+            # The daemon never reads the cache again, compact while it runs
+            clean_write_servers_to_file(self.servers)
+        tracker = get_presence_tracker(misc)
+        new_max_distance = REFRESH_SCHEDULER.refresh(
+            self.servers,
+            self.options,
+            self.ping,
+            calculate_max_distance,
+            tracker,
+        )
+        if self.verbose:
+            print(f"Refreshed {len(self.servers)} servers, {refresh_counters_to_string(tracker)}")
+        if new_max_distance is not None:
+            filters["distance"]["max"] = new_max_distance
+            filters_changed()
+        return ServerTable.from_servers(self.servers)
+
+    async def refresh_loop(self):
+        while True:
+            self.played_during_refresh = []
+            try:
+                snapshot = await asyncio.to_thread(self.refresh)
+                # Published from the event loop, so no "played" request is lost in between
+                for ip_port, last_played in self.played_during_refresh:
+                    mark_snapshot_played(snapshot, ip_port, last_played)
+                self.snapshot = snapshot
+                self.refreshed_at = time.time()
+            except Exception as e:
+                print(f"Error refreshing servers in refresh_loop: {e}")
+            await asyncio.sleep(self.options["misc"]["refresh_interval"])
+
+    def query(self, server_filter: ServerFilter, sort: SortServerOptions) -> list[Server]:
+        snapshot = self.snapshot
+        snapshot.refresh_since_played()
+        indices = snapshot.sort_indices(snapshot.apply_filters(server_filter), sort)
+        return snapshot.to_servers(indices)
+
+    def mark_played(self, ip_port: str, last_played: float):
+        """
+        Show a played server in the answers right away, runs on the event loop.
+        The server table gets it from the played journal on the next refresh.
+        """
+        mark_snapshot_played(self.snapshot, ip_port, last_played)
+        self.played_during_refresh.append((ip_port, last_played))
+
+    def handle_request(self, request: dict[str, Any]) -> dict[str, Any]:
+        command = request.get("cmd")
+        if command == "query":
+            servers = self.query(request["filters"], request["sort"])
+            return {
+                "ok": True,
+                "servers": servers,
+                "age": time.time() - self.refreshed_at,
+            }
+        if command == "played":
+            self.mark_played(request["ip_port"], request["last_played"])
+            return {"ok": True}
+        if command == "ping":
+            return {"ok": True}
+        return {"ok": False, "error": f"Unknown command: {command}"}
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            line = await reader.readline()
+            try:
+                response = self.handle_request(json.loads(line))
+            except (json.JSONDecodeError, KeyError, ValueError) as e:
+                response = {"ok": False, "error": str(e)}
+            writer.write(encode_message(response))
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self):
+        if not os.path.exists("cache"):
+            os.makedirs("cache")
+        if os.path.exists(SOCKET_PATH):
+            os.remove(SOCKET_PATH)
+        server = await asyncio.start_unix_server(
+            self.handle_client, SOCKET_PATH, limit=MAX_REQUEST_SIZE
+        )
+        print(f"Scout daemon listening on {SOCKET_PATH}")
+        refresh_task = asyncio.create_task(self.refresh_loop())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            refresh_task.cancel()
+            if os.path.exists(SOCKET_PATH):
+                os.remove(SOCKET_PATH)
+
+
+def mark_snapshot_played(snapshot: ServerTable, ip_port: str, last_played: float):
+    index = snapshot.find("ip_port", ip_port)
+    if index is not None:
+        row = snapshot.row(index)
+        row["last_played"] = last_played
+        row["since_played"] = -1 if last_played == -1 else time.time() - last_played
+
+
+def run_daemon(args: Any, options: Options):
+    """
+    Run the scout daemon until interrupted.
+    """
+    if not daemon_supported():
+        print("The scout daemon needs Unix domain sockets, which this system lacks")
+        return
+    daemon = ScoutDaemon(
+        options, args.ping_servers or options["misc"]["always_ping"], args.verbose
+    )
+    try:
+        asyncio.run(daemon.serve())
+    except KeyboardInterrupt:
+        print("Scout daemon stopped")
+    if options["misc"]["cache_uncletopia_state"] and daemon.servers:
+        clean_write_servers_to_file(daemon.servers)
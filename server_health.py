@@ -0,0 +1,168 @@
+import json
+import os
+import time
+
+from models import ServerHealth
+
+# Per-server health tracking for A2S queries and pings.
+# Timeouts adapt to each server's observed round trip times, and servers that keep
+# failing are skipped (circuit open) with exponential backoff before a single
+# trial query (half open) decides whether they are back.
+# Keys are "ip:port", shared by A2S queries and pings of a server. Each refresh
+# records a single outcome per server, however many probes it sent.
+
+HEALTH_FILE = "cache/health.json"
+# Timeout used until enough round trips have been observed
+DEFAULT_TIMEOUT = 3.0
+MIN_TIMEOUT = 0.25
+MAX_TIMEOUT = 3.0
+# Timeout is this multiple of the p95 round trip time
+TIMEOUT_RTT_MULTIPLIER = 3.0
+MIN_RTT_SAMPLES = 3
+MAX_RTT_SAMPLES = 20
+# Consecutive failures before the circuit opens
+FAILURE_THRESHOLD = 3
+BASE_BACKOFF = 30.0
+MAX_BACKOFF = 30.0 * 60
+# A trial query that never reported back (cancelled by the deadline, process
+# killed) stops blocking a new trial after this many seconds
+TRIAL_TIMEOUT = 60.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+SERVER_HEALTH: dict[str, ServerHealth] = {}
+_health_loaded = False
+
+
+def new_health() -> ServerHealth:
+    return {"rtts": [], "failures": 0, "state": CLOSED, "open_until": 0.0, "half_open_at": 0.0}
+
+
+def get_health(key: str) -> ServerHealth:
+    load_health()
+    health = SERVER_HEALTH.get(key)
+    if health is None:
+        health = new_health()
+        SERVER_HEALTH[key] = health
+    return health
+
+
+def load_health():
+    """
+    Load the health table from ./cache/health.json once per process.
+    """
+    global _health_loaded
+    if _health_loaded:
+        return
+    _health_loaded = True
+    try:
+        with open(HEALTH_FILE, "r") as file:
+            # Older versions also kept ping entries keyed by ip only
+            SERVER_HEALTH.update(
+                (key, health) for key, health in json.load(file).items() if ":" in key
+            )
+    except FileNotFoundError:
+        pass
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"Error reading health file in load_health: {e}")
+
+
+def write_health_to_file():
+    """
+    Save the health table to ./cache/health.json
+    Create cache directory if it doesn't exist.
+    """
+    if not _health_loaded:
+        return
+    try:
+        if not os.path.exists("cache"):
+            os.makedirs("cache")
+        with open(HEALTH_FILE, "w") as file:
+            json.dump(SERVER_HEALTH, file)
+    except OSError as e:
+        print(f"Error writing health file in write_health_to_file: {e}")
+
+
+def rtt_p95(health: ServerHealth) -> float | None:
+    ordered = sorted(rtt for rtt in health["rtts"] if rtt >= 0)
+    if len(ordered) < MIN_RTT_SAMPLES:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+def add_rtt_sample(health: ServerHealth, rtt: float):
+    health["rtts"].append(rtt)
+    if len(health["rtts"]) > MAX_RTT_SAMPLES:
+        del health["rtts"][0]
+
+
+def query_timeout(key: str) -> float:
+    """
+    Timeout in seconds for the next query to a server, based on its p95 round trip time.
+    """
+    p95 = rtt_p95(get_health(key))
+    if p95 is None:
+        return DEFAULT_TIMEOUT
+    return min(MAX_TIMEOUT, max(MIN_TIMEOUT, p95 / 1000 * TIMEOUT_RTT_MULTIPLIER))
+
+
+def should_query(key: str, now: float | None = None) -> bool:
+    """
+    Whether a server should be queried now.
+    An open circuit whose backoff has passed moves to half open and allows one query,
+    no other until that query records its success or failure.
+    """
+    health = get_health(key)
+    if health["state"] == CLOSED:
+        return True
+    if now is None:
+        now = time.time()
+    if health["state"] == HALF_OPEN:
+        # Written by versions without trial tracking
+        if now - health.get("half_open_at", 0.0) < TRIAL_TIMEOUT:
+            return False
+    elif now < health["open_until"]:
+        return False
+    health["state"] = HALF_OPEN
+    health["half_open_at"] = now
+    return True
+
+
+def release_trial(key: str):
+    """
+    Give up a query cancelled before its outcome was known (deadline, Ctrl-C).
+    If it was the half open trial, the next query can be a trial again right away.
+    """
+    health = get_health(key)
+    if health["state"] == HALF_OPEN:
+        health["half_open_at"] = 0.0
+
+
+def record_success(key: str, rtt: float):
+    """
+    Record a successful query with its round trip time in ms.
+    """
+    health = get_health(key)
+    add_rtt_sample(health, rtt)
+    health["failures"] = 0
+    health["state"] = CLOSED
+    health["open_until"] = 0.0
+
+
+def record_failure(key: str, now: float | None = None):
+    """
+    Record a query that got no answer, opening the circuit after repeated failures.
+    """
+    health = get_health(key)
+    add_rtt_sample(health, -1)
+    health["failures"] += 1
+    if health["state"] != HALF_OPEN and health["failures"] < FAILURE_THRESHOLD:
+        return
+    if now is None:
+        now = time.time()
+    exponent = min(16, max(0, health["failures"] - FAILURE_THRESHOLD))
+    backoff = BASE_BACKOFF * 2**exponent
+    health["state"] = OPEN
+    health["open_until"] = now + min(MAX_BACKOFF, backoff)
@@ -0,0 +1,377 @@
+import json
+import os
+import time
+from typing import Any
+
+import numpy as np
+
+from history_store import DAY, HISTORY_DIRECTORY, partition_name
+from models import Server
+
+# Time series of server population, in ./cache/history.
+# One partition per UTC day: YYYY-MM-DD.bin holds fixed-width records appended
+# after each refresh, YYYY-MM-DD.json the servers and maps the records refer to.
+# humans, bots and max_players are stored as the difference with the previous
+# record of the same server in the partition, which keeps them small.
+# A server is recorded at most once per interval, and partitions older than the
+# retention are deleted.
+# Queries map the partitions with np.memmap and aggregate whole columns at once.
+# Recording is done by history_store.HISTORY, which only imports this module
+# (and numpy) once servers are actually recorded.
+
+RECORD = np.dtype(
+    [
+        # Seconds since the start of the partition
+        ("time", "<u4"),
+        # Index into the servers of the partition
+        ("server", "<u4"),
+        ("humans", "<i2"),
+        ("bots", "<i2"),
+        ("max_players", "<i2"),
+        # Index into the maps of the partition
+        ("map", "<u2"),
+    ]
+)
+DELTA_FIELDS = ("humans", "bots", "max_players")
+
+
+def group_cumsums(groups: np.ndarray, columns: list[np.ndarray]) -> list[np.ndarray]:
+    """
+    Running sum of each column of deltas within each group, in the original order.
+    """
+    if len(groups) == 0:
+        return [column.astype(np.int64) for column in columns]
+    order = np.argsort(groups, kind="stable")
+    sorted_groups = groups[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    lengths = np.diff(np.r_[starts, len(sorted_groups)])
+    results: list[np.ndarray] = []
+    for column in columns:
+        deltas = column[order].astype(np.int64)
+        sums = np.cumsum(deltas)
+        sums -= np.repeat(sums[starts] - deltas[starts], lengths)
+        values = np.empty_like(sums)
+        values[order] = sums
+        results.append(values)
+    return results
+
+
+def group_medians(groups: np.ndarray, values: np.ndarray, count: int) -> np.ndarray:
+    """
+    Median of `values` for each group in range(count), NaN for empty groups.
+    """
+    medians = np.full(count, np.nan)
+    if len(groups) == 0:
+        return medians
+    order = np.lexsort((values, groups))
+    sorted_groups = groups[order]
+    sorted_values = values[order].astype(np.float64)
+    starts = np.searchsorted(sorted_groups, np.arange(count), "left")
+    ends = np.searchsorted(sorted_groups, np.arange(count), "right")
+    present = ends > starts
+    low = (starts + ends - 1) // 2
+    high = (starts + ends) // 2
+    medians[present] = (sorted_values[low[present]] + sorted_values[high[present]]) / 2
+    return medians
+
+
+class HistoryPartition:
+    """
+    One day of history, opened for appending.
+    """
+
+    def __init__(self, directory: str, day_start: int):
+        self.day_start: int = day_start
+        name = partition_name(day_start)
+        self.data_path: str = os.path.join(directory, f"{name}.bin")
+        self.index_path: str = os.path.join(directory, f"{name}.json")
+        # [server_id, ip_port, name, region] per server index
+        self.servers: list[list[Any]] = []
+        self.maps: list[str] = []
+        self.server_indexes: dict[str, int] = {}
+        self.map_indexes: dict[str, int] = {}
+        self.index_changed: bool = False
+        # Last absolute values per server index, last record time per ip:port
+        self.last: dict[int, tuple[int, int, int]] = {}
+        self.last_time: dict[str, float] = {}
+        # Size of the records written when last seen, to notice other writers
+        self.size: int = 0
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_path, "r") as file:
+                index = json.load(file)
+            self.servers = index["servers"]
+            self.maps = index["maps"]
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError, KeyError) as e:
+            print(f"Error reading history index in HistoryPartition.load: {e}")
+            return
+        self.server_indexes = {server[1]: i for i, server in enumerate(self.servers)}
+        self.map_indexes = {name: i for i, name in enumerate(self.maps)}
+        try:
+            size = os.path.getsize(self.data_path)
+            if size % RECORD.itemsize:
+                # Torn record of an interrupted append, later records would be misaligned
+                os.truncate(self.data_path, size - size % RECORD.itemsize)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            print(f"Error repairing history partition in HistoryPartition.load: {e}")
+        records = map_records(self.data_path)
+        if records is None or len(records) == 0:
+            return
+        self.size = len(records) * RECORD.itemsize
+        servers = records["server"]
+        columns = group_cumsums(servers, [records[field] for field in DELTA_FIELDS])
+        # Last record of each server: the first one in reversed order
+        unique, reversed_first = np.unique(servers[::-1], return_index=True)
+        last = len(servers) - 1 - reversed_first
+        for server, row in zip(unique.tolist(), last.tolist()):
+            self.last[server] = (
+                int(columns[0][row]), int(columns[1][row]), int(columns[2][row])
+            )
+            self.last_time[self.servers[server][1]] = self.day_start + float(
+                records["time"][row]
+            )
+
+    def stale(self) -> bool:
+        """
+        Whether another process appended to the partition since it was loaded.
+        Deltas are relative to the previous record of a server, so it has to be reloaded.
+        """
+        try:
+            return os.path.getsize(self.data_path) != self.size
+        except FileNotFoundError:
+            return self.size != 0
+
+    def server_index(self, server: Server) -> int:
+        index = self.server_indexes.get(server["ip_port"])
+        if index is None:
+            index = len(self.servers)
+            self.servers.append(
+                [server["server_id"], server["ip_port"], server["name"], server["region"]]
+            )
+            self.server_indexes[server["ip_port"]] = index
+            self.index_changed = True
+        return index
+
+    def map_index(self, name: str) -> int:
+        index = self.map_indexes.get(name)
+        if index is None:
+            index = len(self.maps)
+            self.maps.append(name)
+            self.map_indexes[name] = index
+            self.index_changed = True
+        return index
+
+    def append(self, rows: list[tuple[int, int, int, int, int, int]]):
+        data = np.array(rows, dtype=RECORD).tobytes()
+        with open(self.data_path, "ab") as file:
+            _ = file.write(data)
+        self.size += len(data)
+
+    def write_index(self):
+        """
+        Write the servers and maps, before the records referring to them.
+        """
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump({"servers": self.servers, "maps": self.maps}, file)
+        os.replace(temp_path, self.index_path)
+        self.index_changed = False
+
+
+def map_records(path: str) -> np.ndarray | None:
+    """
+    Memory map the records of a partition, ignoring a torn record at the end.
+    """
+    try:
+        count = os.path.getsize(path) // RECORD.itemsize
+    except OSError:
+        return None
+    if count == 0:
+        return np.empty(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode="r", shape=(count,))
+
+
+class History:
+    """
+    Decoded history of several partitions, one array per column.
+    """
+
+    def __init__(self):
+        # time.time() of each record
+        self.time: np.ndarray = np.empty(0, dtype=np.float64)
+        # Local hour of day of each record, as a float
+        self.hour: np.ndarray = np.empty(0, dtype=np.float64)
+        # Index into self.servers
+        self.server: np.ndarray = np.empty(0, dtype=np.int64)
+        self.humans: np.ndarray = np.empty(0, dtype=np.int64)
+        self.bots: np.ndarray = np.empty(0, dtype=np.int64)
+        self.max_players: np.ndarray = np.empty(0, dtype=np.int64)
+        # Index into self.maps
+        self.map: np.ndarray = np.empty(0, dtype=np.int64)
+        self.maps: list[str] = []
+        # [server_id, ip_port, name, region], latest name and region of each server
+        self.servers: list[list[Any]] = []
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def find_servers(self, query: str) -> list[int]:
+        """
+        Indexes of the servers matching an ip:port, a server id or part of a name.
+        """
+        for field, value in ((1, query), (0, int(query) if query.isdigit() else None)):
+            exact = [i for i, server in enumerate(self.servers) if server[field] == value]
+            if exact:
+                return exact
+        query = query.lower()
+        return [i for i, server in enumerate(self.servers) if query in server[2].lower()]
+
+
+def load_history(
+    days: int, now: float | None = None, directory: str = HISTORY_DIRECTORY
+) -> History:
+    """
+    The history of the last `days` days (today included).
+    """
+    if now is None:
+        now = time.time()
+    history = History()
+    by_ip_port: dict[str, int] = {}
+    map_codes: dict[str, int] = {}
+    columns: dict[str, list[np.ndarray]] = {
+        key: [] for key in ("time", "hour", "server", "map", *DELTA_FIELDS)
+    }
+    today = int(now // DAY) * DAY
+    first_day = today - (days - 1) * DAY
+    for day_start in range(first_day, today + DAY, DAY):
+        name = partition_name(day_start)
+        records = map_records(os.path.join(directory, f"{name}.bin"))
+        if records is None or len(records) == 0:
+            continue
+        try:
+            with open(os.path.join(directory, f"{name}.json"), "r") as file:
+                index = json.load(file)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error reading history index in load_history: {e}")
+            continue
+        # Partition server indexes to history server indexes
+        mapping = np.empty(len(index["servers"]), dtype=np.int64)
+        for i, server in enumerate(index["servers"]):
+            known = by_ip_port.get(server[1])
+            if known is None:
+                known = len(history.servers)
+                by_ip_port[server[1]] = known
+                history.servers.append(server)
+            else:
+                history.servers[known] = server
+            mapping[i] = known
+        map_mapping = np.empty(max(len(index["maps"]), 1), dtype=np.int64)
+        for i, map_name in enumerate(index["maps"]):
+            code = map_codes.get(map_name)
+            if code is None:
+                code = len(history.maps)
+                map_codes[map_name] = code
+                history.maps.append(map_name)
+            map_mapping[i] = code
+        records = np.asarray(records)
+        local_servers = records["server"].astype(np.int64)
+        if local_servers.max() >= len(mapping) or records["map"].max() >= len(index["maps"]):
+            print(f"History partition {name} refers to unknown servers in load_history")
+            continue
+        times = day_start + records["time"].astype(np.float64)
+        # Offset of local time at midday, a partition rarely spans a DST change
+        offset = time.localtime(day_start + DAY // 2).tm_gmtoff
+        columns["time"].append(times)
+        columns["hour"].append(((times + offset) % DAY) / 3600)
+        columns["server"].append(mapping[local_servers])
+        columns["map"].append(map_mapping[records["map"]])
+        values = group_cumsums(local_servers, [records[field] for field in DELTA_FIELDS])
+        for field, column in zip(DELTA_FIELDS, values):
+            columns[field].append(column)
+    if columns["time"]:
+        for key, parts in columns.items():
+            setattr(history, key, np.concatenate(parts))
+    return history
+
+
+def hour_mask(hours: np.ndarray, start_hour: float, end_hour: float) -> np.ndarray:
+    """
+    Records between two local hours of the day, wrapping past midnight if start > end.
+    """
+    if start_hour <= end_hour:
+        return (hours >= start_hour) & (hours < end_hour)
+    return (hours >= start_hour) | (hours < end_hour)
+
+
+def population_between(
+    history: History, servers: list[int], start_hour: float, end_hour: float
+) -> dict[str, float]:
+    """
+    Statistics of humans on some servers between two local hours of the day.
+    """
+    mask = np.isin(history.server, servers) & hour_mask(history.hour, start_hour, end_hour)
+    humans = history.humans[mask]
+    if len(humans) == 0:
+        return {"samples": 0}
+    return {
+        "samples": len(humans),
+        "median": float(np.median(humans)),
+        "mean": float(np.mean(humans)),
+        "p90": float(np.percentile(humans, 90)),
+        "max": float(np.max(humans)),
+    }
+
+
+def busiest_servers(
+    history: History,
+    now: float | None = None,
+    recent: float = 15 * 60,
+    window_hours: float = 1.0,
+) -> list[dict[str, Any]]:
+    """
+    Current humans of every server seen in the last `recent` seconds, with the median
+    humans it typically has at this hour (within `window_hours`) on previous days.
+    Sorted by current humans, busiest first.
+    """
+    if now is None:
+        now = time.time()
+    count = len(history.servers)
+    if len(history) == 0:
+        return []
+    # Latest record of each server
+    order = np.argsort(history.time, kind="stable")
+    servers_by_time = history.server[order]
+    _, reversed_first = np.unique(servers_by_time[::-1], return_index=True)
+    latest = order[len(order) - 1 - reversed_first]
+    current = latest[history.time[latest] >= now - recent]
+    hour = ((now + time.localtime(now).tm_gmtoff) % DAY) / 3600
+    distance = np.abs(history.hour - hour)
+    distance = np.minimum(distance, 24 - distance)
+    typical_mask = (distance <= window_hours) & (history.time < now - DAY / 2)
+    typical = group_medians(
+        history.server[typical_mask], history.humans[typical_mask], count
+    )
+    results: list[dict[str, Any]] = []
+    for row in current.tolist():
+        server = int(history.server[row])
+        server_id, ip_port, name, region = history.servers[server]
+        results.append(
+            {
+                "server_id": server_id,
+                "ip_port": ip_port,
+                "name": name,
+                "region": region,
+                "map": history.maps[history.map[row]],
+                "humans": int(history.humans[row]),
+                "max_players": int(history.max_players[row]),
+                "typical": None if np.isnan(typical[server]) else float(typical[server]),
+            }
+        )
+    results.sort(key=lambda result: result["humans"], reverse=True)
+    return results
@@ -0,0 +1,166 @@
+from typing import Any
+
+from filtered_view import CHANGE_LOG
+from filters import FILTER_PLANS, pre_filter_fields
+from models import Server, ServerFilter
+
+# Secondary indexes over the server table.
+# Each indexed field maps a value to the servers having it (by id, in a dict so
+# removal is O(1)), and the index listens to CHANGE_LOG to stay up to date through
+# merges from get_uncle and A2S refreshes.
+# An include list filter ("only map pl_upward", "only region eu") is answered
+# from the index, so only the servers it lists are run through the rest of the filter.
+# Servers are identified by value (ip_port, server_id) rather than by object,
+# since a refresh may replace the dict of a server.
+# Only servers in the table are indexed: a marked dict that is not in the table
+# (a freshly fetched one) is ignored, new servers are picked up on mark_reordered.
+
+INDEXED_FIELDS = ("server_id", "region", "cc", "map", "ip_port")
+
+
+class ServerIndex:
+    def __init__(self, servers: list[Server]):
+        # The server table, kept by reference
+        self.servers: list[Server] = servers
+        self.indexes: dict[str, dict[Any, dict[int, Server]]] = {}
+        # Indexed values of each server, to find its old bucket when a field changes
+        self.indexed_values: dict[int, dict[str, Any]] = {}
+        # Position of each server in the table, rebuilt when the table is reordered
+        self.positions: dict[int, int] | None = None
+        self.rebuild()
+        CHANGE_LOG.listeners.append(self)
+
+    def close(self):
+        if self in CHANGE_LOG.listeners:
+            CHANGE_LOG.listeners.remove(self)
+
+    def rebuild(self):
+        self.indexes = {field: {} for field in INDEXED_FIELDS}
+        self.indexed_values = {}
+        self.positions = None
+        for server in self.servers:
+            self.add(server)
+
+    def add(self, server: Server):
+        values: dict[str, Any] = {}
+        for field in INDEXED_FIELDS:
+            value = server.get(field)
+            values[field] = value
+            self.indexes[field].setdefault(value, {})[id(server)] = server
+        self.indexed_values[id(server)] = values
+        self.positions = None
+
+    def remove(self, server: Server):
+        values = self.indexed_values.pop(id(server), None)
+        if values is None:
+            return
+        for field, value in values.items():
+            self.discard(field, value, server)
+        self.positions = None
+
+    def discard(self, field: str, value: Any, server: Server):
+        bucket = self.indexes[field].get(value)
+        if bucket is None:
+            return
+        bucket.pop(id(server), None)
+        if not bucket:
+            del self.indexes[field][value]
+
+    def watched_fields(self) -> set[str]:
+        return set(INDEXED_FIELDS)
+
+    def mark(self, server: Server, fields: set[str] | tuple[str, ...]):
+        values = self.indexed_values.get(id(server))
+        if values is None:
+            # Not in the table (yet), added by mark_reordered
+            return
+        for field in INDEXED_FIELDS:
+            if field not in fields:
+                continue
+            value = server.get(field)
+            if values[field] == value:
+                continue
+            self.discard(field, values[field], server)
+            self.indexes[field].setdefault(value, {})[id(server)] = server
+            values[field] = value
+
+    def mark_removed(self, server: Server):
+        self.remove(server)
+
+    def mark_reordered(self):
+        self.positions = None
+        # Servers added to the table since the last reorder
+        for server in self.servers:
+            if id(server) not in self.indexed_values:
+                self.add(server)
+
+    def lookup(self, field: str, value: Any) -> list[Server]:
+        """
+        Servers with `field` equal to `value`, in table order.
+        """
+        return self.in_table_order(self.indexes[field].get(value, {}).values())
+
+    def get(self, field: str, value: Any) -> Server | None:
+        """
+        The first server with `field` equal to `value` (for unique fields like ip_port).
+        """
+        bucket = self.indexes[field].get(value)
+        if not bucket:
+            return None
+        return next(iter(bucket.values()))
+
+    def in_table_order(self, servers: Any) -> list[Server]:
+        if self.positions is None:
+            self.positions = {id(server): i for i, server in enumerate(self.servers)}
+        positions = self.positions
+        return sorted(
+            (server for server in servers if id(server) in positions),
+            key=lambda server: positions[id(server)],
+        )
+
+    def candidates(
+        self, server_filter: ServerFilter, fields: tuple[str, ...] | None = None
+    ) -> list[Server]:
+        """
+        Servers that can pass the include list filters on indexed fields, in table order.
+        Only the narrowest include list is used, the filter itself checks the others.
+        """
+        narrowest: list[dict[int, Server]] | None = None
+        narrowest_size = len(self.servers)
+        for field in INDEXED_FIELDS:
+            if field not in server_filter or (fields is not None and field not in fields):
+                continue
+            list_filter = server_filter[field]
+            if list_filter["exclude"]:
+                continue
+            buckets = [
+                self.indexes[field][value]
+                for value in set(list_filter["values"])
+                if value in self.indexes[field]
+            ]
+            size = sum(len(bucket) for bucket in buckets)
+            if size < narrowest_size:
+                narrowest = buckets
+                narrowest_size = size
+        if narrowest is None:
+            return self.servers
+        return self.in_table_order(
+            server for bucket in narrowest for server in bucket.values()
+        )
+
+    def apply_filters(
+        self, server_filter: ServerFilter, fields: tuple[str, ...] | None = None
+    ) -> list[Server]:
+        """
+        Same result as filters.apply_filters over the table (restricted to `fields` if given),
+        scanning only the servers allowed by the narrowest include list.
+        """
+        return FILTER_PLANS.get(server_filter, fields).apply(
+            self.candidates(server_filter, fields)
+        )
+
+    def apply_pre_filters(self, server_filter: ServerFilter) -> list[Server]:
+        """
+        Same result as filters.apply_pre_filters over the table.
+        """
+        return self.apply_filters(server_filter, pre_filter_fields(server_filter))
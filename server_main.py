@@ -1,17 +1,33 @@
-import concurrent.futures
 import json
 import os
-import re
-import subprocess
 import time
-import webbrowser
-from copy import deepcopy
-from platform import system
-
-import a2s
-import requests
-
-from models import Server
+from typing import TYPE_CHECKING, Any
+
+from filtered_view import CHANGE_LOG
+from history_store import HISTORY
+from latency_cache import DEFAULT_TTL as DEFAULT_LATENCY_TTL
+from latency_cache import write_latency_cache_to_file
+from models import Server, ServerFilter, SortServerOptions
+from options import DEFAULT_CONCURRENCY, DEFAULT_DEADLINE
+from played_journal import (
+    EVENT_UNDO,
+    JOURNAL_FILE,
+    compact_journal,
+    journal_last_played,
+    journal_lock,
+    journal_needs_compaction,
+    journal_played,
+    replay_journal,
+)
+from presence import PLAYED_FIELDS, PresenceTracker
+from server_health import write_health_to_file
+from server_snapshot import ServerSnapshot, read_snapshot, write_snapshot
+
+if TYPE_CHECKING:
+    from server_providers import ServerProvider
+
+# The network code (asyncio, requests) is imported by the functions that go
+# to the network, so reading and printing the cached servers starts fast.
 
 COUNTRY_EMOJIS: dict[str, str] = {
     "ca": "🇨🇦",
@@ -24,20 +40,68 @@ COUNTRY_EMOJIS: dict[str, str] = {
     "pl": "🇵🇱",
 }
 
+SERVERS_FILE = "cache/servers.bin"
+# Cache of older versions, still readable and used for JSON export
+SERVERS_JSON_FILE = "cache/servers.json"
+# Values written in place of the fields that change with each request
+OUTDATED_VALUES = {
+    "players": -1,
+    "max_players": -1,
+    "bots": -1,
+    "ping": -1.0,
+    "ping_median": -1.0,
+    "ping_p90": -1.0,
+    "ping_jitter": -1.0,
+    "ping_loss": -1.0,
+    "slots": -1,
+    "humans": -1,
+    "map": "[Outdated]",
+    "since_played": -1,
+}
 
-def write_servers_to_file(servers: list[Server], dirty: bool = True):
+
+class SnapshotChanges:
     """
-    Caches the servers to ./cache/servers.json
-    Create cache directory if it doesn't exist.
+    Whether the server list changed in a way the snapshot doesn't hold yet.
+    Set by merge_uncle_servers: last_played changes go to the played journal
+    and the volatile fields are not saved.
+    A flag rather than a CHANGE_LOG listener, so nothing listens when no view does.
     """
 
+    def __init__(self):
+        self.changed: bool = False
+
+
+SNAPSHOT_CHANGES = SnapshotChanges()
+
+
+def write_snapshot_and_journal(servers: list[Server], overrides: dict[str, Any] | None = None):
+    """
+    Write the full snapshot, folding the played journal into it.
+    """
     if not os.path.exists("cache"):
         os.makedirs("cache")
-    with open("cache/servers.json", "w") as file:
-        json.dump(servers, file, indent=4)
-    if dirty:
-        with open("cache/dirty.info", "w") as file:
-            _ = file.write("")
+    # No entry can be appended between the replay and the compaction
+    with journal_lock(JOURNAL_FILE):
+        # Entries appended by other processes since the servers were read
+        _ = replay_journal(servers)
+        write_snapshot(SERVERS_FILE, servers, overrides)
+        compact_journal()
+    SNAPSHOT_CHANGES.changed = False
+
+
+def write_servers_to_file(servers: list[Server], dirty: bool = True):
+    """
+    Caches the servers to ./cache/servers.bin
+    Create cache directory if it doesn't exist.
+    """
+    try:
+        write_snapshot_and_journal(servers)
+        if dirty:
+            with open("cache/dirty.info", "w") as file:
+                _ = file.write("")
+    except OSError as e:
+        print(f"Error writing servers in write_servers_to_file: {e}")
 
 
 def check_cache_dirty() -> bool:
@@ -49,38 +113,145 @@ def check_cache_dirty() -> bool:
 
 def clean_write_servers_to_file(servers: list[Server]):
     """
-    Caches the servers to ./cache/servers.json
+    Caches the servers to ./cache/servers.bin
     Create cache directory if it doesn't exist.
     Fills values that change with each request with unusual values so that the user can see that the data is old.
-    Will be slower, use other function if user may be trying use the program quickly.
+    The values are replaced while writing, the servers themselves are not changed.
     """
-    servers_copy = deepcopy(servers)
-    for server in servers_copy:
-        server["players"] = -1
-        server["max_players"] = -1
-        server["bots"] = -1
-        server["ping"] = -1.0
-        server["slots"] = -1
-        server["humans"] = -1
-        server["map"] = "[Outdated]"
-        server["since_played"] = -1
-
-    write_servers_to_file(servers_copy, False)
-    if check_cache_dirty():
-        os.remove("cache/dirty.info")
+    try:
+        write_snapshot_and_journal(servers, OUTDATED_VALUES)
+        if check_cache_dirty():
+            os.remove("cache/dirty.info")
+    except OSError as e:
+        print(f"Error writing servers in clean_write_servers_to_file: {e}")
 
 
 def read_servers_from_file() -> list[Server]:
     """
-    Reads the servers from ./cache/servers.json
-    If the file doesn't exist, return an empty list.
+    Reads the servers from ./cache/servers.bin and replays the played journal on top.
+    Falls back to importing ./cache/servers.json, written by older versions.
+    If neither file exists, return an empty list.
     """
+    servers: list[Server] = []
     try:
-        with open("cache/servers.json", "r") as file:
-            servers: list[Server] = json.load(file)
-            return servers
+        servers = read_snapshot(SERVERS_FILE)
     except FileNotFoundError:
+        if os.path.exists(SERVERS_JSON_FILE):
+            servers = import_servers_from_json(SERVERS_JSON_FILE)
+    except (OSError, ValueError) as e:
+        print(f"Error reading servers in read_servers_from_file: {e}")
+    return replay_and_compact(servers)
+
+
+def replay_and_compact(servers: list[Server]) -> list[Server]:
+    """
+    Replay the played journal on servers read from the cache, compacting it if needed.
+    """
+    _ = replay_journal(servers)
+    if servers and journal_needs_compaction():
+        try:
+            # Same values as read, so a clean snapshot stays clean
+            write_snapshot_and_journal(servers)
+        except OSError as e:
+            print(f"Error compacting the played journal in replay_and_compact: {e}")
+    return servers
+
+
+class CachedServers:
+    """
+    The cached servers, decoded from the snapshot only as far as needed.
+    get() decodes a single server, servers() all of them (as read_servers_from_file),
+    reusing the dicts get() returned so references to them stay valid.
+    """
+
+    def __init__(self):
+        self.snapshot: ServerSnapshot | None = None
+        # Servers decoded by get(), by record index
+        self.decoded: dict[int, Server] = {}
+        self.positions: dict[str, int] | None = None
+        self.played: dict[str, float] | None = None
+        self.loaded: list[Server] | None = None
+        try:
+            self.snapshot = ServerSnapshot(SERVERS_FILE)
+        except (OSError, ValueError):
+            # No snapshot (or an old JSON cache), read_servers_from_file handles it
+            self.loaded = read_servers_from_file()
+
+    def __len__(self) -> int:
+        if self.snapshot is not None:
+            return len(self.snapshot)
+        return len(self.loaded or [])
+
+    def get(self, ip_port: str) -> Server | None:
+        if self.snapshot is None:
+            return next(
+                (server for server in self.loaded or [] if server["ip_port"] == ip_port),
+                None,
+            )
+        if self.positions is None:
+            self.positions = {
+                value: index for index, value in enumerate(self.snapshot.column("ip_port"))
+            }
+            self.played = journal_last_played()
+        index = self.positions.get(ip_port)
+        if index is None:
+            return None
+        server = self.decoded.get(index)
+        if server is None:
+            server = self.snapshot[index]
+            last_played = (self.played or {}).get(ip_port)
+            if last_played is not None:
+                server["last_played"] = last_played
+                server["since_played"] = -1 if last_played == -1 else time.time() - last_played
+            self.decoded[index] = server
+        return server
+
+    def servers(self) -> list[Server]:
+        if self.loaded is None and self.snapshot is not None:
+            try:
+                servers = self.snapshot.to_servers(self.decoded)
+            finally:
+                self.snapshot.close()
+            self.snapshot = None
+            self.loaded = replay_and_compact(servers)
+        return self.loaded or []
+
+
+def servers_need_writing() -> bool:
+    """
+    Whether the servers read with read_servers_from_file changed in a way
+    only a full write of the snapshot saves.
+    """
+    return check_cache_dirty() or SNAPSHOT_CHANGES.changed or journal_needs_compaction()
+
+
+def export_servers_to_json(servers: list[Server], path: str = SERVERS_JSON_FILE):
+    """
+    Write the servers to a JSON file, in the format of the old cache.
+    """
+    try:
+        with open(path, "w") as file:
+            json.dump(servers, file, indent=4)
+    except OSError as e:
+        print(f"Error writing servers in export_servers_to_json: {e}")
+
+
+def import_servers_from_json(path: str = SERVERS_JSON_FILE) -> list[Server]:
+    """
+    Read servers from a JSON file written by export_servers_to_json or an older version.
+    """
+    try:
+        with open(path, "r") as file:
+            servers: list[Server] = json.load(file)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Error reading servers in import_servers_from_json: {e}")
         return []
+    # Fields added after the file may have been written
+    for server in servers:
+        for key in ("ping_median", "ping_p90", "ping_jitter", "ping_loss"):
+            if key not in server:
+                server[key] = -1.0
+    return servers
 
 
 def get_country_emoji(cc: str) -> str:
@@ -89,48 +260,52 @@ def get_country_emoji(cc: str) -> str:
 
 def test_ping_uncle(server: Server | str) -> float:
     """
-    Test the ping of a server using the ping command.
-    Platform specific commands are used to ping the server.
+    Test the ping of a server with the in-process latency prober.
+    ICMP is used where the system allows it, otherwise an A2S round trip.
     """
+    from latency_probe import DEFAULT_GAME_PORT
+    from refresh_pipeline import ping_async, run_pipeline
+
     ip = ""
     if isinstance(server, str):
         ip = server
+        port = DEFAULT_GAME_PORT
     else:
         ip = server["ip"]
-    if system() == "Windows":
-        command = f"ping -n 1 -w 1000 {ip}"
-    else:
-        command = f"ping -c 1 -W 1 {ip}"
+        port = server["port"]
     try:
-        output = subprocess.check_output(command, shell=True)
-        # Look for the time= part of the output (e.g. time=10ms or time=10.0 ms)
-        time = re.search(r"time=(\d+\.\d+|\d+)", output.decode())
-        if time is None:
-            return -1
-        return float(time.group(1))
-    except Exception as e:
-        print(f"Error pinging server {ip} in test_ping_uncle: {e}")
+        return run_pipeline(ping_async(ip, port))["median"]
+    except TimeoutError:
+        print(f"Timed out pinging server {ip} in test_ping_uncle")
         return -1
 
 
-def ping_multiple_servers_uncle(servers: list[Server]) -> dict[str, float]:
+def ping_multiple_servers_uncle(
+    servers: list[Server],
+    deadline: float | None = DEFAULT_DEADLINE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    samples: int = 1,
+    spread: float = 0.0,
+    cache_ttl: float | None = DEFAULT_LATENCY_TTL,
+) -> dict[str, float]:
     """
-    Pings multiple servers concurrently and returns their latency in a dictionary.
+    Pings multiple servers concurrently and returns their median latency in a dictionary.
+    Ips with a fresh entry in the latency cache are not pinged.
     """
-    results: dict[str, float] = {}
-    unique_ips = {server["ip"] for server in servers}
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = {executor.submit(test_ping_uncle, ip)
-                                   : ip for ip in unique_ips}
-        for future in concurrent.futures.as_completed(futures):
-            ip = futures[future]
-            try:
-                results[ip] = future.result()
-            except Exception as e:
-                print(
-                    f"Error pinging server {ip} in ping_multiple_servers_uncle: {e}")
-                results[ip] = -1
-    return results
+    from refresh_pipeline import ping_servers_async, run_pipeline
+
+    try:
+        results = run_pipeline(
+            ping_servers_async(servers, concurrency, samples, spread, cache_ttl),
+            deadline,
+        )
+        return {ip: stats["median"] for ip, stats in results.items()}
+    except TimeoutError:
+        print("Timed out pinging servers in ping_multiple_servers_uncle")
+        return {}
+    finally:
+        write_health_to_file()
+        write_latency_cache_to_file()
 
 
 def compile_join_url(server: Server) -> str:
@@ -138,36 +313,79 @@ def compile_join_url(server: Server) -> str:
 
 
 def get_uncle(
-    ping: bool, calculate_max_distance: bool
+    ping: bool,
+    calculate_max_distance: bool,
+    deadline: float | None = DEFAULT_DEADLINE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    samples: int = 1,
+    spread: float = 0.0,
+    cache_ttl: float | None = DEFAULT_LATENCY_TTL,
+    server_filter: ServerFilter | None = None,
 ) -> tuple[list[Server], float | None]:
     """
     Get the server list from the UncleTopia API
     https://uncletopia.com/api/servers/state
     The state API returns a JSON object with the following format:
     { "servers": [Server], lat_long: { "latitude": float, "longitude": float } }
+    The fetch and the pings run as one pipeline bounded by `deadline`.
+    Each ip is pinged `samples` times spread over `spread` seconds,
+    unless the latency cache has a fresh entry for it.
+    If a filter is given, only servers that can still pass it are pinged.
+    Returns no servers if the deadline passes.
     """
-    response = requests.get("https://uncletopia.com/api/servers/state")
-    servers: list[Server] = response.json()["servers"]
-    max_distance_filter = None
-    if ping or calculate_max_distance:
-        ping_results = ping_multiple_servers_uncle(servers)
-        for server in servers:
-            server["ping"] = ping_results.get(server["ip"], -1)
-    else:
-        for server in servers:
-            server["ping"] = -1
-    if calculate_max_distance:
-        from estimate_max_distance import estimate_max_distance
-
-        max_distance_filter = estimate_max_distance(servers)
+    from refresh_pipeline import get_uncle_async, run_pipeline
 
-    for server in servers:
-        server["slots"] = server["max_players"] - server["players"]
-        server["ip_port"] = f"{server['ip']}:{server['port']}"
-        server["last_played"] = -1
-        server["since_played"] = -1
+    try:
+        servers, max_distance = run_pipeline(
+            get_uncle_async(
+                ping,
+                calculate_max_distance,
+                concurrency,
+                samples,
+                spread,
+                cache_ttl,
+                server_filter,
+            ),
+            deadline,
+        )
+    except TimeoutError:
+        print("Timed out getting servers from the UncleTopia API in get_uncle")
+        return [], None
+    finally:
+        write_health_to_file()
+        write_latency_cache_to_file()
+    HISTORY.record(servers)
+    return servers, max_distance
+
+
+def get_servers(
+    providers: list["ServerProvider"],
+    deadline: float | None = DEFAULT_DEADLINE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    server_filter: ServerFilter | None = None,
+    tracker: PresenceTracker | None = None,
+) -> tuple[list[Server], bool]:
+    """
+    Get the server list from every provider, de-duplicated by ip:port.
+    Servers from providers that only give addresses are queried over A2S as they arrive.
+    Also returns whether the list is complete, False if a provider failed
+    or the deadline passed.
+    Only servers with current values (from their provider or an A2S answer)
+    are recorded in the history.
+    """
+    from refresh_pipeline import run_pipeline
+    from server_providers import get_servers_async
 
-    return servers, max_distance_filter
+    try:
+        servers, answered, complete = run_pipeline(
+            get_servers_async(providers, server_filter, tracker, concurrency, deadline),
+            None,
+        )
+    finally:
+        write_health_to_file()
+        write_latency_cache_to_file()
+    HISTORY.record(answered)
+    return servers, complete
 
 
 def update_cache_uncle(
@@ -177,62 +395,102 @@ def update_cache_uncle(
     Update the cache of servers from the UncleTopia API.
     """
     servers, new_max_distance = get_uncle(False, calculate_max_distance)
-    write_servers_to_file(servers)
+    # An empty list is a failed fetch, the cache is kept
+    if servers:
+        write_servers_to_file(servers)
     return servers, new_max_distance
 
 
-def update_server_with_steam_info(server: Server, username: str = ""):
+def update_server_with_steam_info(
+    server: Server, tracker: PresenceTracker | None = None
+):
     """
     Update the server information with the steam information.
     Updates player count, map, and ping.
     """
+    from refresh_pipeline import query_server_async, run_pipeline
+
     try:
-        address = (server["ip"], server["port"])
-        info = a2s.info(address)
-        server["players"] = info.player_count
-        server["max_players"] = info.max_players
-        server["slots"] = info.max_players - info.player_count
-        server["bots"] = info.bot_count
-        server["map"] = info.map_name
-        server["ping"] = info.ping * 1000
-        if username:
-            players = a2s.players(address)
-            for player in players:
-                if player.name == username:
-                    print(f"Found {username} in {server['name']}")
-                    server["last_played"] = time.time()
-                    server["since_played"] = 0
-                    break
-    except Exception as e:
+        run_pipeline(query_server_async(server, tracker))
+    except TimeoutError:
         print(
-            f"Error updating server {server['ip']} with steam info in update_server_with_steam_info: {e}"
+            f"Timed out updating server {server['ip']} with steam info in update_server_with_steam_info"
         )
 
 
-def update_servers_with_steam_info(servers: list[Server], username: str = ""):
+def update_servers_with_steam_info(
+    servers: list[Server],
+    tracker: PresenceTracker | None = None,
+    deadline: float | None = DEFAULT_DEADLINE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    server_filter: ServerFilter | None = None,
+) -> list[Server]:
     """
     Update the server information with the steam information.
     Updates player count, map, and ping.
+    Servers that have not answered by the deadline keep their previous values.
+    If a filter is given, servers that can't pass it are not queried.
+    Returns the servers that answered, only those are recorded in the history.
     """
+    from refresh_pipeline import query_servers_async, run_pipeline
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = {
-            executor.submit(update_server_with_steam_info, server, username): server
-            for server in servers
-        }
-        for future in concurrent.futures.as_completed(futures):
-            try:
-                future.result()
-            except Exception as e:
-                server_ip = futures[future]["ip"]
-                print(
-                    f"Error updating server {server_ip} with steam info in update_servers_with_steam_info: {e}"
-                )
+    try:
+        answered = run_pipeline(
+            query_servers_async(servers, tracker, concurrency, server_filter, deadline),
+            None,
+        )
+    finally:
+        write_health_to_file()
+        write_latency_cache_to_file()
+    HISTORY.record(answered)
+    return answered
+
+
+def find_best_server(
+    servers: list[Server],
+    server_filter: ServerFilter,
+    sort_object: SortServerOptions,
+    tracker: PresenceTracker | None = None,
+    deadline: float | None = DEFAULT_DEADLINE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> tuple[Server | None, list[Server], list[Server]]:
+    """
+    Query servers in expected rank order and stop as soon as the best one is known.
+    Returns the best server passing the filters (or None), the servers that were queried
+    and those of them that answered.
+    When the deadline passes, the best server that answered so far is returned.
+    """
+    from refresh_pipeline import find_best_server_async, run_pipeline
+
+    try:
+        best, queried, answered = run_pipeline(
+            find_best_server_async(
+                servers, server_filter, sort_object, tracker, concurrency, deadline
+            ),
+            None,
+        )
+        HISTORY.record(answered)
+        return best, queried, answered
+    finally:
+        write_health_to_file()
+        write_latency_cache_to_file()
 
 
 def update_last_played(server: Server):
     server["last_played"] = time.time()
     server["since_played"] = 0
+    CHANGE_LOG.mark(server, PLAYED_FIELDS)
+    journal_played(server)
+
+
+def restore_last_played(server: Server, last_played: float):
+    """
+    Undo update_last_played, putting back the previous last_played time.
+    """
+    server["last_played"] = last_played
+    server["since_played"] = -1 if last_played == -1 else time.time() - last_played
+    CHANGE_LOG.mark(server, PLAYED_FIELDS)
+    journal_played(server, EVENT_UNDO)
 
 
 def format_last_played(server: Server) -> str:
@@ -253,6 +511,10 @@ def format_since_played(server: Server) -> str:
 
 
 def join_server(server: Server | str):
+    import subprocess
+    import webbrowser
+    from platform import system
+
     url = ""
     if isinstance(server, str):
         url = server
@@ -275,6 +537,7 @@ def join_server(server: Server | str):
 def refresh_since_played(server: Server):
     if server["last_played"] != -1:
         server["since_played"] = time.time() - server["last_played"]
+        CHANGE_LOG.mark(server, ("since_played",))
 
 
 def refresh_since_played_all(servers: list[Server]):
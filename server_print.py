@@ -1,6 +1,7 @@
 from models import DisplayLineCompiled, Options, Server
 from object_grid.grid_layout import GridLayout
 from object_grid.grid_line import GridLine
+from options import get_grid_display, get_join_display
 from server_main import (
     format_last_played,
     format_since_played,
@@ -33,6 +34,11 @@ def create_element_by_server(
     server_dict["since_played"] = format_since_played(server)
     server_dict["cc_emoji"] = get_country_emoji(server["cc"])
     server_dict["ping"] = f"{server['ping']:.0f}"
+    for key in ("ping_median", "ping_p90", "ping_jitter"):
+        if key in server:
+            server_dict[key] = f"{server[key]:.0f}"
+    if "ping_loss" in server:
+        server_dict["ping_loss"] = f"{server['ping_loss']:.0f}%"
     utrim = "Uncletopia | "
     server_dict["name_utrim"] = server["name"]
     if server["name"].startswith(utrim):
@@ -53,9 +59,7 @@ def print_server_grid(servers: list[Server], options: Options):
     Print the servers in a grid layout.
     """
     grid = GridLayout()
-    grid_display = options["display"]["grid_display_compiled"]
-    if grid_display is None:
-        raise ValueError("Grid display is not compiled")
+    grid_display = get_grid_display(options)
     misc = options["misc"]
     fast_mode: bool = misc["fast_grid_calculation"]
     for i, server in enumerate(servers, start=1):
@@ -69,9 +73,7 @@ def pretty_print_server(server: Server, options: Options):
     Pretty print a server for the user.
     Printing depends on the terminal width.
     """
-    join_display = options["display"]["join_display_compiled"]
-    if join_display is None:
-        raise ValueError("Grid display is not compiled")
+    join_display = get_join_display(options)
     grid = GridLayout()
     create_element_by_server(server, grid, join_display)
 
@@ -0,0 +1,229 @@
+import asyncio
+import ipaddress
+from collections.abc import AsyncIterator
+from typing import Protocol
+
+from a2s_engine import A2SEngine
+from filters import apply_static_filters
+from latency_cache import DEFAULT_TTL as DEFAULT_LATENCY_TTL
+from latency_probe import apply_latency_stats, latency_stats
+from master_server import MasterServerClient, parse_master_address
+from models import Options, Server, ServerFilter
+from options import DEFAULT_MASTER_FILTER, DEFAULT_MASTER_SERVER
+from presence import PresenceTracker
+from refresh_pipeline import DEFAULT_CONCURRENCY, get_uncle_async, query_server_async
+
+# Server providers: the sources servers come from.
+# Every provider streams batches of servers, which are merged into one list
+# de-duplicated by ip:port. Providers earlier in the list win a duplicate,
+# so richer data (UncleTopia regions and locations) is kept over bare addresses.
+# Servers from providers that only give addresses are queried over A2S as soon
+# as their batch arrives, while the rest of the list is still streaming.
+
+UNCLETOPIA_PROVIDER = "uncletopia"
+MASTER_SERVER_PROVIDER = "master"
+DEFAULT_PROVIDERS = [UNCLETOPIA_PROVIDER]
+
+
+class ServerProvider(Protocol):
+    name: str
+    # True if the servers only have an address and have to be queried over A2S
+    needs_query: bool
+
+    def stream(self) -> AsyncIterator[list[Server]]: ...
+
+
+class UncletopiaProvider:
+    """
+    The UncleTopia state API, with its pings and max distance estimate.
+    """
+
+    name = UNCLETOPIA_PROVIDER
+    needs_query = False
+
+    def __init__(
+        self,
+        ping: bool,
+        calculate_max_distance: bool,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        samples: int = 1,
+        spread: float = 0.0,
+        cache_ttl: float | None = DEFAULT_LATENCY_TTL,
+        server_filter: ServerFilter | None = None,
+    ):
+        self.ping: bool = ping
+        self.calculate_max_distance: bool = calculate_max_distance
+        self.concurrency: int = concurrency
+        self.samples: int = samples
+        self.spread: float = spread
+        self.cache_ttl: float | None = cache_ttl
+        self.server_filter: ServerFilter | None = server_filter
+        # Set once the stream is done, if calculate_max_distance
+        self.max_distance: float | None = None
+
+    async def stream(self) -> AsyncIterator[list[Server]]:
+        servers, self.max_distance = await get_uncle_async(
+            self.ping,
+            self.calculate_max_distance,
+            self.concurrency,
+            self.samples,
+            self.spread,
+            self.cache_ttl,
+            self.server_filter,
+        )
+        yield servers
+
+
+def master_server_entry(ip: str, port: int) -> Server:
+    """
+    A server known only by its address, the rest is filled in by A2S.
+    """
+    server: Server = {
+        # Stable id derived from the address, above any UncleTopia server id
+        "server_id": (int(ipaddress.IPv4Address(ip)) << 16) | port,
+        "host": ip,
+        "port": port,
+        "ip": ip,
+        "name": "",
+        "name_short": "",
+        "region": "",
+        "cc": "",
+        "players": 0,
+        "max_players": 0,
+        "bots": 0,
+        "map": "",
+        "game_types": [],
+        "latitude": 0.0,
+        "longitude": 0.0,
+        # Unknown location
+        "distance": -1,
+        "humans": 0,
+        "slots": 0,
+        "ip_port": f"{ip}:{port}",
+        "last_played": -1,
+        "since_played": -1,
+    }  # type: ignore
+    apply_latency_stats(server, latency_stats([]))
+    return server
+
+
+class MasterServerProvider:
+    """
+    The Valve master server, filtered with a master server filter string (e.g. \\gamedir\\tf).
+    """
+
+    name = MASTER_SERVER_PROVIDER
+    needs_query = True
+
+    def __init__(
+        self,
+        address: str = DEFAULT_MASTER_SERVER,
+        filter_string: str = DEFAULT_MASTER_FILTER,
+    ):
+        self.address: str = address
+        self.filter_string: str = filter_string
+
+    async def stream(self) -> AsyncIterator[list[Server]]:
+        async with await MasterServerClient.create(
+            parse_master_address(self.address)
+        ) as client:
+            async for addresses in client.stream(self.filter_string):
+                yield [master_server_entry(ip, port) for ip, port in addresses]
+
+
+def make_providers(
+    options: Options, ping: bool, calculate_max_distance: bool
+) -> list[ServerProvider]:
+    """
+    Build the providers listed in the server_providers option, in order.
+    """
+    misc = options["misc"]
+    providers: list[ServerProvider] = []
+    for name in misc["server_providers"]:
+        if name == UNCLETOPIA_PROVIDER:
+            providers.append(
+                UncletopiaProvider(
+                    ping,
+                    calculate_max_distance,
+                    misc["max_concurrent_queries"],
+                    misc["ping_samples"],
+                    misc["ping_sample_spread"],
+                    misc["latency_cache_ttl"],
+                    options["filters"],
+                )
+            )
+        elif name == MASTER_SERVER_PROVIDER:
+            providers.append(
+                MasterServerProvider(misc["master_server"], misc["master_server_filter"])
+            )
+        else:
+            print(f"Unknown server provider {name} in make_providers")
+    return providers
+
+
+async def get_servers_async(
+    providers: list[ServerProvider],
+    server_filter: ServerFilter | None = None,
+    tracker: PresenceTracker | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    deadline: float | None = None,
+) -> tuple[list[Server], list[Server], bool]:
+    """
+    Stream every provider at once into one server list, de-duplicated by ip:port.
+    Servers that need it are queried over A2S while the providers are still streaming,
+    unless they can't pass the static part of the filter.
+    When the deadline passes, the servers received so far are returned.
+    Also returns the servers with current values (from a provider that
+    doesn't need a query, or that answered their query) and whether every
+    provider finished streaming before the deadline.
+    """
+    servers: list[Server] = []
+    # By id, a server can be answered by its query and listed by a provider
+    answered: dict[int, Server] = {}
+    complete = True
+    by_address: dict[str, tuple[int, Server]] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def query(server: Server, engine: A2SEngine):
+        if await query_server_async(server, tracker, semaphore, engine):
+            answered[id(server)] = server
+
+    async def consume(priority: int, provider: ServerProvider, group: asyncio.TaskGroup):
+        nonlocal complete
+        try:
+            async for batch in provider.stream():
+                for server in batch:
+                    known = by_address.get(server["ip_port"])
+                    if known is not None:
+                        known_priority, known_server = known
+                        if priority < known_priority:
+                            known_server.update(server)
+                            by_address[server["ip_port"]] = (priority, known_server)
+                            if not provider.needs_query:
+                                answered[id(known_server)] = known_server
+                        continue
+                    by_address[server["ip_port"]] = (priority, server)
+                    servers.append(server)
+                    if not provider.needs_query:
+                        answered[id(server)] = server
+                    elif server_filter is None or apply_static_filters(
+                        [server], server_filter
+                    ):
+                        _ = group.create_task(query(server, engine))
+        except TimeoutError:
+            complete = False
+            print(f"Timed out streaming servers from {provider.name} in get_servers_async")
+        except OSError as e:
+            complete = False
+            print(f"Error streaming servers from {provider.name} in get_servers_async: {e}")
+
+    async with await A2SEngine.create() as engine:
+        try:
+            async with asyncio.timeout(deadline):
+                async with asyncio.TaskGroup() as group:
+                    for priority, provider in enumerate(providers):
+                        _ = group.create_task(consume(priority, provider, group))
+        except TimeoutError:
+            complete = False
+            print("Deadline passed in get_servers_async, using the servers received so far")
+    return servers, list(answered.values()), complete
@@ -0,0 +1,336 @@
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Iterator
+from operator import itemgetter
+from typing import Any
+
+from models import Server
+
+# Binary snapshot of the server list, replacing the JSON cache.
+# Layout, little endian:
+#   header       magic, version, field count, record count, pool offset
+#   field table  one type code per field, then the pool index of each field name
+#   records      one fixed-width record per server
+#   string pool  count, count + 1 offsets into the blob, utf-8 blob
+# Strings are interned in the pool, so a record is only numbers and every
+# region, map and country is stored once. game_types is stored as one pool
+# string joined with LIST_SEPARATOR.
+# The field table makes a snapshot readable after fields are added or removed:
+# fields missing from the file get their default value.
+# Snapshots are written to a temporary file and renamed over the old one,
+# so a reader never sees a partial snapshot.
+
+MAGIC = b"TF2SRVS\x00"
+VERSION = 1
+HEADER = struct.Struct("<8sHHIQ")
+POOL_COUNT = struct.Struct("<I")
+LIST_SEPARATOR = "\x1f"
+
+TYPE_INT = b"i"
+TYPE_FLOAT = b"f"
+TYPE_STR = b"s"
+TYPE_LIST = b"l"
+STRUCT_CODES = {TYPE_INT: "q", TYPE_FLOAT: "d", TYPE_STR: "I", TYPE_LIST: "I"}
+DEFAULTS: dict[bytes, Any] = {TYPE_INT: -1, TYPE_FLOAT: -1.0, TYPE_STR: "", TYPE_LIST: []}
+
+
+def field_type(kind: Any) -> bytes:
+    if kind is int:
+        return TYPE_INT
+    if kind is float:
+        return TYPE_FLOAT
+    if kind is str:
+        return TYPE_STR
+    return TYPE_LIST
+
+
+FIELDS = tuple(Server.__annotations__)
+FIELD_TYPES = tuple(field_type(kind) for kind in Server.__annotations__.values())
+FIELD_GETTER = itemgetter(*FIELDS)
+
+
+def record_struct(types: tuple[bytes, ...]) -> struct.Struct:
+    return struct.Struct("<" + "".join(STRUCT_CODES[kind] for kind in types))
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+class StringPool:
+    def __init__(self):
+        self.indexes: dict[str, int] = {}
+        self.strings: list[str] = []
+
+    def intern(self, value: str) -> int:
+        index = self.indexes.get(value)
+        if index is None:
+            index = len(self.strings)
+            self.indexes[value] = index
+            self.strings.append(value)
+        return index
+
+    def to_bytes(self) -> bytes:
+        encoded = [value.encode() for value in self.strings]
+        offsets = [0]
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        return (
+            POOL_COUNT.pack(len(encoded))
+            + struct.pack(f"<{len(offsets)}I", *offsets)
+            + b"".join(encoded)
+        )
+
+
+def coerce(value: Any, kind: bytes) -> Any:
+    """
+    Best effort conversion of a value that did not fit its field type.
+    """
+    try:
+        if kind == TYPE_INT:
+            return int(value)
+        if kind == TYPE_FLOAT:
+            return float(value)
+    except (TypeError, ValueError):
+        pass
+    return DEFAULTS[kind]
+
+
+def write_snapshot(
+    path: str,
+    servers: list[Server],
+    overrides: dict[str, Any] | None = None,
+    chunk_size: int = 1024,
+):
+    """
+    Write the servers to a snapshot at `path`, atomically.
+    Fields in `overrides` are written with the given value instead of the server's,
+    without copying the servers.
+    """
+    overrides = overrides or {}
+    pool = StringPool()
+    for field in FIELDS:
+        pool.intern(field)
+    record = record_struct(FIELD_TYPES)
+    # Positions of the fields needing a conversion before packing
+    strings = [i for i, kind in enumerate(FIELD_TYPES) if kind == TYPE_STR]
+    lists = [i for i, kind in enumerate(FIELD_TYPES) if kind == TYPE_LIST]
+    masked = [
+        (i, overrides[field]) for i, field in enumerate(FIELDS) if field in overrides
+    ]
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as file:
+        _ = file.write(HEADER.pack(MAGIC, VERSION, len(FIELDS), len(servers), 0))
+        _ = file.write(b"".join(FIELD_TYPES))
+        _ = file.write(struct.pack(f"<{len(FIELDS)}I", *range(len(FIELDS))))
+        chunk = bytearray()
+        for count, server in enumerate(servers, 1):
+            try:
+                row = list(FIELD_GETTER(server))
+            except KeyError:
+                row = [server.get(field, DEFAULTS[kind]) for field, kind in zip(FIELDS, FIELD_TYPES)]
+            for i, value in masked:
+                row[i] = value
+            for i in strings:
+                row[i] = pool.intern(row[i] if isinstance(row[i], str) else "")
+            for i in lists:
+                row[i] = pool.intern(LIST_SEPARATOR.join(row[i] or ()))
+            try:
+                chunk += record.pack(*row)
+            except struct.error:
+                chunk += record.pack(
+                    *(
+                        value if kind in (TYPE_STR, TYPE_LIST) else coerce(value, kind)
+                        for value, kind in zip(row, FIELD_TYPES)
+                    )
+                )
+            if count % chunk_size == 0:
+                _ = file.write(chunk)
+                chunk = bytearray()
+        _ = file.write(chunk)
+        pool_offset = file.tell()
+        _ = file.write(pool.to_bytes())
+        _ = file.seek(0)
+        _ = file.write(HEADER.pack(MAGIC, VERSION, len(FIELDS), len(servers), pool_offset))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+class ServerSnapshot:
+    """
+    A snapshot file mapped in memory. Records and strings are decoded on access.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self.mmap: mmap.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view: memoryview | None = None
+        try:
+            self.parse()
+        except (struct.error, KeyError) as e:
+            self.close()
+            raise SnapshotError(f"Corrupt snapshot: {e}") from e
+        except SnapshotError:
+            self.close()
+            raise
+
+    def parse(self):
+        magic, version, field_count, count, pool_offset = HEADER.unpack_from(self.mmap)
+        if magic != MAGIC:
+            raise SnapshotError("Not a server snapshot")
+        if version != VERSION:
+            raise SnapshotError(f"Unsupported snapshot version {version}")
+        offset = HEADER.size
+        self.types: tuple[bytes, ...] = tuple(
+            self.mmap[i: i + 1] for i in range(offset, offset + field_count)
+        )
+        offset += field_count
+        name_indexes = struct.unpack_from(f"<{field_count}I", self.mmap, offset)
+        offset += 4 * field_count
+        self.record: struct.Struct = record_struct(self.types)
+        self.records_offset: int = offset
+        self.count: int = count
+        if self.records_offset + count * self.record.size > pool_offset:
+            raise SnapshotError("Snapshot records overlap the string pool")
+        (pool_count,) = POOL_COUNT.unpack_from(self.mmap, pool_offset)
+        start = pool_offset + POOL_COUNT.size
+        end = start + 4 * (pool_count + 1)
+        if end > len(self.mmap):
+            raise SnapshotError("Snapshot string pool is truncated")
+        if sys.byteorder == "little":
+            # Read in place, a pool holds a few strings per server
+            self.view = memoryview(self.mmap)
+            self.offsets: Any = self.view[start:end].cast("I")
+        else:
+            self.offsets = struct.unpack_from(f"<{pool_count + 1}I", self.mmap, start)
+        self.blob_offset: int = pool_offset + POOL_COUNT.size + 4 * (pool_count + 1)
+        self.pool_count: int = pool_count
+        # Strings decoded so far, by pool index
+        self.strings: dict[int, str] = {}
+        self.fields: tuple[str, ...] = tuple(self.string(i) for i in name_indexes)
+        # Fields of the current Server type the snapshot doesn't have
+        self.missing: dict[str, Any] = {
+            field: DEFAULTS[kind]
+            for field, kind in zip(FIELDS, FIELD_TYPES)
+            if field not in self.fields
+        }
+
+    def close(self):
+        if self.view is not None:
+            self.offsets = ()
+            self.view.release()
+            self.view = None
+        self.mmap.close()
+
+    def __enter__(self) -> "ServerSnapshot":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def string(self, index: int) -> str:
+        value = self.strings.get(index)
+        if value is None:
+            if not 0 <= index < self.pool_count:
+                raise SnapshotError(f"String {index} is not in the pool")
+            start = self.blob_offset + self.offsets[index]
+            end = self.blob_offset + self.offsets[index + 1]
+            value = self.mmap[start:end].decode()
+            self.strings[index] = value
+        return value
+
+    def decode(self, row: tuple[Any, ...], strings: list[str] | None = None) -> Server:
+        string = self.string if strings is None else strings.__getitem__
+        server: dict[str, Any] = {}
+        for field, kind, value in zip(self.fields, self.types, row):
+            if kind == TYPE_STR:
+                value = string(value)
+            elif kind == TYPE_LIST:
+                joined = string(value)
+                value = joined.split(LIST_SEPARATOR) if joined else []
+            server[field] = value
+        server.update(self.missing)
+        return server  # type: ignore
+
+    def __getitem__(self, index: int) -> Server:
+        if not -self.count <= index < self.count:
+            raise IndexError(index)
+        index %= self.count
+        row = self.record.unpack_from(self.mmap, self.records_offset + index * self.record.size)
+        return self.decode(row)
+
+    def __iter__(self) -> Iterator[Server]:
+        for i in range(self.count):
+            yield self[i]
+
+    def column(self, field: str) -> list[Any]:
+        """
+        Values of one field for every record, without decoding the rest of the records.
+        """
+        position = self.fields.index(field)
+        kind = self.types[position]
+        offset = self.records_offset + record_struct(self.types[:position]).size
+        value = struct.Struct("<" + STRUCT_CODES[kind])
+        size = self.record.size
+        values = [
+            value.unpack_from(self.mmap, offset + i * size)[0] for i in range(self.count)
+        ]
+        if kind == TYPE_STR:
+            return list(map(self.string, values))
+        if kind == TYPE_LIST:
+            return [
+                joined.split(LIST_SEPARATOR) if joined else []
+                for joined in map(self.string, values)
+            ]
+        return values
+
+    def all_strings(self) -> list[str]:
+        """
+        Decode the whole string pool.
+        """
+        blob = self.mmap[self.blob_offset: self.blob_offset + self.offsets[self.pool_count]]
+        text = blob.decode()
+        if len(text) != len(blob):
+            # Byte offsets are not character offsets once there is non-ASCII text
+            return [self.string(i) for i in range(self.pool_count)]
+        offsets = self.offsets
+        return [text[offsets[i]: offsets[i + 1]] for i in range(self.pool_count)]
+
+    def to_servers(self, decoded: dict[int, Server] | None = None) -> list[Server]:
+        """
+        Decode every record at once, with the whole string pool decoded up front.
+        Records already in `decoded` (by index) are taken from it instead.
+        """
+        strings = self.all_strings()
+        end = self.records_offset + self.count * self.record.size
+        rows = self.record.iter_unpack(self.mmap[self.records_offset: end])
+        # Decoded column by column, one list comprehension per string field
+        columns: list[Any] = list(zip(*rows)) or [()] * len(self.fields)
+        for i, kind in enumerate(self.types):
+            if kind == TYPE_STR:
+                columns[i] = list(map(strings.__getitem__, columns[i]))
+            elif kind == TYPE_LIST:
+                columns[i] = [
+                    strings[index].split(LIST_SEPARATOR) if strings[index] else []
+                    for index in columns[i]
+                ]
+        fields = self.fields
+        servers: list[Server] = [dict(zip(fields, row)) for row in zip(*columns)]  # type: ignore
+        if self.missing:
+            for server in servers:
+                server.update(self.missing)  # type: ignore
+        if decoded:
+            for index, server in decoded.items():
+                servers[index] = server
+        return servers
+
+
+def read_snapshot(path: str) -> list[Server]:
+    with ServerSnapshot(path) as snapshot:
+        return snapshot.to_servers()
@@ -1,9 +1,17 @@
+import heapq
 import json
+from collections.abc import Callable
 from copy import deepcopy
+from operator import itemgetter
+from typing import Any
 
-from models import Server, SortServerOptions
+from models import Server, ServerFilter, SortKey, SortServerOptions
 
-DEFAULT_SORT: SortServerOptions = {"sort_by": "players", "reverse": True}
+DEFAULT_SORT: SortServerOptions = {
+    "sort_by": "players",
+    "reverse": True,
+    "then_by": [],
+}
 
 
 def get_default_sort() -> SortServerOptions:
@@ -29,17 +37,157 @@ def read_sort() -> SortServerOptions:
         return get_default_sort()
 
 
+class Descending:
+    """
+    Wraps a value so it sorts in reverse, for fields that can't be negated (strings).
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value: Any = value
+
+    def __lt__(self, other: "Descending") -> bool:
+        return other.value < self.value
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Descending) and self.value == other.value
+
+
+def sort_keys(sort_object: SortServerOptions) -> list[SortKey]:
+    """
+    Every key of a sort, the primary one first.
+    """
+    primary: SortKey = {"sort_by": sort_object["sort_by"], "reverse": sort_object["reverse"]}
+    return [primary, *sort_object.get("then_by", [])]
+
+
+def sort_key_function(
+    sort_object: SortServerOptions, sample: Server | None = None
+) -> Callable[[Server], Any]:
+    """
+    Build a function giving the ascending sort key of a server (a tuple with tie-breakers).
+    Reversed numeric keys are negated, reversed strings are wrapped in Descending.
+    `sample` is used to check the keys exist and to pick the reversal for each field.
+    """
+    getters: list[Callable[[Server], Any]] = []
+    for key in sort_keys(sort_object):
+        field = key["sort_by"]
+        if sample is not None and field not in sample:
+            raise ValueError("Invalid sort key")
+        if field == "game_types":
+            raise ValueError("Cannot sort by game types")
+        if not key["reverse"]:
+            getters.append(itemgetter(field))
+        elif sample is not None and isinstance(sample[field], str):
+            getters.append(lambda server, field=field: Descending(server[field]))
+        else:
+            getters.append(lambda server, field=field: -server[field])
+    if len(getters) == 1:
+        return getters[0]
+    return lambda server: tuple(getter(server) for getter in getters)
+
+
 def sort_servers(servers: list[Server], sort_object: SortServerOptions):
     """
     Sort the servers list passed in based on the sort object.
     Modifies the list in place.
+    Sort keys are computed once per server, ties keep their order.
     """
     if not servers:
         return
-    if sort_object["sort_by"] not in servers[0]:
-        raise ValueError("Invalid sort key")
-    if sort_object["sort_by"] == "game_types":
-        raise ValueError("Cannot sort by game types")
-    servers.sort(
-        key=lambda x: x[sort_object["sort_by"]], reverse=sort_object["reverse"]
-    )
+    servers.sort(key=sort_key_function(sort_object, servers[0]))
+
+
+def top_servers(
+    servers: list[Server], sort_object: SortServerOptions, count: int
+) -> list[Server]:
+    """
+    The first `count` servers of the sorted list, without sorting the whole list
+    (O(n log count) with a heap). Same order and tie breaking as sort_servers.
+    """
+    if not servers or count <= 0:
+        return []
+    key = sort_key_function(sort_object, servers[0])
+    if count == 1:
+        return [min(servers, key=key)]
+    return heapq.nsmallest(count, servers, key=key)
+
+
+# Sort fields whose value can't change when a server is queried again
+STATIC_SORT_FIELDS = (
+    "server_id",
+    "host",
+    "port",
+    "ip",
+    "ip_port",
+    "name",
+    "name_short",
+    "region",
+    "cc",
+    "latitude",
+    "longitude",
+    "distance",
+    "last_played",
+    "since_played",
+)
+# Player count fields, between 0 and max_players
+COUNT_SORT_FIELDS = ("players", "slots", "bots", "humans")
+LATENCY_SORT_FIELDS = ("ping", "ping_median", "ping_p90")
+# How many ms a ping may improve by when measured again, at least
+PING_MARGIN = 10.0
+
+
+def sort_key_bound(
+    server: Server, sort_key: SortKey, server_filter: ServerFilter
+) -> float | str | None:
+    """
+    Best sort value a server could have once it is queried again, from its last known values,
+    assuming it passes the filters.
+    Returns None if the value can't be bounded (the server could rank anywhere).
+    """
+    sort_by = sort_key["sort_by"]
+    reverse = sort_key["reverse"]
+    if sort_by in STATIC_SORT_FIELDS:
+        return server[sort_by]
+    if sort_by in COUNT_SORT_FIELDS:
+        if server["max_players"] <= 0 or server[sort_by] < 0:
+            # Never answered (a master server entry or an outdated cache value),
+            # the real max_players is unknown
+            return None
+        low, high = 0, server["max_players"]
+        # players + slots = max_players, so a minimum on one caps the other
+        if sort_by == "players":
+            high -= filter_min(server_filter, "slots")
+        elif sort_by == "slots":
+            high -= filter_min(server_filter, "players")
+        range_filter = server_filter.get(sort_by)
+        if range_filter is not None and "min" in range_filter:
+            if range_filter["min"] is not None:
+                low = max(low, range_filter["min"])
+            if range_filter["max"] is not None:
+                high = min(high, range_filter["max"])
+        return high if reverse else low
+    if sort_by in LATENCY_SORT_FIELDS:
+        if reverse:
+            return None
+        if server[sort_by] < 0:
+            return 0
+        return max(0, server[sort_by] - max(2 * server["ping_jitter"], PING_MARGIN))
+    return None
+
+
+def filter_min(server_filter: ServerFilter, key: str) -> float:
+    range_filter = server_filter.get(key)
+    if range_filter is None or range_filter["min"] is None:
+        return 0
+    return range_filter["min"]
+
+
+def ranks_before(value: float | str, other: float | str, sort_key: SortKey) -> bool:
+    """
+    True if a server with sort value `value` is sorted strictly before one with `other`.
+    """
+    if sort_key["reverse"]:
+        return value > other  # type: ignore
+    return value < other  # type: ignore
@@ -0,0 +1,250 @@
+import time
+from collections.abc import Iterator, MutableMapping
+from operator import itemgetter
+from typing import Any
+
+import numpy as np
+
+from models import Server, ServerFilter, SortServerOptions
+from server_sort import sort_keys
+
+# Columnar server table.
+# Numeric fields are NumPy arrays, region/cc/map are category codes into a
+# list of distinct values, and the remaining strings stay Python lists.
+# Filters are evaluated as boolean masks over whole columns and sorting is an argsort,
+# so filtering and sorting a master-server-sized list (10k+ servers) stays cheap.
+# ServerRow is a dict-like view of one row for the template and printing code.
+# Building a table costs several filter passes over the list of dicts, so it is
+# only used where one table answers many queries: the scout daemon builds one per
+# refresh. Menus, quick print and auto_join filter once per refresh and keep
+# using the filter plans (and FilteredView / ServerIndex) on the list.
+
+CATEGORY_FIELDS = ("region", "cc", "map")
+INT_FIELDS = tuple(key for key, kind in Server.__annotations__.items() if kind is int)
+FLOAT_FIELDS = tuple(key for key, kind in Server.__annotations__.items() if kind is float)
+NUMERIC_FIELDS = INT_FIELDS + FLOAT_FIELDS
+OBJECT_FIELDS = tuple(
+    key
+    for key in Server.__annotations__
+    if key not in NUMERIC_FIELDS and key not in CATEGORY_FIELDS
+)
+FIELDS = tuple(Server.__annotations__)
+NUMERIC_GETTER = itemgetter(*NUMERIC_FIELDS)
+
+
+class ServerTable:
+    def __init__(self, size: int = 0):
+        self.size: int = size
+        self.numeric: dict[str, np.ndarray] = {}
+        for key in INT_FIELDS:
+            self.numeric[key] = np.full(size, -1, dtype=np.int64)
+        for key in FLOAT_FIELDS:
+            self.numeric[key] = np.full(size, -1, dtype=np.float64)
+        self.codes: dict[str, np.ndarray] = {
+            key: np.zeros(size, dtype=np.int32) for key in CATEGORY_FIELDS
+        }
+        # Distinct values of each category field, and their codes
+        self.categories: dict[str, list[str]] = {key: [""] for key in CATEGORY_FIELDS}
+        self.category_codes: dict[str, dict[str, int]] = {
+            key: {"": 0} for key in CATEGORY_FIELDS
+        }
+        self.objects: dict[str, list[Any]] = {
+            key: [None] * size for key in OBJECT_FIELDS
+        }
+
+    @classmethod
+    def from_servers(cls, servers: list[Server]) -> "ServerTable":
+        table = cls(len(servers))
+        if not servers:
+            return table
+        try:
+            # One itemgetter call per server instead of one dict lookup per field
+            rows = list(map(NUMERIC_GETTER, servers))
+        except KeyError:
+            rows = [tuple(server.get(key, -1) for key in NUMERIC_FIELDS) for server in servers]
+        for key, column in zip(NUMERIC_FIELDS, zip(*rows)):
+            table.numeric[key] = np.array(column, dtype=table.numeric[key].dtype)
+        for key in CATEGORY_FIELDS:
+            codes = table.category_codes[key]
+            categories = table.categories[key]
+            for server in servers:
+                value = server.get(key, "")
+                if value not in codes:
+                    codes[value] = len(categories)
+                    categories.append(value)
+            table.codes[key] = np.array(
+                [codes[server.get(key, "")] for server in servers], dtype=np.int32
+            )
+        for key in OBJECT_FIELDS:
+            table.objects[key] = [server.get(key) for server in servers]
+        return table
+
+    def __len__(self) -> int:
+        return self.size
+
+    def category_code(self, key: str, value: str) -> int:
+        codes = self.category_codes[key]
+        code = codes.get(value)
+        if code is None:
+            code = len(self.categories[key])
+            codes[value] = code
+            self.categories[key].append(value)
+        return code
+
+    def get(self, index: int, key: str) -> Any:
+        if key in self.numeric:
+            return self.numeric[key][index].item()
+        if key in self.codes:
+            return self.categories[key][self.codes[key][index]]
+        return self.objects[key][index]
+
+    def set(self, index: int, key: str, value: Any):
+        if key in self.numeric:
+            self.numeric[key][index] = value
+        elif key in self.codes:
+            self.codes[key][index] = self.category_code(key, value)
+        elif key in self.objects:
+            self.objects[key][index] = value
+        else:
+            raise KeyError(key)
+
+    def row(self, index: int) -> "ServerRow":
+        return ServerRow(self, index)
+
+    def to_server(self, index: int) -> Server:
+        server: Server = {key: self.get(index, key) for key in FIELDS}  # type: ignore
+        return server
+
+    def to_servers(self, indices: np.ndarray | None = None) -> list[Server]:
+        if indices is None:
+            indices = np.arange(self.size)
+        return [self.to_server(int(index)) for index in indices]
+
+    def find(self, key: str, value: Any) -> int | None:
+        """
+        Index of the first row with `key` equal to `value`, or None.
+        """
+        matches = np.flatnonzero(self.isin(key, [value]))
+        return int(matches[0]) if len(matches) else None
+
+    def refresh_since_played(self, now: float | None = None):
+        if now is None:
+            now = time.time()
+        last_played = self.numeric["last_played"]
+        played = last_played != -1
+        self.numeric["since_played"][played] = now - last_played[played]
+
+    def isin(self, key: str, values: list[Any]) -> np.ndarray:
+        if key in self.codes:
+            codes = self.category_codes[key]
+            wanted = [codes[value] for value in values if value in codes]
+            return np.isin(self.codes[key], wanted)
+        if key in self.numeric:
+            return np.isin(self.numeric[key], values)
+        wanted_set = set(values)
+        return np.fromiter(
+            (value in wanted_set for value in self.objects[key]), bool, self.size
+        )
+
+    def filter_mask(self, server_filter: ServerFilter) -> np.ndarray:
+        """
+        Evaluate every filter over the whole table at once.
+        Same rules as filters.apply_filters, including servers never played
+        passing the since_played filter.
+        """
+        mask = np.ones(self.size, dtype=bool)
+        for key, item in server_filter.items():
+            if key not in FIELDS:
+                continue
+            if "values" in item:
+                if item["exclude"] and not item["values"]:
+                    continue
+                in_list = self.isin(key, item["values"])
+                mask &= ~in_list if item["exclude"] else in_list
+            elif "min" in item:
+                column = self.numeric[key]
+                for bound, passes in (
+                    (item["min"], np.greater_equal),
+                    (item["max"], np.less_equal),
+                ):
+                    if bound is None:
+                        continue
+                    passing = passes(column, bound)
+                    if key == "since_played":
+                        passing |= column == -1
+                    mask &= passing
+            else:
+                raise ValueError(f"Invalid filter key: {key}")
+        return mask
+
+    def apply_filters(self, server_filter: ServerFilter) -> np.ndarray:
+        """
+        Indices of the rows passing the filters, in table order.
+        """
+        return np.flatnonzero(self.filter_mask(server_filter))
+
+    def sort_key(self, key: str) -> np.ndarray:
+        """
+        A numeric column that sorts the same way as the field.
+        """
+        if key in self.numeric:
+            return self.numeric[key]
+        if key in self.codes:
+            # Rank of each category in sorted order
+            categories = np.array(self.categories[key], dtype=object)
+            ranks = np.empty(len(categories), dtype=np.int64)
+            ranks[np.argsort(categories, kind="stable")] = np.arange(len(categories))
+            return ranks[self.codes[key]]
+        if key == "game_types":
+            raise ValueError("Cannot sort by game types")
+        _, ranks = np.unique(np.array(self.objects[key], dtype=object), return_inverse=True)
+        return ranks
+
+    def sort_indices(self, indices: np.ndarray, sort_object: SortServerOptions) -> np.ndarray:
+        """
+        Sort row indices by the sort object (and its tie-breakers) with a stable sort,
+        giving the same order as server_sort.sort_servers.
+        """
+        columns: list[np.ndarray] = []
+        for sort_key in sort_keys(sort_object):
+            if sort_key["sort_by"] not in FIELDS:
+                raise ValueError("Invalid sort key")
+            column = self.sort_key(sort_key["sort_by"])[indices]
+            if sort_key["reverse"]:
+                # Negating keeps equal keys in their original order, like sort(reverse=True)
+                column = -column.astype(np.float64)
+            columns.append(column)
+        # lexsort sorts by the last column first
+        return indices[np.lexsort(columns[::-1])]
+
+
+class ServerRow(MutableMapping[str, Any]):
+    """
+    Dict-like view of one row of a ServerTable. Writes go to the table.
+    """
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table: ServerTable, index: int):
+        self.table: ServerTable = table
+        self.index: int = index
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in FIELDS:
+            raise KeyError(key)
+        return self.table.get(self.index, key)
+
+    def __setitem__(self, key: str, value: Any):
+        self.table.set(self.index, key, value)
+
+    def __delitem__(self, key: str):
+        raise TypeError("Cannot delete a field of a server table row")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(FIELDS)
+
+    def __len__(self) -> int:
+        return len(FIELDS)
+
+    def copy(self) -> Server:
+        return self.table.to_server(self.index)
@@ -0,0 +1,96 @@
+import os
+import struct
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from a2s_engine import (  # noqa: E402
+    HEADER_SPLIT,
+    SPLIT_HEADER,
+    A2SEngine,
+    ChallengeCache,
+    PendingQuery,
+)
+from benchmarks.bench_find_best import make_server  # noqa: E402
+from benchmarks.fake_a2s import start_fake_servers  # noqa: E402
+
+# The A2S engine against fake servers on localhost: challenge reuse and split packets.
+
+CHALLENGE = 0x1234ABCD
+
+
+class ChallengeCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        [(self.transport, self.fake, port)] = await start_fake_servers(
+            1, players=3, challenge=CHALLENGE
+        )
+        self.server = make_server(0, port, 3)
+        self.cache = ChallengeCache()
+        self.engine = await A2SEngine.create(self.cache)
+
+    async def asyncTearDown(self):
+        self.engine.close()
+        self.transport.close()
+
+    async def test_challenge_is_reused(self):
+        names = await self.engine.query_player_names(self.server, 2.0)
+        self.assertEqual(names, ["player0", "player1", "player2"])
+        # Sent without a challenge, then again with the one the server answered
+        self.assertEqual(self.fake.requests_received, 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+        _ = await self.engine.query_player_names(self.server, 2.0)
+        # Sent with the cached challenge right away
+        self.assertEqual(self.fake.requests_received, 3)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.round_trips_saved, 1)
+
+    async def test_rejected_challenge_is_replaced(self):
+        _ = await self.engine.query_player_names(self.server, 2.0)
+        self.fake.challenge = CHALLENGE + 1
+        names = await self.engine.query_player_names(self.server, 2.0)
+        self.assertEqual(len(names), 3)
+        self.assertEqual(self.cache.rejections, 1)
+        self.assertEqual(self.cache.round_trips_saved, 0)
+        address = (self.server["ip"], self.server["port"])
+        self.assertEqual(
+            self.cache.get(address), struct.pack("<l", CHALLENGE + 1)
+        )
+
+    async def test_expired_challenge_is_not_sent(self):
+        self.cache.ttl = 0.0
+        _ = await self.engine.query_player_names(self.server, 2.0)
+        _ = await self.engine.query_player_names(self.server, 2.0)
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(self.fake.requests_received, 4)
+
+
+class SplitPacketTest(unittest.IsolatedAsyncioTestCase):
+    async def test_split_info_response(self):
+        [(transport, _, port)] = await start_fake_servers(1, players=7, split_size=20)
+        server = make_server(0, port, 0)
+        async with await A2SEngine.create(ChallengeCache()) as engine:
+            _ = await engine.query_info_into(server, 2.0)
+        transport.close()
+        self.assertEqual(server["players"], 7)
+        self.assertEqual(server["map"], "pl_upward")
+
+    async def test_out_of_range_fragment_is_dropped(self):
+        async with await A2SEngine.create(ChallengeCache()) as engine:
+            query = PendingQuery(b"", None, False)
+            messages: list[bytes] = []
+            engine.handle_message = lambda _, __, message: messages.append(bytes(message))
+
+            def fragment(total: int, number: int, body: bytes) -> memoryview:
+                return memoryview(HEADER_SPLIT + SPLIT_HEADER.pack(1, total, number, 1248) + body)
+
+            address = ("127.0.0.1", 27015)
+            engine.handle_packet(address, query, fragment(2, 5, b"junk"))
+            engine.handle_packet(address, query, fragment(2, 0, b"ab"))
+            self.assertEqual(messages, [])
+            engine.handle_packet(address, query, fragment(2, 1, b"cd"))
+            self.assertEqual(messages, [b"abcd"])
+
+
+if __name__ == "__main__":
+    unittest.main()
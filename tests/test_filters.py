@@ -0,0 +1,90 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_server_table import make_filter, make_servers  # noqa: E402
+from filters import (  # noqa: E402
+    FilterPlan,
+    apply_filters,
+    apply_static_filters,
+    filters_changed,
+    get_default_filters,
+)
+from models import Server, ServerFilter  # noqa: E402
+
+# Compiled filter plans against a direct reading of the filters.
+
+
+def passes(server: Server, server_filter: ServerFilter) -> bool:
+    for key, item in server_filter.items():
+        value = server[key]
+        if "values" in item:
+            if item["values"] and (value in item["values"]) == item["exclude"]:
+                return False
+            continue
+        if key == "since_played" and value == -1:
+            continue
+        if item["min"] is not None and value < item["min"]:
+            return False
+        if item["max"] is not None and value > item["max"]:
+            return False
+    return True
+
+
+class FilterPlanTest(unittest.TestCase):
+    def test_matches_direct_filtering(self):
+        servers = make_servers(2000)
+        server_filter = make_filter()
+        expected = [server for server in servers if passes(server, server_filter)]
+        self.assertTrue(expected)
+        self.assertEqual(apply_filters(servers, server_filter), expected)
+        # Again, with the checks reordered by the first pass
+        self.assertEqual(apply_filters(servers, server_filter), expected)
+
+    def test_checks_ordered_by_rejection_rate(self):
+        servers = make_servers(2000)
+        plan = FilterPlan(make_filter())
+        _ = plan.apply(servers)
+        rates = [check.rejection_rate() for check in plan.checks]
+        self.assertEqual(rates, sorted(rates, reverse=True))
+
+    def test_no_op_filters_are_dropped(self):
+        server_filter = get_default_filters()
+        server_filter["ping"]["max"] = None
+        self.assertEqual(FilterPlan(server_filter).checks, [])
+
+    def test_never_played_passes_since_played(self):
+        servers = make_servers(200)
+        server_filter = get_default_filters()
+        server_filter["ping"]["max"] = None
+        server_filter["since_played"] = {"min": 3600, "max": None}
+        filtered = apply_filters(servers, server_filter)
+        self.assertTrue(any(server["since_played"] == -1 for server in filtered))
+        self.assertTrue(all(
+            server["since_played"] == -1 or server["since_played"] >= 3600
+            for server in filtered
+        ))
+
+    def test_changed_filters_rebuild_the_plan(self):
+        servers = make_servers(500)
+        server_filter = make_filter()
+        before = apply_filters(servers, server_filter)
+        server_filter["players"]["min"] = 20
+        filters_changed()
+        after = apply_filters(servers, server_filter)
+        self.assertLess(len(after), len(before))
+        self.assertEqual(after, [server for server in servers if passes(server, server_filter)])
+
+    def test_static_filters_ignore_volatile_fields(self):
+        servers = make_servers(500)
+        server_filter = make_filter()
+        static = apply_static_filters(servers, server_filter)
+        self.assertEqual(
+            static, [server for server in servers if server["region"] in ("eu", "na")]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_find_best import make_server  # noqa: E402
+from benchmarks.bench_server_table import make_servers  # noqa: E402
+from benchmarks.fake_a2s import start_fake_servers  # noqa: E402
+from filters import get_default_filters  # noqa: E402
+from models import Server, SortServerOptions  # noqa: E402
+from refresh_pipeline import find_best_server_async  # noqa: E402
+from server_sort import get_default_sort, sort_key_bound, sort_servers, top_servers  # noqa: E402
+
+# Sorting, top-k selection and the early exit of find_best_server_async,
+# the last one against fake A2S servers on localhost.
+
+
+def sort_objects() -> list[SortServerOptions]:
+    return [
+        get_default_sort(),
+        {"sort_by": "ping", "reverse": False, "then_by": []},
+        {"sort_by": "region", "reverse": True, "then_by": [{"sort_by": "players", "reverse": True}]},
+        {"sort_by": "map", "reverse": False, "then_by": [{"sort_by": "distance", "reverse": True}]},
+    ]
+
+
+class SortTest(unittest.TestCase):
+    def test_sort_matches_sorted(self):
+        servers = make_servers(500)
+        for sort_object in sort_objects():
+            expected = list(servers)
+            for key in reversed([sort_object, *sort_object["then_by"]]):
+                expected.sort(key=lambda server: server[key["sort_by"]], reverse=key["reverse"])
+            sorted_servers = list(servers)
+            sort_servers(sorted_servers, sort_object)
+            self.assertEqual(
+                [server["server_id"] for server in sorted_servers],
+                [server["server_id"] for server in expected],
+            )
+
+    def test_top_servers_is_a_prefix_of_the_sort(self):
+        servers = make_servers(500)
+        for sort_object in sort_objects():
+            sorted_servers = list(servers)
+            sort_servers(sorted_servers, sort_object)
+            for count in (1, 5, 50, 1000):
+                self.assertEqual(top_servers(servers, sort_object, count), sorted_servers[:count])
+        self.assertEqual(top_servers([], get_default_sort(), 3), [])
+        self.assertEqual(top_servers(servers, get_default_sort(), 0), [])
+
+    def test_unqueried_servers_have_no_count_bound(self):
+        server = make_server(0, 27015, 0)
+        server["max_players"] = 0
+        primary = {"sort_by": "players", "reverse": True}
+        self.assertIsNone(sort_key_bound(server, primary, get_default_filters()))
+        server["max_players"] = 24
+        self.assertEqual(sort_key_bound(server, primary, get_default_filters()), 24)
+
+
+class FindBestTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # Server health is read from and written to ./cache
+        self.directory = tempfile.TemporaryDirectory()
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory.name)
+        self.transports = []
+
+    async def asyncTearDown(self):
+        for transport in self.transports:
+            transport.close()
+        os.chdir(self.previous_directory)
+        self.directory.cleanup()
+
+    async def start(self, players: list[int], known: list[int] | None = None) -> list[Server]:
+        """
+        Fake servers with the given player counts, listed with the `known` counts.
+        """
+        servers: list[Server] = []
+        for server_id, count in enumerate(players):
+            [(transport, _, port)] = await start_fake_servers(1, players=count)
+            self.transports.append(transport)
+            servers.append(make_server(server_id, port, count if known is None else known[server_id]))
+        return servers
+
+    async def test_stops_once_the_best_is_known(self):
+        random.seed(2)
+        players = [random.randint(0, 20) for _ in range(30)] + [23]
+        servers = await self.start(players)
+        server_filter = get_default_filters()
+        server_filter["slots"] = {"min": 1, "max": None}
+        best, queried, answered = await find_best_server_async(
+            servers, server_filter, get_default_sort(), None, 4, 10.0
+        )
+        assert best is not None
+        self.assertEqual(best["players"], 23)
+        self.assertLess(len(queried), len(servers))
+        self.assertEqual(len(answered), len(queried))
+
+    async def test_finds_the_best_with_stale_counts(self):
+        players = [5, 10, 23, 12]
+        servers = await self.start(players, known=[20, 20, 0, 20])
+        # A master server entry, never queried
+        servers[2]["max_players"] = 0
+        server_filter = get_default_filters()
+        server_filter["slots"] = {"min": 1, "max": None}
+        best, _, _ = await find_best_server_async(
+            servers, server_filter, get_default_sort(), None, 1, 10.0
+        )
+        assert best is not None
+        self.assertIs(best, servers[2])
+        self.assertEqual(best["players"], 23)
+
+    async def test_no_server_passes(self):
+        servers = await self.start([24, 24])
+        server_filter = get_default_filters()
+        server_filter["slots"] = {"min": 1, "max": None}
+        best, queried, _ = await find_best_server_async(
+            servers, server_filter, get_default_sort(), None, 4, 10.0
+        )
+        self.assertIsNone(best)
+        self.assertEqual(len(queried), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import played_journal  # noqa: E402
+from benchmarks.bench_server_table import make_servers  # noqa: E402
+from played_journal import EVENT_UNDO, JOURNAL_FILE, journal_played  # noqa: E402
+from server_main import (  # noqa: E402
+    OUTDATED_VALUES,
+    SERVERS_FILE,
+    CachedServers,
+    clean_write_servers_to_file,
+    read_servers_from_file,
+    write_servers_to_file,
+)
+from server_snapshot import ServerSnapshot, read_snapshot, write_snapshot  # noqa: E402
+
+# Server snapshot and played journal, written and read back in a temporary cache.
+
+
+class CacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory.name)
+        played_journal._journal_offset = 0
+        played_journal._journal_generation = None
+
+    def tearDown(self):
+        os.chdir(self.previous_directory)
+        self.directory.cleanup()
+
+
+class SnapshotTest(CacheTestCase):
+    def test_round_trip(self):
+        servers = make_servers(50)
+        servers[3]["game_types"] = ["payload", "alltalk"]
+        servers[4]["name"] = "Ünïcode sérver"
+        os.makedirs("cache")
+        write_snapshot(SERVERS_FILE, servers)
+        self.assertEqual(read_snapshot(SERVERS_FILE), servers)
+
+    def test_lazy_access_matches_full_decode(self):
+        servers = make_servers(20)
+        os.makedirs("cache")
+        write_snapshot(SERVERS_FILE, servers)
+        with ServerSnapshot(SERVERS_FILE) as snapshot:
+            self.assertEqual(len(snapshot), 20)
+            self.assertEqual(snapshot[7], servers[7])
+            self.assertEqual(snapshot[-1], servers[-1])
+            self.assertEqual(snapshot.column("ip_port"), [s["ip_port"] for s in servers])
+
+    def test_overrides_leave_servers_unchanged(self):
+        servers = make_servers(10)
+        players = [server["players"] for server in servers]
+        clean_write_servers_to_file(servers)
+        self.assertEqual([server["players"] for server in servers], players)
+        for server in read_servers_from_file():
+            self.assertEqual(server["players"], OUTDATED_VALUES["players"])
+            self.assertEqual(server["map"], OUTDATED_VALUES["map"])
+
+
+class JournalTest(CacheTestCase):
+    def test_played_entries_are_replayed(self):
+        servers = make_servers(10)
+        write_servers_to_file(servers, dirty=False)
+        servers[2]["last_played"] = time.time() - 30
+        journal_played(servers[2])
+        read = read_servers_from_file()
+        self.assertEqual(read[2]["last_played"], servers[2]["last_played"])
+        self.assertAlmostEqual(read[2]["since_played"], 30, delta=5)
+
+    def test_undo_restores_previous_value(self):
+        servers = make_servers(10)
+        write_servers_to_file(servers, dirty=False)
+        previous = servers[5]["last_played"]
+        servers[5]["last_played"] = time.time()
+        journal_played(servers[5])
+        servers[5]["last_played"] = previous
+        journal_played(servers[5], EVENT_UNDO)
+        self.assertEqual(read_servers_from_file()[5]["last_played"], previous)
+
+    def test_full_write_compacts_the_journal(self):
+        servers = make_servers(10)
+        write_servers_to_file(servers, dirty=False)
+        servers[1]["last_played"] = time.time()
+        journal_played(servers[1])
+        self.assertTrue(os.path.exists(JOURNAL_FILE))
+        read = read_servers_from_file()
+        write_servers_to_file(read, dirty=False)
+        self.assertFalse(os.path.exists(JOURNAL_FILE))
+        self.assertEqual(read_servers_from_file()[1]["last_played"], servers[1]["last_played"])
+
+    def test_torn_entry_keeps_earlier_entries(self):
+        servers = make_servers(10)
+        write_servers_to_file(servers, dirty=False)
+        servers[0]["last_played"] = time.time()
+        journal_played(servers[0])
+        journal_played(servers[1])
+        with open(JOURNAL_FILE, "r+b") as file:
+            file.truncate(os.path.getsize(JOURNAL_FILE) - 3)
+        read = read_servers_from_file()
+        self.assertEqual(read[0]["last_played"], servers[0]["last_played"])
+
+
+class CachedServersTest(CacheTestCase):
+    def test_get_then_servers_keeps_the_same_dicts(self):
+        servers = make_servers(30)
+        write_servers_to_file(servers, dirty=False)
+        servers[12]["last_played"] = time.time() - 60
+        journal_played(servers[12])
+        cached = CachedServers()
+        self.assertEqual(len(cached), 30)
+        server = cached.get(servers[12]["ip_port"])
+        assert server is not None
+        self.assertEqual(server["last_played"], servers[12]["last_played"])
+        self.assertIsNone(cached.get("192.0.2.1:27015"))
+        read = cached.servers()
+        self.assertIs(read[12], server)
+        self.assertEqual(
+            [(s["ip_port"], s["last_played"]) for s in read],
+            [(s["ip_port"], s["last_played"]) for s in servers],
+        )
+
+    def test_missing_snapshot(self):
+        cached = CachedServers()
+        self.assertEqual(len(cached), 0)
+        self.assertEqual(cached.servers(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
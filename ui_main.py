@@ -1,12 +1,21 @@
 import time
+from collections.abc import Callable
 from typing import Any
 
-from filters import apply_filters
+from filtered_view import FilteredView
+from filters import apply_filters, filters_changed
 from models import Options, Server
-from server_main import (get_uncle, join_server, refresh_since_played_all,
-                         update_servers_with_steam_info)
+from poll_scheduler import POLL_SCHEDULER
+from presence import get_presence_tracker
+from scout_client import query_daemon
+from server_main import (
+    CachedServers,
+    find_best_server,
+    join_server,
+    refresh_since_played_all,
+)
 from server_print import pretty_print_server, print_server_grid
-from server_sort import sort_servers
+from server_sort import sort_servers, top_servers
 
 
 def play_sound():
@@ -19,9 +28,13 @@ def play_sound():
         winsound.MessageBeep(winsound.MB_ICONHAND)
 
 
-def auto_join(args: Any, servers: list[Server], options: Options) -> Server | None:
+def auto_join(
+    args: Any, cached_servers: list[Server] | CachedServers, options: Options
+) -> Server | None:
     """
     Continuously search for a server based on saved filters and join it when found.
+    With CachedServers, only the servers the daemon returns are decoded,
+    the whole list is only decoded once a local refresh needs it.
     """
     filters = options["filters"]
     server_sort = options["server_sort"]
@@ -35,25 +48,94 @@ def auto_join(args: Any, servers: list[Server], options: Options) -> Server | No
     refresh_interval: float = misc["refresh_interval"]
     if args.refresh_interval is not None:
         refresh_interval = float(args.refresh_interval)
+    POLL_SCHEDULER.configure(
+        misc["query_budget"], misc["min_poll_interval"], misc["max_poll_interval"]
+    )
+    waiting = False
+    servers: list[Server] = []
+    if isinstance(cached_servers, list):
+        servers = cached_servers
+    # Only re-tests the servers that changed since the last refresh,
+    # created on the first local refresh
+    view: FilteredView | None = None
     try:
         while not found_server:
-            if misc["query_steam"]:
-                update_servers_with_steam_info(servers, misc["steam_username"])
-            else:
-                servers, new_max_distance = get_uncle(
-                    ping_servers, calculate_max_distance
+            daemon_servers = None if args.no_daemon else query_daemon(options)
+            if daemon_servers is None and isinstance(cached_servers, CachedServers):
+                # Refreshed locally from now on, which needs every server
+                servers = cached_servers.servers()
+                cached_servers = servers
+            if daemon_servers is not None:
+                if isinstance(cached_servers, CachedServers):
+                    lookup = cached_servers.get
+                else:
+                    lookup = {server["ip_port"]: server for server in servers}.get
+                # Already filtered and sorted by the daemon
+                filtered_servers = match_local_servers(lookup, daemon_servers)
+            elif misc["query_steam"]:
+                from refresh_scheduler import REFRESH_SCHEDULER
+
+                tracker = get_presence_tracker(misc)
+                # Only the state API part of the refresh, A2S queries are done below
+                new_max_distance = REFRESH_SCHEDULER.refresh(
+                    servers, options, ping_servers, calculate_max_distance, tracker, []
                 )
+                if new_max_distance is not None:
+                    filters["distance"]["max"] = new_max_distance
+                    filters_changed()
+                refresh_since_played_all(servers)
+                poll_batch = POLL_SCHEDULER.due_servers(servers, filters)
+                filtered_servers = []
+                if poll_batch:
+                    best, queried, answered = find_best_server(
+                        poll_batch,
+                        filters,
+                        server_sort,
+                        tracker,
+                        misc["refresh_deadline"],
+                        misc["max_concurrent_queries"],
+                    )
+                    POLL_SCHEDULER.record_polled(queried, filters, answered=answered)
+                    POLL_SCHEDULER.refund(len(poll_batch) - len(queried))
+                    if best is not None:
+                        filtered_servers = [best]
+            else:
+                from refresh_scheduler import REFRESH_SCHEDULER
 
+                new_max_distance = REFRESH_SCHEDULER.refresh(
+                    servers,
+                    options,
+                    ping_servers,
+                    calculate_max_distance,
+                )
                 if new_max_distance is not None:
                     filters["distance"]["max"] = new_max_distance
+                    filters_changed()
 
-            refresh_since_played_all(servers)
-            filtered_servers = apply_filters(servers, filters)
+                refresh_since_played_all(servers)
+                if view is None:
+                    view = FilteredView(servers, filters)
+                _ = view.refresh()
+                filtered_servers = top_servers(view.filtered_servers(), server_sort, 1)
+            if args.verbose and daemon_servers is None:
+                from refresh_pipeline import refresh_counters_to_string
+
+                print(refresh_counters_to_string(get_presence_tracker(misc)))
             if not filtered_servers:
-                print("No servers found, waiting for refresh")
-                time.sleep(refresh_interval)
+                if not waiting:
+                    print("No servers found, waiting for refresh")
+                    waiting = True
+                if daemon_servers is None and misc["query_steam"]:
+                    # Sleep until the next server is due instead of a fixed interval
+                    time.sleep(
+                        min(
+                            refresh_interval,
+                            max(0.1, POLL_SCHEDULER.next_due_time() - time.monotonic()),
+                        )
+                    )
+                else:
+                    time.sleep(refresh_interval)
                 continue
-            sort_servers(filtered_servers, server_sort)
             found_server = True
             server_to_join: Server = filtered_servers[0]
             if not args.disable_join:
@@ -68,9 +150,54 @@ def auto_join(args: Any, servers: list[Server], options: Options) -> Server | No
     except KeyboardInterrupt:
         print("User interrupted search")
         return None
+    finally:
+        if view is not None:
+            view.close()
     return None
 
 
+def match_local_servers(
+    lookup: Callable[[str], Server | None], daemon_servers: list[Server]
+) -> list[Server]:
+    """
+    Replace servers returned by the daemon with the matching local servers, found by
+    ip_port with `lookup`, updated with the daemon's values, so callers keep working
+    on their own server dicts.
+    """
+    matched: list[Server] = []
+    for daemon_server in daemon_servers:
+        local_server = lookup(daemon_server["ip_port"])
+        if local_server is None:
+            matched.append(daemon_server)
+            continue
+        last_played = local_server["last_played"]
+        local_server.update(daemon_server)
+        if last_played > local_server["last_played"]:
+            local_server["last_played"] = last_played
+        matched.append(local_server)
+    return matched
+
+
+def quick_print_from_daemon(args: Any, options: Options) -> bool:
+    """
+    Print the servers that fit the filters as known by the scout daemon.
+    Returns False if the daemon is not reachable.
+    """
+    if args.no_daemon:
+        return False
+    server_list = query_daemon(options)
+    if server_list is None:
+        return False
+    if args.limit is not None:
+        # Already sorted by the daemon
+        server_list = server_list[: args.limit]
+    if server_list:
+        print_server_grid(server_list, options)
+    else:
+        print("No servers found")
+    return True
+
+
 def quick_print(
     args: Any,
     servers: list[Server],
@@ -79,24 +206,95 @@ def quick_print(
     """
     Print all servers that fit the filters and exit.
     """
+    from refresh_scheduler import REFRESH_SCHEDULER
+
     filters = options["filters"]
     server_sort = options["server_sort"]
     misc = options["misc"]
-    if misc["query_steam"]:
-        update_servers_with_steam_info(servers)
-    else:
-        ping_servers: bool = args.ping_servers or options["misc"]["always_ping"]
-        calculate_max_distance = (
-            options["misc"]["auto_distance_calculation"]
-            and filters["distance"]["max"] is None
-        )
-        servers, new_max_distance = get_uncle(
-            ping_servers, calculate_max_distance)
-        if new_max_distance is not None:
-            filters["distance"]["max"] = new_max_distance
+    ping_servers: bool = args.ping_servers or misc["always_ping"]
+    calculate_max_distance = (
+        misc["auto_distance_calculation"] and filters["distance"]["max"] is None
+    )
+    new_max_distance = REFRESH_SCHEDULER.refresh(
+        servers, options, ping_servers, calculate_max_distance
+    )
+    if new_max_distance is not None:
+        filters["distance"]["max"] = new_max_distance
+        filters_changed()
+    if args.verbose:
+        from refresh_pipeline import refresh_counters_to_string
+
+        print(refresh_counters_to_string())
     server_list = apply_filters(servers, filters)
     if server_list:
-        sort_servers(server_list, server_sort)
+        if args.limit is not None:
+            server_list = top_servers(server_list, server_sort, args.limit)
+        else:
+            sort_servers(server_list, server_sort)
         print_server_grid(server_list, options)
     else:
         print("No servers found")
+
+
+def parse_hours(hours: str) -> tuple[float, float]:
+    """
+    Parse a local time range like "18-22" or "18:30-22:00" into hours of the day.
+    """
+    bounds: list[float] = []
+    for bound in hours.split("-", 1):
+        hour, _, minute = bound.strip().partition(":")
+        bounds.append(int(hour) + int(minute or 0) / 60)
+    if len(bounds) != 2:
+        raise ValueError(f"Invalid hour range: {hours}")
+    return bounds[0], bounds[1]
+
+
+def print_history(args: Any):
+    """
+    Answer a query on the recorded server population history.
+    """
+    from server_history import busiest_servers, load_history, population_between
+
+    history = load_history(args.days)
+    if len(history) == 0:
+        print("No server history recorded yet")
+        return
+    if args.query == "humans":
+        if not args.server:
+            print("The humans query needs a server (--server)")
+            return
+        servers = history.find_servers(args.server)
+        if not servers:
+            print(f"No server matching {args.server} in the history")
+            return
+        try:
+            start_hour, end_hour = parse_hours(args.hours)
+        except ValueError as e:
+            print(f"Error parsing hours in print_history: {e}")
+            return
+        stats = population_between(history, servers, start_hour, end_hour)
+        names = ", ".join(history.servers[server][2] for server in servers)
+        print(f"Humans on {names} between {args.hours} over the last {args.days} days:")
+        if not stats["samples"]:
+            print("  No samples")
+            return
+        print(
+            f"  median {stats['median']:.1f}, mean {stats['mean']:.1f}, "
+            + f"p90 {stats['p90']:.1f}, max {stats['max']:.0f} ({stats['samples']} samples)"
+        )
+        return
+    results = busiest_servers(history)
+    if args.region:
+        results = [result for result in results if result["region"] == args.region]
+    if not results:
+        print("No server was recorded in the last minutes")
+        return
+    regions = sorted({result["region"] for result in results})
+    for region in regions:
+        print(f"{region or 'unknown region'}:")
+        for result in [r for r in results if r["region"] == region][: args.top]:
+            typical = "?" if result["typical"] is None else f"{result['typical']:.0f}"
+            print(
+                f"  {result['humans']:>3}/{result['max_players']:<3} typically {typical:>3}  "
+                + f"{result['name']} ({result['map']})"
+            )
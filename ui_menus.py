@@ -1,7 +1,7 @@
 from typing import Any
 
-from filters import apply_pre_filters
-from models import DisplayLine, Options, Server
+from filters import filters_changed
+from models import DisplayLine, Options, Server, SortServerOptions
 from options import (
     compile_display_options,
     display_lines_to_string,
@@ -9,14 +9,19 @@ from options import (
     read_options,
     write_options,
 )
+from presence import get_presence_tracker
+from scout_client import notify_daemon_played
+from server_index import ServerIndex
 from server_main import (
     format_last_played,
     get_uncle,
+    restore_last_played,
     update_cache_uncle,
     update_last_played,
     update_servers_with_steam_info,
 )
 from server_print import justify_strings, pretty_print_server
+from server_sort import sort_keys
 from ui_main import auto_join, quick_print
 
 
@@ -147,6 +152,7 @@ def filter_menu(args: Any, options: Options):
         ):
             field = filter_choices[int(choice) - 1]
             sub_filter_menu(args, options, field)
+            filters_changed()
 
 
 def new_display_line(display_line: DisplayLine | None = None) -> DisplayLine:
@@ -296,6 +302,13 @@ def display_menu(args: Any, options: Options):
             print("Invalid choice")
 
 
+def sort_to_string(sort_object: SortServerOptions) -> str:
+    return ", then ".join(
+        f"{key['sort_by']}{' (reversed)' if key['reverse'] else ''}"
+        for key in sort_keys(sort_object)
+    )
+
+
 def sort_menu(args: Any, options: Options):
     sort_choices = [x for x in Server.__annotations__.keys()]
     user_back = False
@@ -303,16 +316,26 @@ def sort_menu(args: Any, options: Options):
         print("Sort by:")
         for i, field in enumerate(sort_choices):
             print(f"  {i + 1}. {field}")
-        reversed_str = "(reversed)" if options["server_sort"]["reverse"] else ""
-        print(
-            f"Current sort: {options['server_sort']['sort_by']} {reversed_str}")
+        print(f"Current sort: {sort_to_string(options['server_sort'])}")
         choice = input(
-            "Enter choice (b for back, r to toggle reverse sorting): ")
+            "Enter choice (b for back, r to toggle reverse sorting, "
+            + "t to add a tie-breaker, c to clear tie-breakers): ")
         if choice.lower() == "b" or choice.lower() == "back":
             user_back = True
             return
         elif choice.lower() == "r":
             options["server_sort"]["reverse"] = not options["server_sort"]["reverse"]
+        elif choice.lower() == "t":
+            field = input("Enter tie-breaker number: ")
+            if field.isdigit() and 0 < int(field) <= len(sort_choices):
+                reverse = input("Reverse this tie-breaker? (y/n): ").lower() == "y"
+                options["server_sort"]["then_by"].append(
+                    {"sort_by": sort_choices[int(field) - 1], "reverse": reverse}
+                )
+            else:
+                print("Invalid choice")
+        elif choice.lower() == "c":
+            options["server_sort"]["then_by"] = []
         elif (
             choice.isdigit() and int(choice) - 1 < len(sort_choices) and int(choice) > 0
         ):
@@ -344,6 +367,10 @@ def edit_misc_menu(args: Any, options: Options):
             field = misc_choices[int(choice) - 1]
             if isinstance(misc_options[field], bool):
                 misc_options[field] = not misc_options[field]
+            elif isinstance(misc_options[field], list):
+                new_value = input(f"Enter new values for {field} (comma separated): ")
+                misc_options[field] = [
+                    x.strip() for x in new_value.split(",") if x.strip()]
             elif isinstance(misc_options[field], str):
                 new_value = input(f"Enter new value for {field}: ")
                 misc_options[field] = new_value
@@ -397,7 +424,9 @@ def main_menu(args: Any, servers: list[Server], options: Options):
     user_exit = False
     last_server_joined: Server | None = None
     last_server_joined_played: float | None = None
-    pre_filtered_servers = apply_pre_filters(servers, options["filters"])
+    # Kept up to date through refreshes, servers are looked up by ip_port in it
+    index = ServerIndex(servers)
+    pre_filtered_servers = index.apply_pre_filters(options["filters"])
     while not user_exit:
         print("Main menu:")
         print("  1. Auto join")
@@ -417,6 +446,7 @@ def main_menu(args: Any, servers: list[Server], options: Options):
                 and options["misc"]["update_last_played_on_join_new_server"]
             ):
                 update_last_played(last_server_joined)
+                notify_daemon_played(last_server_joined)
                 print("Last played server: ")
                 pretty_print_server(last_server_joined, options)
                 print()
@@ -427,14 +457,14 @@ def main_menu(args: Any, servers: list[Server], options: Options):
                 last_server_joined = last_server_joined_temp
                 last_server_joined_played = last_server_joined["last_played"]
                 update_last_played(last_server_joined)
+                notify_daemon_played(last_server_joined)
         elif choice == "2":
             # Quick print
             quick_print(args, pre_filtered_servers, options)
         elif choice == "3":
             # Edit options
             edit_option_menu(args, options)
-            pre_filtered_servers = apply_pre_filters(
-                servers, options["filters"])
+            pre_filtered_servers = index.apply_pre_filters(options["filters"])
         elif choice == "4":
             # Undo join
             if last_server_joined is None:
@@ -442,33 +472,66 @@ def main_menu(args: Any, servers: list[Server], options: Options):
             elif last_server_joined_played is None:
                 print("You have already undone the last join")
             else:
-                last_server_joined["last_played"] = last_server_joined_played
+                # The server dict may have been replaced by a refresh since the join
+                last_server_joined = (
+                    index.get("ip_port", last_server_joined["ip_port"])
+                    or last_server_joined
+                )
+                restore_last_played(last_server_joined, last_server_joined_played)
                 last_server_joined_played = None
+                notify_daemon_played(last_server_joined)
                 print(
                     f"{last_server_joined['name']} has been reset to {format_last_played(last_server_joined)}"
                 )
         elif choice == "5":
             # Update using Steam info
-            update_servers_with_steam_info(
-                pre_filtered_servers, options["misc"]["steam_username"]
+            from refresh_pipeline import refresh_counters_to_string, reset_refresh_counters
+
+            misc = options["misc"]
+            tracker = get_presence_tracker(misc)
+            reset_refresh_counters(tracker)
+            answered = update_servers_with_steam_info(
+                pre_filtered_servers,
+                tracker,
+                misc["refresh_deadline"],
+                misc["max_concurrent_queries"],
+            )
+            print(
+                f"{len(answered)}/{len(pre_filtered_servers)} servers answered, "
+                + refresh_counters_to_string(tracker)
             )
         elif choice == "6":
             # Update using Uncletopia API
+            from refresh_scheduler import merge_uncle_servers
+
             new_max_distance = None
             if options["misc"]["cache_uncletopia_state"]:
-                servers, new_max_distance = update_cache_uncle(
+                fresh, new_max_distance = update_cache_uncle(
                     options["misc"]["auto_distance_calculation"]
                 )
             else:
-                servers, new_max_distance = get_uncle(
-                    False, options["misc"]["auto_distance_calculation"]
+                fresh, new_max_distance = get_uncle(
+                    False,
+                    options["misc"]["auto_distance_calculation"],
+                    options["misc"]["refresh_deadline"],
+                    options["misc"]["max_concurrent_queries"],
+                    options["misc"]["ping_samples"],
+                    options["misc"]["ping_sample_spread"],
+                    options["misc"]["latency_cache_ttl"],
+                    options["filters"],
                 )
+            if not fresh:
+                print("Could not get the server list from the UncleTopia API")
+                continue
+            # Merged in place, so the table saved on exit and the index stay current
+            merge_uncle_servers(servers, fresh)
             if new_max_distance is not None:
                 options["filters"]["distance"]["max"] = new_max_distance
+                filters_changed()
+            pre_filtered_servers = index.apply_pre_filters(options["filters"])
         elif choice == "F":
             filter_menu(args, options)
-            pre_filtered_servers = apply_pre_filters(
-                servers, options["filters"])
+            pre_filtered_servers = index.apply_pre_filters(options["filters"])
         elif choice == "S":
             sort_menu(args, options)
         elif choice == "D":
@@ -478,3 +541,4 @@ def main_menu(args: Any, servers: list[Server], options: Options):
             break
         else:
             print("Invalid choice")
+    index.close()
@@ -0,0 +1,91 @@
+import time
+
+from models import Server
+
+# HTTP client for the UncleTopia state API.
+# One pooled session is kept for the whole process so refreshes reuse the
+# keep-alive connection instead of paying DNS, TCP and TLS setup each time.
+# Requests are conditional (ETag / If-Modified-Since): when the state has not
+# changed the server answers 304 and the previous server list is reused unparsed.
+# requests is imported with the first client, setups without the UncleTopia
+# provider never import it.
+
+UNCLETOPIA_STATE_URL = "https://uncletopia.com/api/servers/state"
+HTTP_TIMEOUT = 5.0
+
+
+class StateError(OSError):
+    """
+    An answer of the state API without a server list, handled as a failed fetch.
+    """
+
+
+class FetchStats:
+    def __init__(self):
+        self.elapsed: float = 0.0
+        # Bytes of body read from the network (compressed size)
+        self.bytes_received: int = 0
+        self.not_modified: bool = False
+
+    def to_string(self) -> str:
+        status = "not modified" if self.not_modified else "modified"
+        return f"{self.elapsed * 1000:.0f} ms, {self.bytes_received} bytes, {status}"
+
+
+class UncleClient:
+    def __init__(self, url: str = UNCLETOPIA_STATE_URL):
+        import requests
+
+        self.url: str = url
+        self.session: requests.Session = requests.Session()
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        self.etag: str | None = None
+        self.last_modified: str | None = None
+        self.servers: list[Server] | None = None
+        self.last_fetch: FetchStats = FetchStats()
+
+    def close(self):
+        self.session.close()
+
+    def fetch_servers(self) -> list[Server]:
+        """
+        Fetch the server list, reusing the previous list if the state has not changed.
+        Each call returns fresh server dicts, so callers may modify them.
+        Raises an OSError (requests' errors included) if the fetch failed.
+        """
+        headers: dict[str, str] = {}
+        if self.servers is not None:
+            if self.etag is not None:
+                headers["If-None-Match"] = self.etag
+            if self.last_modified is not None:
+                headers["If-Modified-Since"] = self.last_modified
+        stats = FetchStats()
+        start = time.perf_counter()
+        response = self.session.get(self.url, headers=headers, timeout=HTTP_TIMEOUT)
+        if response.status_code == 304 and self.servers is not None:
+            stats.not_modified = True
+        else:
+            response.raise_for_status()
+            state = response.json()
+            servers = state.get("servers") if isinstance(state, dict) else None
+            if not isinstance(servers, list):
+                raise StateError(f"No server list in the answer of {self.url}")
+            self.servers = servers
+            self.etag = response.headers.get("ETag")
+            self.last_modified = response.headers.get("Last-Modified")
+        stats.elapsed = time.perf_counter() - start
+        stats.bytes_received = response.raw.tell()
+        self.last_fetch = stats
+        assert self.servers is not None
+        # Shallow copies are enough, nested values (game_types) are never modified
+        return [server.copy() for server in self.servers]
+
+
+UNCLE_CLIENT: UncleClient | None = None
+
+
+def get_uncle_client() -> UncleClient:
+    global UNCLE_CLIENT
+    if UNCLE_CLIENT is None:
+        UNCLE_CLIENT = UncleClient()
+    return UNCLE_CLIENT
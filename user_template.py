@@ -3,30 +3,31 @@ from collections.abc import Callable
 
 # Define a type alias for the template function.
 type TemplateFunction = Callable[[dict[str, str]], str]
+# A parsed template: literal text at even positions, placeholder keys at odd positions.
+# Only strings, so parsed templates can be cached on disk.
+type TemplateParts = list[str]
 
+# Match patterns like {name} - simple non-nested placeholders.
+PLACEHOLDER_PATTERN = re.compile(r"\{([^}]+)\}")
 
-# Compile the template into a callable "render" function.
-def compile_template(template: str) -> TemplateFunction:
-    # Match patterns like {name} - simple non-nested placeholders.
-    pattern = re.compile(r"\{([^}]+)\}")
+
+# Split the template into literal text and placeholder keys.
+def parse_template(template: str) -> TemplateParts:
+    return PLACEHOLDER_PATTERN.split(template)
+
+
+# Build the "render" function of a parsed template.
+def build_template(template_parts: TemplateParts) -> TemplateFunction:
     parts: list[Callable[[dict[str, str]], str] | str] = []
-    last_index = 0
-
-    # Loop through all matches, capturing literal text and keys.
-    for match in pattern.finditer(template):
-        start, end = match.span()
-        # Append the literal part before the placeholder.
-        if start > last_index:
-            parts.append(template[last_index:start])
-        key = match.group(1)
-        # For each placeholder, append a lambda that looks up the key.
-        parts.append(lambda values, key=key: str(
-            values.get(key, f"{{{key}}}")))
-        last_index = end
-
-    # Append any remaining literal text.
-    if last_index < len(template):
-        parts.append(template[last_index:])
+    for i, part in enumerate(template_parts):
+        if i % 2 == 0:
+            # Literal text, empty between adjacent placeholders
+            if part:
+                parts.append(part)
+        else:
+            # For each placeholder, append a lambda that looks up the key.
+            parts.append(lambda values, key=part: str(
+                values.get(key, f"{{{key}}}")))
 
     # Return a render function that accepts a dictionary.
     def render(values: dict[str, str]) -> str:
@@ -34,3 +35,8 @@ def compile_template(template: str) -> TemplateFunction:
         return "".join(part(values) if callable(part) else part for part in parts)
 
     return render
+
+
+# Compile the template into a callable "render" function.
+def compile_template(template: str) -> TemplateFunction:
+    return build_template(parse_template(template))